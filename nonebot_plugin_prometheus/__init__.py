@@ -17,6 +17,7 @@ require("nonebot_plugin_alconna")
 from nonebot_plugin_alconna import Command
 
 from nonebot_plugin_prometheus import api as api
+from nonebot_plugin_prometheus import push as push
 from nonebot_plugin_prometheus.config import Config
 from nonebot_plugin_prometheus.extension import MessageReceiveCounter
 
@@ -0,0 +1,123 @@
+import heapq
+from typing import Any, Dict, List, Tuple
+
+
+class MatcherAggregate:
+    """单个匹配器的累计调用次数和耗时，按是否有异常分开记录"""
+
+    __slots__ = ("plugin_id", "matcher_name", "calls", "durations")
+
+    def __init__(self, plugin_id: str, matcher_name: str):
+        self.plugin_id = plugin_id
+        self.matcher_name = matcher_name
+        # 下标 0 为无异常，1 为有异常
+        self.calls = [0, 0]
+        self.durations = [0.0, 0.0]
+
+    @property
+    def call_count(self) -> int:
+        return self.calls[0] + self.calls[1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        call_count = self.call_count
+        total_duration = self.durations[0] + self.durations[1]
+        return {
+            "plugin_id": self.plugin_id,
+            "matcher_name": self.matcher_name,
+            "call_count": call_count,
+            "error_count": self.calls[1],
+            "total_duration": total_duration,
+            "avg_duration": total_duration / call_count if call_count > 0 else 0,
+        }
+
+
+class MatcherAggregates:
+    """
+    在 postprocessor 中增量维护的匹配器统计
+
+    查询时无需重新收集计数器和直方图，热门匹配器通过堆选出前 K 个
+    """
+
+    def __init__(self):
+        self._aggregates: Dict[Tuple[str, str], MatcherAggregate] = {}
+        self.total_calls = 0
+        self.total_errors = 0
+
+    def get(self, plugin_id: str, matcher_name: str) -> MatcherAggregate:
+        """获取匹配器的统计记录，调用方可以缓存返回值并通过 `observe` 更新"""
+        key = (plugin_id, matcher_name)
+        aggregate = self._aggregates.get(key)
+        if aggregate is None:
+            aggregate = self._aggregates[key] = MatcherAggregate(
+                plugin_id, matcher_name
+            )
+        return aggregate
+
+    def observe(
+        self, aggregate: MatcherAggregate, has_exception: bool, duration: float
+    ):
+        aggregate.calls[has_exception] += 1
+        aggregate.durations[has_exception] += duration
+        self.total_calls += 1
+        if has_exception:
+            self.total_errors += 1
+
+    def discard(self, plugin_id: str, matcher_name: str, has_exception: bool):
+        """对应的指标子序列被清理时同步移除统计"""
+        aggregate = self._aggregates.get((plugin_id, matcher_name))
+        if aggregate is None:
+            return
+        calls = aggregate.calls[has_exception]
+        self.total_calls -= calls
+        if has_exception:
+            self.total_errors -= calls
+        aggregate.calls[has_exception] = 0
+        aggregate.durations[has_exception] = 0.0
+        if aggregate.call_count == 0:
+            del self._aggregates[(plugin_id, matcher_name)]
+
+    def __len__(self) -> int:
+        return len(self._aggregates)
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        """按调用次数返回前 limit 个匹配器"""
+        return [
+            aggregate.to_dict()
+            for aggregate in heapq.nlargest(
+                limit, self._aggregates.values(), key=lambda x: x.call_count
+            )
+        ]
+
+
+class MessageTotals:
+    """
+    在计数器热路径中同步维护的消息总数，包括全局总数和按机器人分组的计数
+
+    查询时直接读取，不需要收集并累加所有 user_id 子序列。
+    计数从启动开始累计，不受过期子序列清理的影响。
+    """
+
+    def __init__(self):
+        self.total = 0
+        # (bot_id, adapter_name) -> [count]
+        self._by_bot: Dict[Tuple[str, str], List[int]] = {}
+
+    def bot_cell(self, bot_id: str, adapter_name: str) -> List[int]:
+        """获取机器人的计数单元，调用方可以缓存返回值并通过 `inc` 更新"""
+        key = (bot_id, adapter_name)
+        cell = self._by_bot.get(key)
+        if cell is None:
+            cell = self._by_bot[key] = [0]
+        return cell
+
+    def inc(self, cell: List[int]):
+        cell[0] += 1
+        self.total += 1
+
+    def by_bot(self) -> Dict[Tuple[str, str], int]:
+        return {key: cell[0] for key, cell in self._by_bot.items()}
+
+
+matcher_aggregates = MatcherAggregates()
+received_totals = MessageTotals()
+sent_totals = MessageTotals()
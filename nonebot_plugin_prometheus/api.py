@@ -1,23 +1,37 @@
+import asyncio
+
 from nonebot import get_driver
 from nonebot.drivers import URL, Request, Response, ASGIMixin, HTTPServerSetup
 from nonebot.log import logger
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.exposition import (
+    build_response,
+    get_snapshot,
+    shutdown_render_executor,
+)
+from nonebot_plugin_prometheus.listener import start_listener, stop_listener
 from nonebot_plugin_prometheus.metrics import metrics_request_counter
 
 
 async def metrics(request: Request) -> Response:
     metrics_request_counter.inc()
-    return Response(
-        200, headers={"Content-Type": CONTENT_TYPE_LATEST}, content=generate_latest()
+    headers, content = build_response(
+        await get_snapshot(
+            request.headers.get("Accept", ""), request.url.query.getall("name[]", [])
+        ),
+        request.headers.get("Accept-Encoding", ""),
     )
+    return Response(200, headers=headers, content=content)
 
 
 def enable_prometheus():
     driver = get_driver()
     if not isinstance(driver, ASGIMixin):
-        logger.warning("Prometheus 插件未找到支持 ASGI 的驱动器")
+        logger.warning(
+            "Prometheus 插件未找到支持 ASGI 的驱动器，"
+            "可以设置 PROMETHEUS_LISTEN_PORT 在独立端口上提供指标"
+        )
         return
 
     logger.debug(
@@ -38,5 +52,19 @@ driver = get_driver()
 
 @driver.on_startup
 def load():
-    if plugin_config.prometheus_enable:
+    if not plugin_config.prometheus_enable:
+        return
+    if plugin_config.prometheus_listen_port:
+        # 使用独立端口时不再挂载到驱动器上，抓取请求不与适配器共用服务器
+        start_listener(
+            plugin_config.prometheus_listen_addr, plugin_config.prometheus_listen_port
+        )
+    else:
         enable_prometheus()
+
+
+@driver.on_shutdown
+async def unload():
+    # 等待监听线程退出需要一个轮询周期，放到线程池中避免阻塞事件循环
+    await asyncio.get_running_loop().run_in_executor(None, stop_listener)
+    shutdown_render_executor()
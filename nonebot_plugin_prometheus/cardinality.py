@@ -0,0 +1,144 @@
+import zlib
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from prometheus_client import Counter
+
+OTHER_USER = "__other__"
+
+
+class SpaceSaving:
+    """
+    Space-Saving 频繁项草图（Stream-Summary 实现）
+
+    固定只跟踪 capacity 个元素，新元素在草图已满时替换当前计数最小的元素，
+    并继承其计数作为误差上界。计数、替换操作均为 O(1)。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        # item -> [count, error]
+        self._counters: Dict[Hashable, List[int]] = {}
+        # count -> 该计数下的元素
+        self._buckets: Dict[int, Set[Hashable]] = {}
+        self._min_count = 0
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._counters
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    @property
+    def min_count(self) -> int:
+        """草图已满时的最小计数，未满时为 0"""
+        return self._min_count if len(self._counters) >= self.capacity else 0
+
+    def offer(self, item: Hashable) -> Tuple[int, int, Hashable]:
+        """
+        记录一次元素出现
+
+        Returns:
+            Tuple[int, int, Hashable]: (估计计数, 误差上界, 被替换出草图的元素或 None)
+        """
+        counter = self._counters.get(item)
+        if counter is not None:
+            self._move(item, counter[0], counter[0] + 1)
+            counter[0] += 1
+            return counter[0], counter[1], None
+
+        evicted = None
+        error = 0
+        if len(self._counters) >= self.capacity:
+            error = self._min_count
+            bucket = self._buckets[error]
+            evicted = bucket.pop()
+            del self._counters[evicted]
+            if not bucket:
+                del self._buckets[error]
+                self._min_count = error + 1
+        else:
+            self._min_count = 1
+        self._counters[item] = [error + 1, error]
+        self._buckets.setdefault(error + 1, set()).add(item)
+        return error + 1, error, evicted
+
+    def _move(self, item: Hashable, old: int, new: int):
+        bucket = self._buckets[old]
+        bucket.discard(item)
+        if not bucket:
+            del self._buckets[old]
+            if old == self._min_count:
+                self._min_count = new
+        self._buckets.setdefault(new, set()).add(item)
+
+
+class UserLabelGuard:
+    """
+    user_id 标签的基数控制
+
+    支持的模式：
+        - full: 保留原始 user_id
+        - topk: 使用 Space-Saving 草图跟踪最活跃的 K 个用户，其余用户归入 `__other__`
+        - hash: 把 user_id 哈希到固定数量的桶中
+        - drop: 去掉 user_id 标签
+
+    丢失用户信息的消息计入 dropped_counter：topk 模式下归入 `__other__` 的消息，
+    hash 模式下落入已被其他用户占用的桶的消息，drop 模式下的全部消息
+    """
+
+    def __init__(
+        self,
+        metric_name: str,
+        mode: str,
+        topk: int,
+        buckets: int,
+        dropped_counter: Counter,
+    ):
+        self.metric_name = metric_name
+        self.mode = mode
+        self.buckets = max(1, buckets)
+        self.sketch = SpaceSaving(topk)
+        # 已经拥有独立序列的用户，只要仍在草图中就保持独立，避免来回切换
+        self._promoted: Set[str] = set()
+        # hash 模式下每个桶第一个出现的用户，其他用户落入该桶时才算作信息丢失
+        self._bucket_owners: Dict[int, str] = {}
+        self._dropped = dropped_counter.labels(metric_name)
+
+    @property
+    def labelnames(self) -> List[str]:
+        if self.mode == "drop":
+            return ["bot_id", "adapter_name"]
+        return ["bot_id", "adapter_name", "user_id"]
+
+    def user_label(self, user_id: str) -> Optional[str]:
+        """把原始 user_id 转换为实际使用的标签值，drop 模式下返回 None"""
+        if self.mode == "full":
+            return user_id
+        if self.mode == "topk":
+            count, error, evicted = self.sketch.offer(user_id)
+            if evicted is not None:
+                self._promoted.discard(evicted)
+            if user_id in self._promoted:
+                return user_id
+            # 保证计数（count - error）超过草图最小计数时，认为是真正的高频用户
+            if count - error > self.sketch.min_count:
+                self._promoted.add(user_id)
+                return user_id
+            self._dropped.inc()
+            return OTHER_USER
+        if self.mode == "hash":
+            bucket = zlib.crc32(user_id.encode()) % self.buckets
+            if self._bucket_owners.setdefault(bucket, user_id) != user_id:
+                self._dropped.inc()
+            return f"hash_{bucket}"
+        self._dropped.inc()
+        return None
+
+
+def label_values(
+    bot_id: str, adapter_name: str, user: Optional[str]
+) -> Tuple[str, ...]:
+    """根据 `UserLabelGuard.user_label` 的结果构造消息计数器的标签值"""
+    if user is None:
+        return bot_id, adapter_name
+    return bot_id, adapter_name, user
@@ -0,0 +1,211 @@
+from bisect import bisect_left
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from nonebot import logger
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.registry import Collector
+
+
+class CatalogEntry:
+    """指标族的元信息及其所属的 collector"""
+
+    __slots__ = ("name", "type", "help", "collector")
+
+    def __init__(self, name: str, type: str, help: str, collector: Collector):
+        self.name = name
+        self.type = type
+        self.help = help
+        self.collector = collector
+
+
+# 各类型指标族产生的样本名称后缀，与 prometheus_client 注册表的规则一致
+TYPE_SUFFIXES: Dict[str, Tuple[str, ...]] = {
+    "counter": ("_total", "_created"),
+    "summary": ("_sum", "_count", "_created"),
+    "histogram": ("_bucket", "_sum", "_count", "_created"),
+    "gaugehistogram": ("_bucket", "_gsum", "_gcount"),
+    "info": ("_info",),
+}
+
+
+def _ngrams(text: str, n: int = 3) -> Set[str]:
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+class MetricCatalog:
+    """
+    注册表中指标族的目录
+
+    维护指标名称、类型和描述，以及名称、前缀、类型和关键字（三元组）索引，
+    查询时可以先确定需要收集的 collector，而不必收集整个注册表。
+    每次查询时比较注册表中的 collector 与构建目录时是否一致，不一致时重建，
+    不需要修改注册表的 register/unregister。
+    """
+
+    NGRAM = 3
+
+    def __init__(self, registry: CollectorRegistry = REGISTRY):
+        self.registry = registry
+        self._generation = 0
+        # 构建目录时注册表中的 collector，为 None 表示需要重建
+        self._collectors: Optional[List[Collector]] = None
+        self._entries: List[CatalogEntry] = []
+        self._by_name: Dict[str, CatalogEntry] = {}
+        self._by_sample_name: Dict[str, CatalogEntry] = {}
+        self._sorted_names: List[str] = []
+        self._by_type: Dict[str, List[CatalogEntry]] = {}
+        self._ngram_index: Dict[str, Set[str]] = {}
+
+    @property
+    def generation(self) -> int:
+        """目录内容的版本号，每次重建时增加，可以作为依赖注册表内容的缓存键"""
+        self._ensure()
+        return self._generation
+
+    def invalidate(self):
+        """强制在下一次查询时重建目录"""
+        self._collectors = None
+
+    def _ensure(self):
+        with self.registry._lock:
+            collectors = list(self.registry._collector_to_names)
+        current = self._collectors
+        if (
+            current is None
+            or len(current) != len(collectors)
+            or any(a is not b for a, b in zip(current, collectors))
+        ):
+            self._rebuild(collectors)
+
+    def _rebuild(self, collectors: List[Collector]):
+        entries = []
+        for collector in collectors:
+            # 优先使用 describe，避免为了获取元信息而收集样本
+            describe = getattr(collector, "describe", None)
+            try:
+                families = list(describe()) if describe is not None else []
+                if not families:
+                    families = list(collector.collect())
+            except Exception as e:
+                logger.warning(f"获取 collector {collector} 的指标描述失败: {e}")
+                continue
+            for family in families:
+                entries.append(
+                    CatalogEntry(
+                        family.name, family.type, family.documentation, collector
+                    )
+                )
+
+        self._entries = entries
+        self._by_name = {entry.name: entry for entry in entries}
+        self._sorted_names = sorted(self._by_name)
+        self._by_sample_name = {}
+        self._by_type = {}
+        self._ngram_index = {}
+        for entry in entries:
+            for suffix in TYPE_SUFFIXES.get(entry.type, ()):
+                self._by_sample_name.setdefault(entry.name + suffix, entry)
+            self._by_type.setdefault(entry.type, []).append(entry)
+            text = f"{entry.name}\n{entry.help}\n{entry.type}".lower()
+            for gram in _ngrams(text, self.NGRAM):
+                self._ngram_index.setdefault(gram, set()).add(entry.name)
+        self._collectors = collectors
+        self._generation += 1
+        logger.debug(f"Metric catalog rebuilt with {len(entries)} families")
+
+    def entries(self) -> List[CatalogEntry]:
+        """按注册顺序返回所有指标族"""
+        self._ensure()
+        return list(self._entries)
+
+    def get(self, name: str) -> Optional[CatalogEntry]:
+        self._ensure()
+        return self._by_name.get(name)
+
+    def get_by_sample_name(self, sample_name: str) -> Optional[CatalogEntry]:
+        """根据带后缀的样本名称（如 `x_total`、`x_bucket`）查找所属的指标族"""
+        self._ensure()
+        return self._by_sample_name.get(sample_name)
+
+    def by_prefix(self, prefix: str) -> List[CatalogEntry]:
+        """返回名称以 prefix 开头的指标族"""
+        self._ensure()
+        names = self._sorted_names
+        result = []
+        for i in range(bisect_left(names, prefix), len(names)):
+            if not names[i].startswith(prefix):
+                break
+            result.append(self._by_name[names[i]])
+        return result
+
+    def by_type(self, metric_type: str) -> List[CatalogEntry]:
+        self._ensure()
+        return list(self._by_type.get(metric_type, []))
+
+    def match_name(self, metric_name: str) -> List[CatalogEntry]:
+        """
+        按名称匹配指标族
+
+        匹配规则：名称相同；指标族名称以 `metric_name_` 开头；
+        或 `metric_name` 是指标族按类型产生的样本名称（如 `x_total`、`x_bucket`）
+        """
+        self._ensure()
+        matched = {entry.name for entry in self.by_prefix(metric_name + "_")}
+        for entry in (
+            self._by_name.get(metric_name),
+            self._by_sample_name.get(metric_name),
+        ):
+            if entry is not None:
+                matched.add(entry.name)
+        return [entry for entry in self._entries if entry.name in matched]
+
+    def resolve(
+        self, metric_name: str
+    ) -> List[Tuple[CatalogEntry, Optional[FrozenSet[str]]]]:
+        """
+        把查询名称解析为需要收集的指标族及需要保留的样本名称
+
+        名称恰好是指标族名称时保留该指标族的全部样本；是带后缀的样本名称时
+        只保留该样本；否则按 `match_name` 的前缀规则匹配，保留全部样本
+
+        Returns:
+            List[Tuple[CatalogEntry, Optional[FrozenSet[str]]]]:
+                [(指标族, 样本名称集合，为 None 表示全部样本), ...]
+        """
+        self._ensure()
+        entry = self._by_name.get(metric_name)
+        if entry is not None:
+            return [(entry, None)]
+        entry = self._by_sample_name.get(metric_name)
+        if entry is not None:
+            return [(entry, frozenset((metric_name,)))]
+        return [(entry, None) for entry in self.match_name(metric_name)]
+
+    def search(self, keyword: str) -> List[CatalogEntry]:
+        """搜索名称、描述或类型中包含关键字（不区分大小写）的指标族"""
+        self._ensure()
+        keyword = keyword.lower()
+        if len(keyword) >= self.NGRAM:
+            candidates: Optional[Set[str]] = None
+            for gram in _ngrams(keyword, self.NGRAM):
+                posting = self._ngram_index.get(gram)
+                if not posting:
+                    return []
+                candidates = (
+                    set(posting) if candidates is None else candidates & posting
+                )
+            entries: Iterable[CatalogEntry] = (
+                entry for entry in self._entries if entry.name in candidates
+            )
+        else:
+            entries = self._entries
+        return [
+            entry
+            for entry in entries
+            if keyword in entry.name.lower()
+            or keyword in entry.help.lower()
+            or keyword in entry.type.lower()
+        ]
+
+
+catalog = MetricCatalog()
@@ -1,3 +1,5 @@
+from typing import Dict, List, Literal
+
 from nonebot import get_plugin_config
 from pydantic import BaseModel
 
@@ -5,7 +7,101 @@ from pydantic import BaseModel
 class Config(BaseModel):
     prometheus_enable: bool = True
     prometheus_metrics_path: str = "/metrics"
+    # 在独立端口上提供 /metrics，不依赖 ASGI 驱动器，0 表示挂载到驱动器上
+    prometheus_listen_port: int = 0
+    # 独立监听的地址
+    prometheus_listen_addr: str = "0.0.0.0"
+    # 独立监听上 keep-alive 连接的空闲超时（秒）
+    prometheus_listen_keepalive_timeout: float = 60.0
     prometheus_chat_needs_admin: bool = True
+    # /metrics 渲染结果的缓存时间（秒），0 表示不缓存，仅合并并发请求
+    prometheus_cache_ttl: float = 0.0
+    # 是否在独立线程池中渲染 /metrics，避免阻塞事件循环
+    prometheus_render_in_thread: bool = False
+    # 渲染线程池的最大线程数，即同时进行的渲染数上限
+    prometheus_render_workers: int = 1
+    # 客户端支持时是否使用 gzip 压缩 /metrics 响应
+    prometheus_gzip_enable: bool = True
+    # gzip 压缩等级（1-9）
+    prometheus_gzip_level: int = 6
+    # 响应体小于该字节数时不压缩
+    prometheus_gzip_min_size: int = 1024
+    # 是否关闭 Counter、Histogram、Summary 的 _created 样本
+    prometheus_disable_created_metrics: bool = False
+    # 消息计数器 user_id 标签的基数控制模式：full / topk / hash / drop
+    prometheus_user_label_mode: Literal["full", "topk", "hash", "drop"] = "full"
+    # topk 模式下保留独立序列的用户数量
+    prometheus_user_label_topk: int = 1000
+    # hash 模式下的桶数量
+    prometheus_user_label_buckets: int = 64
+    # 带标签指标子序列的默认空闲 TTL（秒），超过该时间未更新的子序列会被移除，0 表示不清理
+    prometheus_series_default_ttl: float = 0.0
+    # 按指标名称单独配置的空闲 TTL（秒）
+    prometheus_series_ttl: Dict[str, float] = {}
+    # 过期子序列的清理间隔（秒），同时也是最后访问时间的记录精度
+    prometheus_sweep_interval: float = 60.0
+    # 消息计数热路径上按 (bot, user) 缓存的已解析子序列数量
+    prometheus_child_cache_size: int = 4096
+    # 按适配器名称配置的发送消息 API 名称列表（精确匹配），未配置的适配器使用内置规则
+    prometheus_send_msg_apis: Dict[str, List[str]] = {}
+
+    # 进程内指标历史的采样间隔（秒），用于聊天查询中的速率统计，0 表示关闭
+    prometheus_history_resolution: float = 15.0
+    # 指标历史的保留时长（秒）
+    prometheus_history_retention: float = 3600.0
+    # 记录历史的指标族及保留的标签，其余标签求和合并（计数器类先按原始序列计算增量），空列表表示保留全部标签
+    prometheus_history_metrics: Dict[str, List[str]] = {
+        "nonebot_received_messages": ["bot_id", "adapter_name"],
+        "nonebot_sent_messages": ["bot_id", "adapter_name"],
+        "nonebot_matcher_calling": ["plugin_id", "matcher_name", "exception"],
+        "nonebot_matcher_duration_seconds": ["le"],
+    }
+
+    # 嵌入式降采样指标存储的目录，用于 `/metrics range` 查询，为空表示关闭；需要开启指标历史
+    prometheus_store_path: str = ""
+    # 降采样层级，[[分辨率（秒）, 保留时长（秒）], ...]
+    prometheus_store_tiers: List[List[float]] = [
+        [10, 86400],
+        [60, 604800],
+        [3600, 7776000],
+    ]
+    # 每个层级文件的最大字节数
+    prometheus_store_max_bytes: int = 16 * 1024 * 1024
+
+    # 聊天查询结果每条消息的最大字符数，超过后分页发送
+    prometheus_chat_page_size: int = 3000
+    # 分页结果的保留时间（秒），超时后无法继续翻页
+    prometheus_chat_page_ttl: float = 300.0
+
+    # 聊天查询结果的缓存时间（秒），相同的查询在该时间内直接使用缓存，0 表示不缓存，仅合并同时到达的请求
+    prometheus_chat_cache_ttl: float = 5.0
+
+    # 多进程模式（设置了 PROMETHEUS_MULTIPROC_DIR 环境变量）下清理已退出 worker 指标文件的间隔（秒），
+    # 0 表示不清理；依赖 PID 判断进程是否存活，只适用于所有 worker 在同一台机器、同一 PID 命名空间中的部署
+    prometheus_multiproc_cleanup_interval: float = 60.0
+
+    # Pushgateway 地址，例如 http://pushgateway:9091，为空表示不推送
+    prometheus_push_url: str = ""
+    # 推送使用的 job 名称
+    prometheus_push_job: str = "nonebot"
+    # 额外的分组标签，例如 {"instance": "bot-1"}，多个实例推送到同一 Pushgateway 时需要区分
+    prometheus_push_grouping_key: Dict[str, str] = {}
+    # 推送间隔（秒）
+    prometheus_push_interval: float = 15.0
+    # 全量推送间隔（秒），期间只推送有变化的指标族，0 表示每次都全量推送
+    prometheus_push_full_interval: float = 300.0
+    # 每个推送请求的最大字节数（压缩前），超过后拆分为多个请求
+    prometheus_push_batch_bytes: int = 512 * 1024
+    # 推送请求的超时时间（秒）
+    prometheus_push_timeout: float = 10.0
+    # 推送失败后的重试次数
+    prometheus_push_retries: int = 3
+    # 第一次重试前的等待时间（秒），之后每次翻倍，最长不超过推送间隔
+    prometheus_push_backoff: float = 1.0
+    # 是否使用 gzip 压缩推送请求体，压缩等级使用 prometheus_gzip_level
+    prometheus_push_gzip: bool = True
+    # 推送请求的额外请求头，例如 {"Authorization": "Basic ..."}
+    prometheus_push_headers: Dict[str, str] = {}
 
 
 plugin_config = get_plugin_config(Config)
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from nonebot import get_driver, logger
+from prometheus_client import Counter
+from prometheus_client.metrics import MetricWrapperBase
+
+from nonebot_plugin_prometheus.config import plugin_config
+
+LabelValues = Tuple[str, ...]
+
+# 粗粒度时钟，由清理任务按清理间隔推进，热路径上只需读取一个全局变量
+_clock: float = time.monotonic()
+
+
+class StaleSeriesTracker:
+    """记录带标签指标子序列的最后访问时间，并移除超过 TTL 未访问的子序列"""
+
+    def __init__(
+        self,
+        name: str,
+        family: MetricWrapperBase,
+        ttl: float,
+        evicted_counter: Counter,
+    ):
+        self.name = name
+        self.family = family
+        self.ttl = ttl
+        self._evicted = evicted_counter.labels(name)
+        self._last_touch: Dict[LabelValues, float] = {}
+        self._listeners: List[Callable[[LabelValues], None]] = []
+
+    def touch(self, labelvalues: LabelValues):
+        """记录子序列被访问，labelvalues 需与 `.labels()` 的参数一致（字符串）"""
+        if self.ttl > 0:
+            self._last_touch[labelvalues] = _clock
+
+    def pin(self, labelvalues: LabelValues):
+        """子序列不再参与清理，直到下一次 touch"""
+        self._last_touch.pop(labelvalues, None)
+
+    def on_evict(self, listener: Callable[[LabelValues], None]):
+        """注册子序列被移除时的回调，用于清理持有子序列引用的缓存"""
+        self._listeners.append(listener)
+
+    def sweep(self, now: float) -> int:
+        """移除超过 TTL 未访问的子序列，返回移除的数量"""
+        if self.ttl <= 0:
+            return 0
+        expired = [k for k, t in self._last_touch.items() if now - t > self.ttl]
+        for labelvalues in expired:
+            del self._last_touch[labelvalues]
+            try:
+                self.family.remove(*labelvalues)
+            except KeyError:
+                pass
+            for listener in self._listeners:
+                listener(labelvalues)
+        if expired:
+            self._evicted.inc(len(expired))
+        return len(expired)
+
+
+trackers: Dict[str, StaleSeriesTracker] = {}
+_sweep_task: Optional["asyncio.Task[None]"] = None
+
+
+def track(
+    name: str, family: MetricWrapperBase, evicted_counter: Counter
+) -> StaleSeriesTracker:
+    """
+    为指标族创建子序列清理器
+
+    TTL 优先使用 `PROMETHEUS_SERIES_TTL` 中按指标名称配置的值，
+    否则使用 `PROMETHEUS_SERIES_DEFAULT_TTL`，为 0 时不清理
+    """
+    ttl = plugin_config.prometheus_series_ttl.get(
+        name, plugin_config.prometheus_series_default_ttl
+    )
+    tracker = StaleSeriesTracker(name, family, ttl, evicted_counter)
+    trackers[name] = tracker
+    return tracker
+
+
+def sweep_stale_series() -> int:
+    """推进时钟并清理所有指标族中的过期子序列"""
+    global _clock
+    _clock = now = time.monotonic()
+    total = 0
+    for tracker in trackers.values():
+        total += tracker.sweep(now)
+    if total:
+        logger.debug(f"Evicted {total} stale series")
+    return total
+
+
+async def _sweep_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            sweep_stale_series()
+        except Exception as e:
+            logger.error(f"清理过期指标序列失败: {e}")
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def start_sweeper():
+    global _sweep_task
+    if not any(tracker.ttl > 0 for tracker in trackers.values()):
+        return
+    _sweep_task = asyncio.create_task(
+        _sweep_loop(plugin_config.prometheus_sweep_interval)
+    )
+
+
+@driver.on_shutdown
+async def stop_sweeper():
+    global _sweep_task
+    if _sweep_task is not None:
+        _sweep_task.cancel()
+        _sweep_task = None
@@ -0,0 +1,210 @@
+import asyncio
+import gzip
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from prometheus_client import REGISTRY
+from prometheus_client.exposition import choose_encoder, gzip_accepted
+from prometheus_client.metrics_core import Metric
+from prometheus_client.registry import Collector
+
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.metrics import (
+    metrics_cache_hits_counter,
+    metrics_cache_misses_counter,
+    metrics_render_histogram,
+)
+from nonebot_plugin_prometheus.multiprocess import get_exposition_registry
+from nonebot_plugin_prometheus.utils import SingleFlightCache
+
+
+class Snapshot:
+    """一次渲染得到的指标快照，压缩结果与原文一同缓存"""
+
+    __slots__ = ("content", "content_type", "gzip_content")
+
+    def __init__(
+        self, content: bytes, content_type: str, gzip_content: Optional[bytes] = None
+    ):
+        self.content = content
+        self.content_type = content_type
+        self.gzip_content = gzip_content
+
+
+snapshot_cache: SingleFlightCache[Snapshot] = SingleFlightCache(
+    plugin_config.prometheus_cache_ttl
+)
+
+_render_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_render_executor() -> ThreadPoolExecutor:
+    """获取渲染线程池，线程数限制了同时进行的渲染数量"""
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(
+            max_workers=max(1, plugin_config.prometheus_render_workers),
+            thread_name_prefix="prometheus-render",
+        )
+    return _render_executor
+
+
+def shutdown_render_executor():
+    global _render_executor
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=False)
+        _render_executor = None
+
+
+Encoder = Callable[[Collector], bytes]
+
+SAMPLE_SUFFIXES = (
+    "_total",
+    "_created",
+    "_sum",
+    "_count",
+    "_bucket",
+    "_gsum",
+    "_gcount",
+    "_info",
+)
+
+
+def expand_names(names: Iterable[str]) -> FrozenSet[str]:
+    """
+    把 name[] 查询参数展开为样本名称集合
+
+    restricted_registry 按样本名称过滤，这里为每个名称补上各类型的样本后缀，
+    使得直接传入指标族名称（如 nonebot_matcher_duration_seconds）也能匹配其全部样本
+    """
+    expanded = set()
+    for name in names:
+        expanded.add(name)
+        expanded.update(name + suffix for suffix in SAMPLE_SUFFIXES)
+    return frozenset(expanded)
+
+
+class SampleNameFilter:
+    """
+    收集后按样本名称过滤的注册表包装
+
+    多进程模式的注册表中只有一个没有 describe 的 MultiProcessCollector，
+    restricted_registry 无法按名称找到 collector，只能在收集合并后过滤样本
+    """
+
+    def __init__(self, registry: Collector, names: FrozenSet[str]):
+        self.registry = registry
+        self.names = names
+
+    def collect(self) -> Iterable[Metric]:
+        for metric in self.registry.collect():
+            samples = [sample for sample in metric.samples if sample.name in self.names]
+            if samples:
+                filtered = Metric(
+                    metric.name, metric.documentation, metric.type, metric.unit
+                )
+                filtered.samples = samples
+                yield filtered
+
+
+def render_snapshot(
+    encoder: Encoder, content_type: str, names: Optional[FrozenSet[str]] = None
+) -> Snapshot:
+    """
+    使用指定的编码器渲染指标
+
+    Args:
+        encoder: 编码器
+        content_type: 编码器对应的 Content-Type
+        names: 需要渲染的样本名称，为空时渲染全部指标；否则默认注册表只收集匹配的 collector，
+            多进程模式下在汇总后过滤样本
+    """
+    start = time.perf_counter()
+    registry: Collector = get_exposition_registry()
+    if names:
+        if registry is REGISTRY:
+            registry = REGISTRY.restricted_registry(names)
+        else:
+            registry = SampleNameFilter(registry, names)
+    content = encoder(registry)
+    gzip_content = None
+    if (
+        plugin_config.prometheus_gzip_enable
+        and len(content) >= plugin_config.prometheus_gzip_min_size
+    ):
+        gzip_content = gzip.compress(
+            content, compresslevel=plugin_config.prometheus_gzip_level, mtime=0
+        )
+    metrics_render_histogram.observe(time.perf_counter() - start)
+    return Snapshot(content, content_type, gzip_content)
+
+
+def _acquire_snapshot(
+    accept: str, names: Iterable[str]
+) -> Tuple["Future[Snapshot]", Optional[Callable[[], None]]]:
+    """
+    获取快照对应的 Future
+
+    Returns:
+        Tuple[Future, Optional[Callable]]: (快照 Future, 需要由调用方执行的渲染函数，
+            缓存命中或已有进行中的渲染时为 None)
+    """
+    encoder, content_type = choose_encoder(accept)
+    sample_names = expand_names(names) if names else None
+    # 不同的 Accept 头可能协商出同一种格式，以协商结果作为缓存 key
+    key = (content_type, sample_names)
+    future, owner = snapshot_cache.acquire(key)
+    if not owner:
+        metrics_cache_hits_counter.inc()
+        return future, None
+    metrics_cache_misses_counter.inc()
+    render = partial(render_snapshot, encoder, content_type, sample_names)
+    return future, partial(snapshot_cache.fulfill, key, future, render)
+
+
+async def get_snapshot(accept: str = "", names: Iterable[str] = ()) -> Snapshot:
+    """
+    获取指标快照，缓存有效时直接复用，并发请求共享同一次渲染
+
+    在事件循环中渲染时，只有渲染开始前已经到达的请求能共享结果；
+    开启 PROMETHEUS_RENDER_IN_THREAD 后，渲染期间到达的请求也会共享同一次渲染
+
+    Args:
+        accept: 请求的 Accept 头，请求 OpenMetrics 时返回 OpenMetrics 文本格式，
+            其余情况（包括 protobuf，prometheus_client 不支持该格式）返回经典文本格式
+        names: name[] 查询参数，只渲染指定名称的指标
+    """
+    future, fulfill = _acquire_snapshot(accept, names)
+    if fulfill is not None:
+        if plugin_config.prometheus_render_in_thread:
+            # 渲染是 CPU 密集的同步操作，放到线程池中避免阻塞事件循环
+            get_render_executor().submit(fulfill)
+        else:
+            # 在事件循环中同步渲染时，把渲染排到当前已就绪的回调之后，
+            # 使同一轮到达的其他抓取请求能先加入同一个 Future，而不是各自触发一次渲染；
+            # 渲染作为独立回调执行，即使当前请求被取消也会完成
+            asyncio.get_running_loop().call_soon(fulfill)
+    return await asyncio.wrap_future(future)
+
+
+def get_snapshot_sync(accept: str = "", names: Iterable[str] = ()) -> Snapshot:
+    """与 `get_snapshot` 相同，但在调用线程中渲染并阻塞等待，供独立监听线程使用"""
+    future, fulfill = _acquire_snapshot(accept, names)
+    if fulfill is not None:
+        fulfill()
+    return future.result()
+
+
+def build_response(
+    snapshot: Snapshot, accept_encoding: str = ""
+) -> Tuple[Dict[str, str], bytes]:
+    """根据快照和 Accept-Encoding 请求头构造响应头和响应体"""
+    headers = {"Content-Type": snapshot.content_type}
+    if plugin_config.prometheus_gzip_enable:
+        headers["Vary"] = "Accept-Encoding"
+    if snapshot.gzip_content is not None and gzip_accepted(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        return headers, snapshot.gzip_content
+    return headers, snapshot.content
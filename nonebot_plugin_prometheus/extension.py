@@ -1,9 +1,11 @@
-from nonebot import logger
 from nonebot.adapters import Bot, Event
 from nonebot_plugin_alconna import Alconna, Extension, UniMessage
 
+from nonebot_plugin_prometheus.aggregates import received_totals
 from nonebot_plugin_prometheus.metrics import (
-    received_messages_counter,
+    received_message_child,
+    received_messages_tracker,
+    received_user_guard,
 )
 
 
@@ -19,8 +21,12 @@ class MessageReceiveCounter(Extension):
     async def receive_wrapper(
         self, bot: Bot, event: Event, command: Alconna, receive: UniMessage
     ) -> UniMessage:
-        logger.trace(f"Bot {bot.adapter.get_name()} {bot.self_id} received msg")
-        received_messages_counter.labels(
-            bot.self_id, bot.adapter.get_name(), event.get_user_id()
-        ).inc()
+        labelvalues, child, bot_cell = received_message_child(
+            bot.adapter.get_name(),
+            bot.self_id,
+            received_user_guard.user_label(event.get_user_id()),
+        )
+        child.inc()
+        received_totals.inc(bot_cell)
+        received_messages_tracker.touch(labelvalues)
         return receive
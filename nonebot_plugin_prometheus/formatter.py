@@ -1,64 +1,151 @@
-from typing import Any, Dict, List
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
 
 from nonebot_plugin_prometheus.query import format_large_number
 
+# 格式化器以生成器的形式逐行产生文本，由分页器按需取用：
+# 只有实际发送的页面会被格式化，拼接整段文本也只需一次 join。
+# 对应的 format_* 函数返回完整文本，保持原有接口不变
 
-def format_bot_status(status_data: Dict[str, Any]) -> str:
+
+def iter_bot_status(status_data: Dict[str, Any]) -> Iterator[str]:
     """格式化机器人状态信息"""
     if "error" in status_data:
-        return f"❌ 获取机器人状态失败: {status_data['error']}"
+        yield f"❌ 获取机器人状态失败: {status_data['error']}"
+        return
 
     if status_data["total_bots"] == 0:
-        return "🤖 当前没有在线的机器人"
+        yield "🤖 当前没有在线的机器人"
+        return
 
-    result = f"🤖 机器人状态 ({status_data['total_bots']} 台在线)\n"
-    result += "=" * 40 + "\n"
+    yield f"🤖 机器人状态 ({status_data['total_bots']} 台在线)\n"
+    yield "=" * 40 + "\n"
 
     for bot in status_data["bots"]:
         status_emoji = "✅" if bot["status"] == "online" else "❌"
-        result += f"{status_emoji} {bot['bot_id']} ({bot['adapter']})\n"
-        result += f"   掉线次数: {bot['shutdown_count']}\n"
-
-    return result
+        yield f"{status_emoji} {bot['bot_id']} ({bot['adapter']})\n"
+        yield f"   掉线次数: {bot['shutdown_count']}\n"
 
 
-def format_message_stats(message_data: Dict[str, Any]) -> str:
+def iter_message_stats(message_data: Dict[str, Any]) -> Iterator[str]:
     """格式化消息统计信息"""
     if "error" in message_data:
-        return f"❌ 获取消息统计失败: {message_data['error']}"
+        yield f"❌ 获取消息统计失败: {message_data['error']}"
+        return
 
-    result = "📊 消息统计\n"
-    result += "=" * 40 + "\n"
-    result += f"📥 接收消息: {format_large_number(message_data['total_received'])} 条\n"
-    result += f"📤 发送消息: {format_large_number(message_data['total_sent'])} 条\n"
+    yield "📊 消息统计\n"
+    yield "=" * 40 + "\n"
+    yield f"📥 接收消息: {format_large_number(message_data['total_received'])} 条\n"
+    yield f"📤 发送消息: {format_large_number(message_data['total_sent'])} 条\n"
     total_messages = message_data["total_received"] + message_data["total_sent"]
-    result += f"📈 总计消息: {format_large_number(total_messages)} 条\n"
+    yield f"📈 总计消息: {format_large_number(total_messages)} 条\n"
 
     if message_data["received_by_bot"]:
-        result += "\n📥 各机器人接收消息:\n"
+        yield "\n📥 各机器人接收消息:\n"
         for bot_key, bot_info in message_data["received_by_bot"].items():
-            result += f"   {bot_key}: {format_large_number(bot_info['count'])} 条\n"
+            yield f"   {bot_key}: {format_large_number(bot_info['count'])} 条\n"
 
     if message_data["sent_by_bot"]:
-        result += "\n📤 各机器人发送消息:\n"
+        yield "\n📤 各机器人发送消息:\n"
         for bot_key, bot_info in message_data["sent_by_bot"].items():
-            result += f"   {bot_key}: {format_large_number(bot_info['count'])} 条\n"
-
-    return result
-
-
-def format_matcher_stats(matcher_data: Dict[str, Any]) -> str:
+            yield f"   {bot_key}: {format_large_number(bot_info['count'])} 条\n"
+
+
+def format_window(seconds: float) -> str:
+    """把时间窗口格式化为 `5m`、`1h` 等形式"""
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{seconds:g}s"
+
+
+def iter_message_rates(rate_data: Dict[str, Any]) -> Iterator[str]:
+    """格式化时间窗口内的消息统计"""
+    if "error" in rate_data:
+        yield f"❌ 获取消息速率失败: {rate_data['error']}"
+        return
+
+    yield f"📊 最近 {format_window(rate_data['window'])} 消息统计\n"
+    yield "=" * 40 + "\n"
+    yield f"📥 接收消息: {format_large_number(rate_data['total_received'])} 条 ({rate_data['received_per_minute']:.1f} 条/分钟)\n"
+    yield f"📤 发送消息: {format_large_number(rate_data['total_sent'])} 条 ({rate_data['sent_per_minute']:.1f} 条/分钟)\n"
+
+    if rate_data["received_by_bot"]:
+        yield "\n📥 各机器人接收消息:\n"
+        for bot_key, bot_info in rate_data["received_by_bot"].items():
+            yield f"   {bot_key}: {format_large_number(bot_info['count'])} 条\n"
+
+    if rate_data["sent_by_bot"]:
+        yield "\n📤 各机器人发送消息:\n"
+        for bot_key, bot_info in rate_data["sent_by_bot"].items():
+            yield f"   {bot_key}: {format_large_number(bot_info['count'])} 条\n"
+
+
+def iter_matcher_rates(rate_data: Dict[str, Any]) -> Iterator[str]:
+    """格式化时间窗口内的匹配器统计"""
+    if "error" in rate_data:
+        yield f"❌ 获取匹配器速率失败: {rate_data['error']}"
+        return
+
+    yield f"🔍 最近 {format_window(rate_data['window'])} 匹配器统计\n"
+    yield "=" * 40 + "\n"
+    yield f"📞 调用次数: {format_large_number(rate_data['total_calls'])}\n"
+    yield f"❌ 错误次数: {format_large_number(rate_data['total_errors'])}\n"
+    for quantile in ("p50", "p95", "p99"):
+        if not math.isnan(rate_data[quantile]):
+            yield f"⏱️ 耗时 {quantile}: {rate_data[quantile]:.3f}s\n"
+
+    if rate_data["top_matchers"]:
+        yield f"\n🏆 热门匹配器 (前 {len(rate_data['top_matchers'])} 个):\n"
+        for i, matcher in enumerate(rate_data["top_matchers"], 1):
+            yield f"\n{i}. {matcher['matcher_name']}\n"
+            yield f"   插件: {matcher['plugin_id']}\n"
+            yield f"   调用次数: {format_large_number(matcher['call_count'])}\n"
+            yield f"   错误次数: {format_large_number(matcher['error_count'])}\n"
+
+
+def iter_metric_range(range_data: Dict[str, Any]) -> Iterator[str]:
+    """格式化指标在时间窗口内的变化"""
+    if "error" in range_data:
+        yield f"❌ 查询指标历史失败: {range_data['error']}"
+        return
+
+    if range_data["series_count"] == 0:
+        yield f"❌ 存储中没有指标 {range_data['name']} 的数据"
+        return
+
+    kind = "增量" if range_data["kind"] == "increase" else "值"
+    yield f"📈 {range_data['name']} 最近 {format_window(range_data['window'])}\n"
+    yield "=" * 40 + "\n"
+    yield f"🔢 每 {format_window(range_data['step'])} 的{kind} (存储精度 {format_window(range_data['resolution'])})\n\n"
+
+    values = [value for _, value in range_data["rows"] if value is not None]
+    peak = max(values, default=0)
+    time_format = "%m-%d %H:%M" if range_data["window"] > 86400 else "%H:%M"
+    for timestamp, value in range_data["rows"]:
+        label = datetime.fromtimestamp(timestamp).strftime(time_format)
+        if value is None:
+            yield f"{label}  -\n"
+            continue
+        bar = "█" * round(value / peak * 10) if peak > 0 else ""
+        yield f"{label}  {bar} {format_large_number(value)}\n"
+
+
+def iter_matcher_stats(matcher_data: Dict[str, Any]) -> Iterator[str]:
     """格式化匹配器统计信息"""
     if "error" in matcher_data:
-        return f"❌ 获取匹配器统计失败: {matcher_data['error']}"
+        yield f"❌ 获取匹配器统计失败: {matcher_data['error']}"
+        return
 
     if matcher_data["total_matchers"] == 0:
-        return "🔍 暂无匹配器统计数据"
+        yield "🔍 暂无匹配器统计数据"
+        return
 
-    result = f"🔍 匹配器统计 (共 {matcher_data['total_matchers']} 个匹配器)\n"
-    result += "=" * 40 + "\n"
-    result += f"📞 总调用次数: {format_large_number(matcher_data['total_calls'])}\n"
-    result += f"❌ 错误次数: {format_large_number(matcher_data['total_errors'])}\n"
+    yield f"🔍 匹配器统计 (共 {matcher_data['total_matchers']} 个匹配器)\n"
+    yield "=" * 40 + "\n"
+    yield f"📞 总调用次数: {format_large_number(matcher_data['total_calls'])}\n"
+    yield f"❌ 错误次数: {format_large_number(matcher_data['total_errors'])}\n"
     success_rate = (
         (
             (matcher_data["total_calls"] - matcher_data["total_errors"])
@@ -68,10 +155,10 @@ def format_matcher_stats(matcher_data: Dict[str, Any]) -> str:
         if matcher_data["total_calls"] > 0
         else 0
     )
-    result += f"✅ 成功率: {success_rate:.1f}%\n"
+    yield f"✅ 成功率: {success_rate:.1f}%\n"
 
     if matcher_data["top_matchers"]:
-        result += f"\n🏆 热门匹配器 (前 {len(matcher_data['top_matchers'])} 个):\n"
+        yield f"\n🏆 热门匹配器 (前 {len(matcher_data['top_matchers'])} 个):\n"
         for i, matcher in enumerate(matcher_data["top_matchers"], 1):
             error_rate = (
                 (matcher["error_count"] / matcher["call_count"] * 100)
@@ -80,84 +167,87 @@ def format_matcher_stats(matcher_data: Dict[str, Any]) -> str:
             )
             avg_time = matcher.get("avg_duration", 0)
 
-            result += f"\n{i}. {matcher['matcher_name']}\n"
-            result += f"   插件: {matcher['plugin_id']}\n"
-            result += f"   调用次数: {format_large_number(matcher['call_count'])}\n"
-            result += f"   错误率: {error_rate:.1f}%\n"
+            yield f"\n{i}. {matcher['matcher_name']}\n"
+            yield f"   插件: {matcher['plugin_id']}\n"
+            yield f"   调用次数: {format_large_number(matcher['call_count'])}\n"
+            yield f"   错误率: {error_rate:.1f}%\n"
             if avg_time > 0:
-                result += f"   平均耗时: {avg_time:.3f}s\n"
-
-    return result
+                yield f"   平均耗时: {avg_time:.3f}s\n"
 
 
-def format_system_metrics(system_data: Dict[str, Any]) -> str:
+def iter_system_metrics(system_data: Dict[str, Any]) -> Iterator[str]:
     """格式化系统指标"""
     if "error" in system_data:
-        return f"❌ 获取系统指标失败: {system_data['error']}"
-
-    result = "⚙️ 系统指标\n"
-    result += "=" * 40 + "\n"
-    result += f"⏱️ 运行时间: {system_data['uptime']}\n"
-    result += f"🚀 启动时间: {system_data['start_time']}\n"
-    result += f"📊 指标请求次数: {system_data['metrics_requests']}\n"
+        yield f"❌ 获取系统指标失败: {system_data['error']}"
+        return
 
-    return result
+    yield "⚙️ 系统指标\n"
+    yield "=" * 40 + "\n"
+    yield f"⏱️ 运行时间: {system_data['uptime']}\n"
+    yield f"🚀 启动时间: {system_data['start_time']}\n"
+    yield f"📊 指标请求次数: {system_data['metrics_requests']}\n"
 
 
-def format_help() -> str:
+def iter_help() -> Iterator[str]:
     """格式化帮助信息"""
-    result = "📋 Prometheus 监控查询帮助\n"
-    result += "=" * 50 + "\n\n"
-
-    result += "🔧 可用命令:\n"
-    result += "• metrics              - 显示系统概览\n"
-    result += "• metrics status       - 机器人状态\n"
-    result += "• metrics messages     - 消息统计\n"
-    result += "• metrics matchers     - 匹配器统计\n"
-    result += "• metrics system       - 系统指标\n"
-    result += "• metrics uptime       - 运行时间\n"
-    result += "• metrics query <name> - 查询指定指标\n"
-    result += "• metrics list         - 列出所有指标\n"
-    result += "• metrics search <key> - 搜索指标\n"
-    result += "• metrics help         - 显示此帮助\n\n"
-
-    result += "💡 使用示例:\n"
-    result += "• /metrics\n"
-    result += "• /metrics messages\n"
-    result += "• /metrics matchers\n"
-    result += "• /metrics query nonebot_received_messages\n"
-    result += '• /metrics query nonebot_received_messages{method="GET"}\n'
-    result += "• /metrics list\n"
-    result += "• /metrics search matcher\n\n"
-
-    result += "📊 支持的指标:\n"
-    result += "• 机器人在线状态和连接数\n"
-    result += "• 消息收发统计\n"
-    result += "• 匹配器执行次数和耗时\n"
-    result += "• 系统运行时间和指标请求次数\n"
-    result += "• 其他已注册的自定义指标\n"
-
-    return result
-
-
-def format_overview(
+    yield "📋 Prometheus 监控查询帮助\n"
+    yield "=" * 50 + "\n\n"
+
+    yield "🔧 可用命令:\n"
+    yield "• metrics              - 显示系统概览\n"
+    yield "• metrics status       - 机器人状态\n"
+    yield "• metrics messages     - 消息统计\n"
+    yield "• metrics messages 5m  - 最近 5 分钟消息统计\n"
+    yield "• metrics matchers     - 匹配器统计\n"
+    yield "• metrics matchers 1h  - 最近 1 小时匹配器统计\n"
+    yield "• metrics system       - 系统指标\n"
+    yield "• metrics uptime       - 运行时间\n"
+    yield "• metrics query <name> - 查询指定指标\n"
+    yield "• metrics list         - 列出所有指标\n"
+    yield "• metrics search <key> - 搜索指标\n"
+    yield "• metrics range <name> [时长] - 指标历史变化\n"
+    yield "• metrics next         - 查看下一页\n"
+    yield "• metrics page <n>     - 查看第 n 页\n"
+    yield "• metrics help         - 显示此帮助\n\n"
+
+    yield "💡 使用示例:\n"
+    yield "• /metrics\n"
+    yield "• /metrics messages\n"
+    yield "• /metrics matchers\n"
+    yield "• /metrics messages 10m\n"
+    yield "• /metrics query nonebot_received_messages\n"
+    yield '• /metrics query nonebot_received_messages{method="GET"}\n'
+    yield "• /metrics query sum by (bot_id) (nonebot_received_messages)\n"
+    yield "• /metrics list\n"
+    yield "• /metrics search matcher\n"
+    yield "• /metrics range nonebot_received_messages 7d\n\n"
+
+    yield "📊 支持的指标:\n"
+    yield "• 机器人在线状态和连接数\n"
+    yield "• 消息收发统计\n"
+    yield "• 匹配器执行次数和耗时\n"
+    yield "• 系统运行时间和指标请求次数\n"
+    yield "• 其他已注册的自定义指标\n"
+
+
+def iter_overview(
     bot_status: Dict[str, Any],
     message_stats: Dict[str, Any],
     matcher_stats: Dict[str, Any],
     system_metrics: Dict[str, Any],
-) -> str:
+) -> Iterator[str]:
     """格式化系统概览"""
-    result = "📊 Prometheus 监控概览\n"
-    result += "=" * 50 + "\n\n"
+    yield "📊 Prometheus 监控概览\n"
+    yield "=" * 50 + "\n\n"
 
     # 机器人状态
     if "error" not in bot_status:
-        result += f"🤖 机器人: {bot_status['total_bots']} 台在线\n"
+        yield f"🤖 机器人: {bot_status['total_bots']} 台在线\n"
 
     # 消息统计
     if "error" not in message_stats:
         total_messages = message_stats["total_received"] + message_stats["total_sent"]
-        result += f"💬 消息: {format_large_number(total_messages)} 条 (收{format_large_number(message_stats['total_received'])}/发{format_large_number(message_stats['total_sent'])})\n"
+        yield f"💬 消息: {format_large_number(total_messages)} 条 (收{format_large_number(message_stats['total_received'])}/发{format_large_number(message_stats['total_sent'])})\n"
 
     # 匹配器统计
     if "error" not in matcher_stats:
@@ -170,154 +260,205 @@ def format_overview(
             if matcher_stats["total_calls"] > 0
             else 0
         )
-        result += f"🔍 匹配器: {format_large_number(matcher_stats['total_calls'])} 次调用 (成功率 {success_rate:.1f}%)\n"
+        yield f"🔍 匹配器: {format_large_number(matcher_stats['total_calls'])} 次调用 (成功率 {success_rate:.1f}%)\n"
 
     # 系统指标
     if "error" not in system_metrics:
-        result += f"⏱️ 运行时间: {system_metrics['uptime']}\n"
+        yield f"⏱️ 运行时间: {system_metrics['uptime']}\n"
 
-    result += "\n💡 使用 'metrics help' 查看详细帮助"
+    yield "\n💡 使用 'metrics help' 查看详细帮助"
 
-    return result
 
-
-def format_custom_metric(metric_name: str, metric_data: Dict[str, Any]) -> str:
+def iter_custom_metric(metric_name: str, metric_data: Dict[str, Any]) -> Iterator[str]:
     """格式化自定义指标查询结果"""
     if "error" in metric_data:
-        return f"❌ 查询指标失败: {metric_data['error']}"
+        yield f"❌ 查询指标失败: {metric_data['error']}"
+        return
 
     if not metric_data["metrics"]:
-        return f"❌ 未找到指标: {metric_name}"
+        yield f"❌ 未找到指标: {metric_name}"
+        return
 
-    result = f"📊 指标查询: {metric_name}\n"
-    result += "=" * 50 + "\n"
+    yield f"📊 指标查询: {metric_name}\n"
+    yield "=" * 50 + "\n"
 
     for metric in metric_data["metrics"]:
-        result += f"📋 指标类型: {metric['type']}\n"
-        result += f"📝 描述: {metric['help']}\n"
-        result += f"🔢 样本数量: {len(metric['samples'])}\n\n"
+        yield f"📋 指标类型: {metric['type']}\n"
+        yield f"📝 描述: {metric['help']}\n"
+        yield f"🔢 样本数量: {len(metric['samples'])}\n\n"
 
         # 根据指标类型进行不同的格式化
         if metric["type"] in ["counter", "gauge"]:
-            result += format_simple_metric_samples(metric["samples"])
+            yield from iter_simple_metric_samples(metric["samples"])
         elif metric["type"] in ["histogram", "summary"]:
-            result += format_complex_metric_samples(metric["samples"], metric["type"])
+            yield from iter_complex_metric_samples(metric["samples"], metric["type"])
         else:
-            result += format_simple_metric_samples(metric["samples"])
+            yield from iter_simple_metric_samples(metric["samples"])
 
-        result += "\n" + "-" * 50 + "\n"
+        yield "\n" + "-" * 50 + "\n"
 
-    return result
 
+def iter_simple_metric_samples(samples: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """
+    格式化简单指标（Counter, Gauge）的样本
 
-def format_simple_metric_samples(samples: List[Dict[str, Any]]) -> str:
-    """格式化简单指标（Counter, Gauge）的样本"""
-    result = ""
-
-    # 按标签分组显示
-    samples_by_labels = {}
+    按标签分组显示；同一子序列的样本在指标族中是相邻的，逐个样本比较标签即可分组，
+    不需要先遍历全部样本
+    """
+    current = None
     for sample in samples:
-        labels_key = sample["labels"]  # 已经是 tuple 了
-        if labels_key not in samples_by_labels:
-            samples_by_labels[labels_key] = []
-        samples_by_labels[labels_key].append(sample)
-
-    for labels, sample_group in samples_by_labels.items():
-        if labels:
-            labels_str = ", ".join([f'{k}="{v}"' for k, v in labels])
-            result += f"   📌 {labels_str}\n"
-        else:
-            result += "   📌 (无标签)\n"
+        labels = sample["labels"]  # 已经是 tuple 了
+        if labels != current:
+            current = labels
+            if labels:
+                labels_str = ", ".join([f'{k}="{v}"' for k, v in labels])
+                yield f"   📌 {labels_str}\n"
+            else:
+                yield "   📌 (无标签)\n"
+        yield (f"      {sample['name']}: {format_large_number(sample['value'])}\n")
+
+
+def _complex_sample_kind(name: str, metric_type: str) -> str:
+    if name.endswith("_sum"):
+        return "sum"
+    if name.endswith("_count"):
+        return "count"
+    if "_bucket" in name:
+        return "bucket"
+    if metric_type == "summary" and any(
+        q in name for q in ["0.5", "0.9", "0.95", "0.99"]
+    ):
+        return "quantile"
+    return "other"
+
+
+def iter_complex_metric_samples(
+    samples: Sequence[Dict[str, Any]], metric_type: str
+) -> Iterator[str]:
+    """
+    格式化复杂指标（Histogram, Summary）的样本
+
+    按样本类型分段显示，每段单独遍历一次样本并逐个输出，不预先分组
+    """
+    sections = (
+        # 显示总和和计数
+        ("sum", "   📈 总和:\n", lambda value: f"{value:.6f}"),
+        ("count", "   🔢 计数:\n", format_large_number),
+        # 显示分位数（Summary）
+        ("quantile", "   📊 分位数:\n", lambda value: f"{value:.6f}"),
+        # 显示桶信息（Histogram）
+        ("bucket", "   🪣 分桶:\n", format_large_number),
+        # 显示其他样本
+        ("other", "   📋 其他:\n", str),
+    )
+    for kind, title, format_value in sections:
+        first = True
+        for sample in samples:
+            if _complex_sample_kind(sample["name"], metric_type) != kind:
+                continue
+            if first:
+                first = False
+                yield title
+            labels_str = ", ".join([f'{k}="{v}"' for k, v in sample["labels"]])
+            yield f"      {labels_str}: {format_value(sample['value'])}\n"
 
-        for sample in sample_group:
-            result += (
-                f"      {sample['name']}: {format_large_number(sample['value'])}\n"
-            )
 
-    return result
+def iter_metrics_list(
+    metrics: List[Dict[str, str]], title: str = "📋 可用指标列表"
+) -> Iterator[str]:
+    """格式化指标列表"""
+    if not metrics:
+        yield "❌ 未找到任何指标"
+        return
 
+    yield f"{title}\n"
+    yield "=" * 50 + "\n"
+    yield f"📊 总共找到 {len(metrics)} 个指标\n\n"
 
-def format_complex_metric_samples(
-    samples: List[Dict[str, Any]], metric_type: str
-) -> str:
-    """格式化复杂指标（Histogram, Summary）的样本"""
-    result = ""
+    for metric in metrics:
+        yield f"🔸 {metric['name']} ({metric['type']})\n"
+        yield (
+            f"   📝 {metric['help'][:80]}{'...' if len(metric['help']) > 80 else ''}\n"
+        )
+        yield f"   🔢 {metric['sample_count']} 个样本\n\n"
 
-    # 分组样本类型
-    sum_samples = []
-    count_samples = []
-    bucket_samples = []
-    quantile_samples = []
-    other_samples = []
 
-    for sample in samples:
-        name = sample["name"]
-        if name.endswith("_sum"):
-            sum_samples.append(sample)
-        elif name.endswith("_count"):
-            count_samples.append(sample)
-        elif "_bucket" in name:
-            bucket_samples.append(sample)
-        elif metric_type == "summary" and any(
-            q in name for q in ["0.5", "0.9", "0.95", "0.99"]
-        ):
-            quantile_samples.append(sample)
+def iter_query_result(
+    metric_query: str, metric_values: List[Tuple[Tuple[Tuple[str, str], ...], float]]
+) -> Iterator[str]:
+    """格式化查询语句的结果"""
+    if not metric_values:
+        yield f"❌ 未找到匹配的指标: {metric_query}"
+        return
+
+    yield f"📊 指标查询: {metric_query}\n"
+    yield "=" * 50 + "\n"
+
+    for sample_labels, value in metric_values:
+        if sample_labels:
+            labels_str = ", ".join([f'{k}="{v}"' for k, v in sample_labels])
+            yield f"   📌 {labels_str}\n"
         else:
-            other_samples.append(sample)
+            yield "   📌 (无标签)\n"
+        yield f"      值: {format_large_number(value)}\n"
 
-    # 显示总和和计数
-    if sum_samples:
-        result += "   📈 总和:\n"
-        for sample in sum_samples:
-            labels_str = ", ".join([f'{k}="{v}"' for k, v in sample["labels"]])
-            result += f"      {labels_str}: {sample['value']:.6f}\n"
 
-    if count_samples:
-        result += "   🔢 计数:\n"
-        for sample in count_samples:
-            labels_str = ", ".join([f'{k}="{v}"' for k, v in sample["labels"]])
-            result += f"      {labels_str}: {format_large_number(sample['value'])}\n"
+def format_bot_status(status_data: Dict[str, Any]) -> str:
+    """格式化机器人状态信息"""
+    return "".join(iter_bot_status(status_data))
 
-    # 显示分位数（Summary）
-    if quantile_samples:
-        result += "   📊 分位数:\n"
-        for sample in quantile_samples:
-            labels_str = ", ".join([f'{k}="{v}"' for k, v in sample["labels"]])
-            result += f"      {labels_str}: {sample['value']:.6f}\n"
 
-    # 显示桶信息（Histogram）
-    if bucket_samples:
-        result += "   🪣 分桶:\n"
-        for sample in bucket_samples:
-            labels_str = ", ".join([f'{k}="{v}"' for k, v in sample["labels"]])
-            result += f"      {labels_str}: {format_large_number(sample['value'])}\n"
+def format_message_stats(message_data: Dict[str, Any]) -> str:
+    """格式化消息统计信息"""
+    return "".join(iter_message_stats(message_data))
 
-    # 显示其他样本
-    if other_samples:
-        result += "   📋 其他:\n"
-        for sample in other_samples:
-            labels_str = ", ".join([f'{k}="{v}"' for k, v in sample["labels"]])
-            result += f"      {labels_str}: {sample['value']}\n"
 
-    return result
+def format_matcher_stats(matcher_data: Dict[str, Any]) -> str:
+    """格式化匹配器统计信息"""
+    return "".join(iter_matcher_stats(matcher_data))
 
 
-def format_metrics_list(
-    metrics: List[Dict[str, str]], title: str = "📋 可用指标列表"
+def format_system_metrics(system_data: Dict[str, Any]) -> str:
+    """格式化系统指标"""
+    return "".join(iter_system_metrics(system_data))
+
+
+def format_help() -> str:
+    """格式化帮助信息"""
+    return "".join(iter_help())
+
+
+def format_overview(
+    bot_status: Dict[str, Any],
+    message_stats: Dict[str, Any],
+    matcher_stats: Dict[str, Any],
+    system_metrics: Dict[str, Any],
 ) -> str:
-    """格式化指标列表"""
-    if not metrics:
-        return "❌ 未找到任何指标"
+    """格式化系统概览"""
+    return "".join(
+        iter_overview(bot_status, message_stats, matcher_stats, system_metrics)
+    )
 
-    result = f"{title}\n"
-    result += "=" * 50 + "\n"
-    result += f"📊 总共找到 {len(metrics)} 个指标\n\n"
 
-    for metric in metrics:
-        result += f"🔸 {metric['name']} ({metric['type']})\n"
-        result += (
-            f"   📝 {metric['help'][:80]}{'...' if len(metric['help']) > 80 else ''}\n"
-        )
-        result += f"   🔢 {metric['sample_count']} 个样本\n\n"
+def format_custom_metric(metric_name: str, metric_data: Dict[str, Any]) -> str:
+    """格式化自定义指标查询结果"""
+    return "".join(iter_custom_metric(metric_name, metric_data))
+
+
+def format_simple_metric_samples(samples: Iterable[Dict[str, Any]]) -> str:
+    """格式化简单指标（Counter, Gauge）的样本"""
+    return "".join(iter_simple_metric_samples(samples))
 
-    return result
+
+def format_complex_metric_samples(
+    samples: Sequence[Dict[str, Any]], metric_type: str
+) -> str:
+    """格式化复杂指标（Histogram, Summary）的样本"""
+    return "".join(iter_complex_metric_samples(samples, metric_type))
+
+
+def format_metrics_list(
+    metrics: List[Dict[str, str]], title: str = "📋 可用指标列表"
+) -> str:
+    """格式化指标列表"""
+    return "".join(iter_metrics_list(metrics, title))
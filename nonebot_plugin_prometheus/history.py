@@ -0,0 +1,359 @@
+import asyncio
+import math
+import re
+import threading
+import time
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from nonebot import get_driver, logger
+from prometheus_client.registry import Collector
+
+from nonebot_plugin_prometheus.catalog import catalog
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.snapshot import CompactSnapshot, LabelSet
+
+SeriesKey = Tuple[str, LabelSet]
+
+# 单调递增的指标族，合并标签前先按原始序列计算增量
+MONOTONIC_TYPES = frozenset(("counter", "histogram", "summary"))
+
+_DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """解析 `30s`、`5m`、`1h`、`7d` 格式的时长，不带单位时为秒，格式错误时返回 None"""
+    match = _DURATION_RE.match(text.strip().lower())
+    if match is None:
+        return None
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def histogram_quantile(q: float, buckets: Sequence[Tuple[float, float]]) -> float:
+    """
+    根据累计分桶计数估算分位数，与 PromQL 的 `histogram_quantile` 规则一致
+
+    Args:
+        q: 分位数，0 ~ 1
+        buckets: [(上界 le, 累计计数), ...]，需要包含 +Inf 桶
+    """
+    if not buckets:
+        return math.nan
+    buckets = sorted(buckets)
+    if buckets[-1][0] != math.inf:
+        return math.nan
+    total = buckets[-1][1]
+    if total <= 0:
+        return math.nan
+    rank = q * total
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if le == math.inf:
+                # 落在 +Inf 桶时返回最大的有限上界
+                return prev_le
+            if count == prev_count:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_count) / (count - prev_count)
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def _counter_increase(points: List[Tuple[float, float]]) -> float:
+    total = 0.0
+    prev = points[0][1]
+    for _, value in points[1:]:
+        total += value - prev if value >= prev else value
+        prev = value
+    return total
+
+
+class History:
+    """
+    进程内的指标历史记录
+
+    按固定间隔记录指定指标族的快照，保存在环形缓冲区中：所有序列共用一列时间戳，
+    每个序列一列定长 `array('d')`，缺失的采样点为 NaN，超出保留时长的数据被覆盖。
+    记录时可以只保留部分标签（其余标签求和合并），以控制序列数量。
+
+    计数器、直方图和摘要合并前先按原始序列计算两次采样间的增量再求和，
+    记录的是开始记录以来的累计值：原始序列被清理后消失不会被当作计数器重置，
+    单个原始序列的值变小时才视为重置。仪表盘直接求和。
+    """
+
+    def __init__(
+        self,
+        resolution: float,
+        retention: float,
+        metrics: Dict[str, List[str]],
+    ):
+        self.resolution = resolution
+        self.capacity = max(2, int(retention / resolution) + 1)
+        self.metrics = metrics
+        self.timestamps = array("d", [math.nan]) * self.capacity
+        # 样本名称 -> 标签集 -> 采样值
+        self._series: Dict[str, Dict[LabelSet, array]] = {}
+        self._last_tick: Dict[SeriesKey, int] = {}
+        # 单调指标族上一次采样的原始值 (样本名称, 原始标签集) -> 值，及合并后的累计值
+        self._reduce_lock = threading.Lock()
+        self._raw: Dict[SeriesKey, float] = {}
+        self._totals: Dict[SeriesKey, float] = {}
+        self._tick = 0
+        self._head = 0
+        self._size = 0
+        self._listeners: List[Callable[[float, Dict[SeriesKey, float]], None]] = []
+
+    def __len__(self) -> int:
+        """已记录的采样点数量"""
+        return self._size
+
+    @property
+    def generation(self) -> int:
+        """已记录的快照次数，每次 `record` 后加一"""
+        return self._tick
+
+    def on_record(self, listener: Callable[[float, Dict[SeriesKey, float]], None]):
+        """注册每次记录快照后的回调，参数为 (时间戳, {(样本名称, 标签集): 值})"""
+        self._listeners.append(listener)
+
+    def collectors(self) -> List[Collector]:
+        """需要记录的指标族对应的 collector"""
+        collectors = []
+        for name in self.metrics:
+            entry = catalog.get(name)
+            if entry is not None:
+                collectors.append(entry.collector)
+        return collectors
+
+    def collect(self) -> CompactSnapshot:
+        """收集需要记录的指标族"""
+        return CompactSnapshot.collect(self.collectors())
+
+    def _reduce(self, snapshot: CompactSnapshot) -> Dict[SeriesKey, float]:
+        values: Dict[SeriesKey, float] = {}
+        increments: Dict[SeriesKey, float] = {}
+        raw: Dict[SeriesKey, float] = {}
+        with self._reduce_lock:
+            prev_raw = self._raw
+            for info in snapshot.families:
+                keep = self.metrics.get(info.name)
+                if keep is None:
+                    continue
+                keep_set = set(keep)
+                monotonic = info.type in MONOTONIC_TYPES
+                for i in range(info.start, info.stop):
+                    sample_name = snapshot.sample_names[snapshot.name_ids[i]]
+                    if sample_name.endswith("_created"):
+                        continue
+                    labelset = snapshot.labelsets[snapshot.labelset_ids[i]]
+                    value = snapshot.values[i]
+                    target = values
+                    if monotonic:
+                        raw_key = (sample_name, labelset)
+                        raw[raw_key] = value
+                        prev = prev_raw.get(raw_key)
+                        # 新出现的序列从 0 开始计数，值变小时视为该序列重置
+                        if prev is not None and value >= prev:
+                            value -= prev
+                        target = increments
+                    if keep_set:
+                        labelset = tuple(
+                            item for item in labelset if item[0] in keep_set
+                        )
+                    key = (sample_name, labelset)
+                    target[key] = target.get(key, 0.0) + value
+            # 消失的原始序列不再参与计算，不影响合并后的累计值
+            self._raw = raw
+            totals = {
+                key: self._totals.get(key, 0.0) + increment
+                for key, increment in increments.items()
+            }
+            self._totals = totals
+        values.update(totals)
+        return values
+
+    def sample(self, collectors: Sequence[Collector]) -> Dict[SeriesKey, float]:
+        """
+        收集并合并一次采样值，不写入环形缓冲区
+
+        收集开销与原始序列数量成正比（例如每个 user_id 一个序列），可以在线程池中调用，
+        再在事件循环中通过 `append` 写入；单调指标族的增量相对上一次采样计算，
+        每次采样都需要写入
+        """
+        return self._reduce(CompactSnapshot.collect(collectors))
+
+    def record(
+        self, snapshot: Optional[CompactSnapshot] = None, now: Optional[float] = None
+    ):
+        """记录一次快照，snapshot 为空时自动收集"""
+        if snapshot is None:
+            snapshot = self.collect()
+        self.append(self._reduce(snapshot), now)
+
+    def append(self, values: Dict[SeriesKey, float], now: Optional[float] = None):
+        """写入一次已合并的采样值，开销只与保留标签后的序列数量有关"""
+        if now is None:
+            now = time.time()
+        index = self._head
+        self.timestamps[index] = now
+        for series in self._series.values():
+            for buffer in series.values():
+                buffer[index] = math.nan
+        for (sample_name, labelset), value in values.items():
+            series = self._series.setdefault(sample_name, {})
+            buffer = series.get(labelset)
+            if buffer is None:
+                buffer = series[labelset] = array("d", [math.nan]) * self.capacity
+            buffer[index] = value
+            self._last_tick[(sample_name, labelset)] = self._tick
+        self._tick += 1
+        self._head = (index + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        self._drop_stale()
+        for listener in self._listeners:
+            listener(now, values)
+
+    def _drop_stale(self):
+        """移除整个缓冲区内都没有数据的序列"""
+        stale = [
+            key
+            for key, tick in self._last_tick.items()
+            if self._tick - tick >= self.capacity
+        ]
+        for sample_name, labelset in stale:
+            del self._last_tick[(sample_name, labelset)]
+            series = self._series[sample_name]
+            del series[labelset]
+            if not series:
+                del self._series[sample_name]
+
+    def _window(self, window: float, now: Optional[float]) -> List[int]:
+        """按时间顺序返回时间窗口内的采样点下标"""
+        if now is None:
+            now = time.time()
+        start = now - window
+        indexes = []
+        for i in range(self._size):
+            index = (self._head - self._size + i) % self.capacity
+            if self.timestamps[index] >= start:
+                indexes.append(index)
+        return indexes
+
+    def points(
+        self,
+        sample_name: str,
+        window: float,
+        labels: Optional[Dict[str, str]] = None,
+        now: Optional[float] = None,
+    ) -> Iterator[Tuple[LabelSet, List[Tuple[float, float]]]]:
+        """
+        遍历时间窗口内某个样本的所有序列
+
+        Yields:
+            Tuple[LabelSet, List[Tuple[float, float]]]: (标签集, [(时间戳, 值), ...])
+        """
+        series = self._series.get(sample_name)
+        if not series:
+            return
+        indexes = self._window(window, now)
+        timestamps = self.timestamps
+        for labelset, buffer in series.items():
+            if labels and any(dict(labelset).get(k) != v for k, v in labels.items()):
+                continue
+            points = [
+                (timestamps[i], buffer[i]) for i in indexes if not math.isnan(buffer[i])
+            ]
+            if points:
+                yield labelset, points
+
+    def increase(
+        self,
+        sample_name: str,
+        window: float,
+        labels: Optional[Dict[str, str]] = None,
+        now: Optional[float] = None,
+    ) -> Dict[LabelSet, float]:
+        """计数器在时间窗口内的增量，值变小时视为计数器重置；至少需要两个采样点"""
+        return {
+            labelset: _counter_increase(points)
+            for labelset, points in self.points(sample_name, window, labels, now)
+            if len(points) >= 2
+        }
+
+    def rate(
+        self,
+        sample_name: str,
+        window: float,
+        labels: Optional[Dict[str, str]] = None,
+        now: Optional[float] = None,
+    ) -> Dict[LabelSet, float]:
+        """计数器在时间窗口内的每秒平均增长率，按实际采样跨度计算，不做外推"""
+        result = {}
+        for labelset, points in self.points(sample_name, window, labels, now):
+            if len(points) < 2:
+                continue
+            span = points[-1][0] - points[0][0]
+            if span > 0:
+                result[labelset] = _counter_increase(points) / span
+        return result
+
+    def delta(
+        self,
+        sample_name: str,
+        window: float,
+        labels: Optional[Dict[str, str]] = None,
+        now: Optional[float] = None,
+    ) -> Dict[LabelSet, float]:
+        """仪表盘在时间窗口内首尾采样点的差值"""
+        return {
+            labelset: points[-1][1] - points[0][1]
+            for labelset, points in self.points(sample_name, window, labels, now)
+            if len(points) >= 2
+        }
+
+
+history: Optional[History] = (
+    History(
+        plugin_config.prometheus_history_resolution,
+        plugin_config.prometheus_history_retention,
+        plugin_config.prometheus_history_metrics,
+    )
+    if plugin_config.prometheus_history_resolution > 0
+    else None
+)
+_history_task: Optional["asyncio.Task[None]"] = None
+
+
+async def _history_loop(history: History):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            now = time.time()
+            # 收集和合并需要遍历全部原始序列，放到线程池中避免阻塞事件循环
+            values = await loop.run_in_executor(
+                None, history.sample, history.collectors()
+            )
+            history.append(values, now)
+        except Exception as e:
+            logger.error(f"记录指标历史失败: {e}")
+        await asyncio.sleep(history.resolution)
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def start_history():
+    global _history_task
+    if history is None:
+        return
+    _history_task = asyncio.create_task(_history_loop(history))
+
+
+@driver.on_shutdown
+async def stop_history():
+    global _history_task
+    if _history_task is not None:
+        _history_task.cancel()
+        _history_task = None
@@ -0,0 +1,91 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from nonebot import logger
+
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.exposition import build_response, get_snapshot_sync
+from nonebot_plugin_prometheus.metrics import metrics_request_counter
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """只提供指标输出的请求处理器，使用 HTTP/1.1 以支持 keep-alive"""
+
+    protocol_version = "HTTP/1.1"
+    timeout = plugin_config.prometheus_listen_keepalive_timeout
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != plugin_config.prometheus_metrics_path:
+            self._send(404, {"Content-Type": "text/plain"}, b"Not Found")
+            return
+        metrics_request_counter.inc()
+        try:
+            snapshot = get_snapshot_sync(
+                self.headers.get("Accept", ""),
+                parse_qs(url.query).get("name[]", []),
+            )
+        except Exception as e:
+            logger.error(f"渲染指标失败: {e}")
+            self._send(500, {"Content-Type": "text/plain"}, b"Internal Server Error")
+            return
+        headers, content = build_response(
+            snapshot, self.headers.get("Accept-Encoding", "")
+        )
+        self._send(200, headers, content)
+
+    def _send(self, status: int, headers: dict, content: bytes):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args):
+        logger.trace(f"{self.address_string()} - {format % args}")
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 关闭时不等待空闲的 keep-alive 连接
+    block_on_close = False
+
+
+_server: Optional[MetricsServer] = None
+_thread: Optional[threading.Thread] = None
+
+
+def start_listener(addr: str, port: int):
+    """在独立线程中启动指标监听服务"""
+    global _server, _thread
+    if _server is not None:
+        return
+    MetricsServer.address_family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+    try:
+        _server = MetricsServer((addr, port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"启动 Prometheus 独立监听失败: {e}")
+        return
+    _thread = threading.Thread(
+        target=_server.serve_forever, name="prometheus-listener", daemon=True
+    )
+    _thread.start()
+    host, port = _server.server_address[:2]
+    logger.info(
+        f"Prometheus 独立监听已启动: http://{host}:{port}{plugin_config.prometheus_metrics_path}"
+    )
+
+
+def stop_listener():
+    """停止指标监听服务，会阻塞到服务线程退出"""
+    global _server, _thread
+    if _server is None:
+        return
+    _server.shutdown()
+    _server.server_close()
+    _server = None
+    _thread = None
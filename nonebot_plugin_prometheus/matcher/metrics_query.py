@@ -1,35 +1,56 @@
+import re
+from typing import Callable, Hashable, Iterable, Tuple, TypeVar
+
 from nonebot import on_command
 from nonebot.adapters import Bot, Event, Message
-from nonebot.matcher import Matcher
+from nonebot.matcher import Matcher, current_event
 from nonebot.params import CommandArg
 from nonebot.permission import SUPERUSER
 
+from nonebot_plugin_prometheus import promql
+from nonebot_plugin_prometheus.catalog import catalog
 from nonebot_plugin_prometheus.config import plugin_config
 from nonebot_plugin_prometheus.formatter import (
-    format_bot_status,
-    format_custom_metric,
-    format_help,
-    format_matcher_stats,
-    format_message_stats,
-    format_metrics_list,
-    format_overview,
-    format_system_metrics,
+    iter_bot_status,
+    iter_custom_metric,
+    iter_help,
+    iter_matcher_rates,
+    iter_matcher_stats,
+    iter_message_rates,
+    iter_message_stats,
+    iter_metric_range,
+    iter_metrics_list,
+    iter_overview,
+    iter_query_result,
+    iter_system_metrics,
 )
+from nonebot_plugin_prometheus.history import history, parse_duration
+from nonebot_plugin_prometheus.pagination import page_sessions
 from nonebot_plugin_prometheus.query import (
-    format_large_number,
     get_bot_status,
+    get_matcher_rates,
     get_matcher_stats,
+    get_message_rates,
     get_message_stats,
+    get_metric_range,
+    get_overview_snapshot,
     get_system_metrics,
 )
 from nonebot_plugin_prometheus.registry import (
-    get_metric_values,
     get_metrics_by_name,
     list_all_metrics,
-    parse_metric_filter,
     search_metrics,
 )
-from nonebot_plugin_prometheus.utils import MAGIC_PRIORITY
+from nonebot_plugin_prometheus.utils import MAGIC_PRIORITY, SingleFlightCache
+
+METRIC_NAME_RE = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+
+T = TypeVar("T")
+
+# 聊天查询的结果缓存，键为 (子命令, 参数, 代数)
+chat_cache: SingleFlightCache = SingleFlightCache(
+    plugin_config.prometheus_chat_cache_ttl
+)
 
 # 创建 metrics 命令处理器 (传统 on_command，用于对话查询)
 metrics_query = on_command(
@@ -47,10 +68,30 @@ async def handle_metrics_query(
 ):
     """处理 metrics 查询命令"""
     # 获取命令参数
-    arg_text = args.extract_plain_text().strip().lower()
+    raw_text = args.extract_plain_text().strip()
+    # 只有子命令关键字不区分大小写，查询语句中的指标名称、标签值原样保留
+    arg_text = raw_text.lower()
+    subcommand, _, rest = raw_text.partition(" ")
+    subcommand = subcommand.lower()
+    rest = rest.strip()
+
+    # `messages 5m` 等带时间窗口的查询
+    window = parse_duration(rest) if rest else None
 
     # 根据参数处理不同的查询类型
-    if not arg_text or arg_text in ["", "overview", "概览"]:
+    if window and subcommand in ["messages", "消息", "msg"]:
+        # 显示时间窗口内的消息统计
+        await handle_message_rates(matcher, window)
+    elif window and subcommand in ["matchers", "匹配器", "matcher"]:
+        # 显示时间窗口内的匹配器统计
+        await handle_matcher_rates(matcher, window)
+    elif arg_text in ["next", "下一页", "n"]:
+        # 查看分页结果的下一页
+        await handle_next_page(matcher)
+    elif subcommand in ["page", "页"] and rest.isdigit():
+        # 跳转到分页结果的指定页
+        await handle_goto_page(matcher, int(rest))
+    elif not arg_text or arg_text in ["", "overview", "概览"]:
         # 显示系统概览
         await handle_overview(matcher)
     elif arg_text in ["status", "状态", "bot", "机器人"]:
@@ -71,37 +112,89 @@ async def handle_metrics_query(
     elif arg_text in ["help", "帮助", "h", "?"]:
         # 显示帮助
         await handle_help(matcher)
-    elif arg_text.startswith("query "):
+    elif subcommand == "query" and rest:
         # 查询特定指标
-        metric_query = arg_text[6:].strip()
-        await handle_query(matcher, metric_query)
+        await handle_query(matcher, rest)
+    elif subcommand == "range" and rest:
+        # 查询指标历史变化
+        await handle_range(matcher, rest)
     elif arg_text in ["list", "列表", "ls"]:
         # 列出所有指标
         await handle_list(matcher)
-    elif arg_text.startswith("search "):
+    elif subcommand == "search" and rest:
         # 搜索指标
-        keyword = arg_text[7:].strip()
-        await handle_search(matcher, keyword)
+        await handle_search(matcher, rest)
     else:
         # 未知参数，显示帮助
-        await matcher.send(f"❌ 未知参数: {arg_text}")
+        await matcher.send(f"❌ 未知参数: {raw_text}")
         await handle_help(matcher)
 
 
+def _session_id() -> str:
+    try:
+        return current_event.get().get_session_id()
+    except (LookupError, ValueError, NotImplementedError):
+        return ""
+
+
+def _generation() -> Tuple[int, int]:
+    """注册表变化或指标历史记录新快照时，缓存的结果随之失效"""
+    return catalog.generation, history.generation if history is not None else 0
+
+
+async def cached(key: Hashable, func: Callable[[], T], in_thread: bool = False) -> T:
+    """
+    按 (子命令, 参数) 缓存查询结果，并合并同时到达的相同查询
+
+    输出长度有限的子命令缓存格式化后的文本行，可能很长的查询结果只缓存数据，
+    仍然由分页器按需格式化
+    """
+    return await chat_cache.aget((key, _generation()), func, in_thread)
+
+
+async def send_paged(matcher: Matcher, lines: Iterable[str]):
+    """按页面大小发送格式化器产生的文本，剩余内容保存在会话中供翻页查看"""
+    text = page_sessions.start(_session_id(), lines)
+    if text:
+        await matcher.send(text)
+
+
+async def handle_next_page(matcher: Matcher):
+    """处理查看下一页"""
+    try:
+        text = page_sessions.next(_session_id())
+        await matcher.send(text or "❌ 没有更多内容了")
+    except Exception as e:
+        await matcher.send(f"❌ 获取下一页失败: {str(e)}")
+
+
+async def handle_goto_page(matcher: Matcher, number: int):
+    """处理跳转到指定页"""
+    try:
+        text = page_sessions.goto(_session_id(), number)
+        await matcher.send(text or f"❌ 没有第 {number} 页")
+    except Exception as e:
+        await matcher.send(f"❌ 获取第 {number} 页失败: {str(e)}")
+
+
+def render_overview() -> Tuple[str, ...]:
+    # 一次收集所有数据，各统计共用同一个快照
+    snapshot = get_overview_snapshot()
+    bot_status = get_bot_status(snapshot)
+    message_stats = get_message_stats()
+    matcher_stats = get_matcher_stats(limit=5)
+    system_metrics = get_system_metrics(snapshot)
+
+    # 格式化概览
+    return tuple(
+        iter_overview(bot_status, message_stats, matcher_stats, system_metrics)
+    )
+
+
 async def handle_overview(matcher: Matcher):
     """处理系统概览"""
     try:
-        # 并行获取所有数据
-        bot_status = get_bot_status()
-        message_stats = get_message_stats()
-        matcher_stats = get_matcher_stats(limit=5)
-        system_metrics = get_system_metrics()
-
-        # 格式化概览
-        overview_text = format_overview(
-            bot_status, message_stats, matcher_stats, system_metrics
-        )
-        await matcher.send(overview_text)
+        await send_paged(matcher, await cached(("overview",), render_overview))
     except Exception as e:
         await matcher.send(f"❌ 获取系统概览失败: {str(e)}")
 
@@ -109,9 +202,10 @@ async def handle_overview(matcher: Matcher):
 async def handle_status(matcher: Matcher):
     """处理机器人状态查询"""
     try:
-        bot_status = get_bot_status()
-        status_text = format_bot_status(bot_status)
-        await matcher.send(status_text)
+        lines = await cached(
+            ("status",), lambda: tuple(iter_bot_status(get_bot_status()))
+        )
+        await send_paged(matcher, lines)
     except Exception as e:
         await matcher.send(f"❌ 获取机器人状态失败: {str(e)}")
 
@@ -119,29 +213,57 @@ async def handle_status(matcher: Matcher):
 async def handle_messages(matcher: Matcher):
     """处理消息统计查询"""
     try:
-        message_stats = get_message_stats()
-        message_text = format_message_stats(message_stats)
-        await matcher.send(message_text)
+        lines = await cached(
+            ("messages",), lambda: tuple(iter_message_stats(get_message_stats()))
+        )
+        await send_paged(matcher, lines)
     except Exception as e:
         await matcher.send(f"❌ 获取消息统计失败: {str(e)}")
 
 
+async def handle_message_rates(matcher: Matcher, window: float):
+    """处理时间窗口内的消息统计查询"""
+    try:
+        lines = await cached(
+            ("messages", window),
+            lambda: tuple(iter_message_rates(get_message_rates(window))),
+        )
+        await send_paged(matcher, lines)
+    except Exception as e:
+        await matcher.send(f"❌ 获取消息速率失败: {str(e)}")
+
+
 async def handle_matchers(matcher: Matcher):
     """处理匹配器统计查询"""
     try:
-        matcher_stats = get_matcher_stats(limit=10)
-        matcher_text = format_matcher_stats(matcher_stats)
-        await matcher.send(matcher_text)
+        lines = await cached(
+            ("matchers",),
+            lambda: tuple(iter_matcher_stats(get_matcher_stats(limit=10))),
+        )
+        await send_paged(matcher, lines)
     except Exception as e:
         await matcher.send(f"❌ 获取匹配器统计失败: {str(e)}")
 
 
+async def handle_matcher_rates(matcher: Matcher, window: float):
+    """处理时间窗口内的匹配器统计查询"""
+    try:
+        lines = await cached(
+            ("matchers", window),
+            lambda: tuple(iter_matcher_rates(get_matcher_rates(window, limit=10))),
+        )
+        await send_paged(matcher, lines)
+    except Exception as e:
+        await matcher.send(f"❌ 获取匹配器速率失败: {str(e)}")
+
+
 async def handle_system(matcher: Matcher):
     """处理系统指标查询"""
     try:
-        system_metrics = get_system_metrics()
-        system_text = format_system_metrics(system_metrics)
-        await matcher.send(system_text)
+        lines = await cached(
+            ("system",), lambda: tuple(iter_system_metrics(get_system_metrics()))
+        )
+        await send_paged(matcher, lines)
     except Exception as e:
         await matcher.send(f"❌ 获取系统指标失败: {str(e)}")
 
@@ -165,55 +287,59 @@ async def handle_uptime(matcher: Matcher):
 async def handle_help(matcher: Matcher):
     """处理帮助查询"""
     try:
-        help_text = format_help()
-        await matcher.send(help_text)
+        await send_paged(matcher, iter_help())
     except Exception as e:
         await matcher.send(f"❌ 获取帮助信息失败: {str(e)}")
 
 
 async def handle_query(matcher: Matcher, metric_query: str):
-    """处理自定义指标查询"""
-    try:
-        # 解析查询字符串
-        metric_name, labels = parse_metric_filter(metric_query)
-
-        # 获取指标数据
-        if labels:
-            # 如果有标签过滤，使用 get_metric_values
-            metric_values = get_metric_values(metric_name, labels)
-            if not metric_values:
-                await matcher.send(f"❌ 未找到匹配的指标: {metric_query}")
-                return
-
-            # 构建结果
-            result = f"📊 指标查询: {metric_query}\n"
-            result += "=" * 50 + "\n"
-
-            for sample_labels, value in metric_values:
-                if sample_labels:
-                    labels_str = ", ".join([f'{k}="{v}"' for k, v in sample_labels])
-                    result += f"   📌 {labels_str}\n"
-                else:
-                    result += "   📌 (无标签)\n"
-                result += f"      值: {format_large_number(value)}\n"
-
-            await matcher.send(result)
-        else:
-            # 如果没有标签过滤，使用 get_metrics_by_name
-            metric_data = get_metrics_by_name(metric_name)
-            result_text = format_custom_metric(metric_name, metric_data)
-            await matcher.send(result_text)
+    """处理自定义指标查询，指标名称显示完整信息，其他查询按 PromQL 子集执行"""
+    try:
+        if METRIC_NAME_RE.match(metric_query):
+            # 样本在分页器格式化到对应页面时才转换
+            metric_data = await cached(
+                ("query", metric_query),
+                lambda: get_metrics_by_name(metric_query, lazy=True),
+            )
+            await send_paged(matcher, iter_custom_metric(metric_query, metric_data))
+            return
 
+        metric_values = await cached(
+            ("promql", metric_query), lambda: promql.query(metric_query)
+        )
+        await send_paged(matcher, iter_query_result(metric_query, metric_values))
+
+    except promql.PromQLError as e:
+        await matcher.send(f"❌ 查询语句错误: {str(e)}")
     except Exception as e:
         await matcher.send(f"❌ 查询指标失败: {str(e)}")
 
 
+async def handle_range(matcher: Matcher, range_query: str):
+    """处理指标历史查询，格式为 `<name> [时长]`，时长默认为 1h"""
+    try:
+        metric_name, _, window_text = range_query.partition(" ")
+        window = parse_duration(window_text) if window_text else 3600
+        if not window:
+            await matcher.send(f"❌ 无效的时长: {window_text}")
+            return
+
+        # 需要读取存储文件，放到线程池中执行
+        range_data = await cached(
+            ("range", metric_name, window),
+            lambda: get_metric_range(metric_name, window),
+            in_thread=True,
+        )
+        await send_paged(matcher, iter_metric_range(range_data))
+    except Exception as e:
+        await matcher.send(f"❌ 查询指标历史失败: {str(e)}")
+
+
 async def handle_list(matcher: Matcher):
     """处理列出所有指标"""
     try:
-        all_metrics = list_all_metrics()
-        result_text = format_metrics_list(all_metrics)
-        await matcher.send(result_text)
+        all_metrics = await cached(("list",), list_all_metrics)
+        await send_paged(matcher, iter_metrics_list(all_metrics))
     except Exception as e:
         await matcher.send(f"❌ 列出指标失败: {str(e)}")
 
@@ -221,13 +347,14 @@ async def handle_list(matcher: Matcher):
 async def handle_search(matcher: Matcher, keyword: str):
     """处理搜索指标"""
     try:
-        matched_metrics = search_metrics(keyword)
+        matched_metrics = await cached(
+            ("search", keyword), lambda: search_metrics(keyword)
+        )
         if not matched_metrics:
             await matcher.send(f"❌ 未找到包含 '{keyword}' 的指标")
             return
 
         title = f"🔍 搜索结果: '{keyword}'"
-        result_text = format_metrics_list(matched_metrics, title)
-        await matcher.send(result_text)
+        await send_paged(matcher, iter_metrics_list(matched_metrics, title))
     except Exception as e:
         await matcher.send(f"❌ 搜索指标失败: {str(e)}")
@@ -1,14 +1,28 @@
 import time
-from typing import Any, Dict, Optional
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from nonebot import get_driver, logger
 from nonebot.adapters import Bot
 from nonebot.matcher import Matcher, current_event
 from nonebot.message import run_postprocessor, run_preprocessor
-from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client import Counter, Gauge, Histogram, disable_created_metrics
 
+from nonebot_plugin_prometheus.aggregates import (
+    MatcherAggregate,
+    MessageTotals,
+    matcher_aggregates,
+    received_totals,
+    sent_totals,
+)
+from nonebot_plugin_prometheus.cardinality import UserLabelGuard, label_values
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.eviction import StaleSeriesTracker, track
 from nonebot_plugin_prometheus.utils import MAGIC_PRIORITY
 
+if plugin_config.prometheus_disable_created_metrics:
+    disable_created_metrics()
+
 driver = get_driver()
 send_msg_apis = ["send", "post", "create", "im/v1/messages", "im/v1/images"]
 
@@ -16,7 +30,36 @@ metrics_request_counter = Counter(
     "nonebot_metrics_requests", "Total number of requests"
 )
 
-nonebot_start_at_gauge = Gauge("nonebot_start_at", "Start time of the bot")
+metrics_cache_hits_counter = Counter(
+    "nonebot_metrics_cache_hits",
+    "Total number of metrics requests served from a cached or in-flight render",
+)
+metrics_cache_misses_counter = Counter(
+    "nonebot_metrics_cache_misses",
+    "Total number of metrics requests that triggered a render",
+)
+metrics_render_histogram = Histogram(
+    "nonebot_metrics_render_seconds",
+    "Histogram of metrics exposition render time in seconds",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+metrics_push_counter = Counter(
+    "nonebot_metrics_pushes",
+    "Total number of push requests sent to the Pushgateway",
+    ["result"],
+)
+
+evicted_series_counter = Counter(
+    "nonebot_evicted_series",
+    "Total number of idle label children removed by the stale series sweeper",
+    ["metric"],
+)
+
+# 多进程模式下取存活 worker 中最早的启动时间
+nonebot_start_at_gauge = Gauge(
+    "nonebot_start_at", "Start time of the bot", multiprocess_mode="livemin"
+)
 
 
 @driver.on_startup
@@ -24,43 +67,134 @@ def handle_startup():
     nonebot_start_at_gauge.set_to_current_time()
 
 
+# 多进程模式下对存活 worker 求和，退出的 worker 不再计入
 bot_nums_gauge = Gauge(
-    "nonebot_bot_nums", "Total number of bots", ["bot_id", "adapter_name"]
+    "nonebot_bot_nums",
+    "Total number of bots",
+    ["bot_id", "adapter_name"],
+    multiprocess_mode="livesum",
 )
 bot_shutdown_counter = Counter(
     "nonebot_bot_shutdown", "Total number of bots shutdown", ["bot_id", "adapter_name"]
 )
+bot_nums_tracker = track("nonebot_bot_nums", bot_nums_gauge, evicted_series_counter)
+bot_shutdown_tracker = track(
+    "nonebot_bot_shutdown", bot_shutdown_counter, evicted_series_counter
+)
 
 
 @driver.on_bot_connect
 async def handle_bot_connect(bot: Bot):
     logger.trace(f"Bot {bot.adapter.get_name()} {bot.self_id} online")
-    bot_nums_gauge.labels(bot.self_id, bot.adapter.get_name()).inc()
+    labelvalues = (bot.self_id, bot.adapter.get_name())
+    bot_nums_gauge.labels(*labelvalues).inc()
+    # 在线期间不清理该机器人的序列
+    bot_nums_tracker.pin(labelvalues)
+    bot_shutdown_tracker.pin(labelvalues)
 
 
 @driver.on_bot_disconnect
 async def handle_bot_disconnect(bot: Bot):
     logger.trace(f"Bot {bot.adapter.get_name()} {bot.self_id} offline")
-    bot_nums_gauge.labels(bot.self_id, bot.adapter.get_name()).dec()
-    bot_shutdown_counter.labels(bot.self_id, bot.adapter.get_name()).inc()
+    labelvalues = (bot.self_id, bot.adapter.get_name())
+    bot_nums_gauge.labels(*labelvalues).dec()
+    bot_shutdown_counter.labels(*labelvalues).inc()
+    bot_nums_tracker.touch(labelvalues)
+    bot_shutdown_tracker.touch(labelvalues)
+
 
+dropped_label_values_counter = Counter(
+    "nonebot_dropped_label_values",
+    "Total number of messages whose user_id label was folded into a shared value",
+    ["metric"],
+)
+
+received_user_guard = UserLabelGuard(
+    "nonebot_received_messages",
+    plugin_config.prometheus_user_label_mode,
+    plugin_config.prometheus_user_label_topk,
+    plugin_config.prometheus_user_label_buckets,
+    dropped_label_values_counter,
+)
+sent_user_guard = UserLabelGuard(
+    "nonebot_sent_messages",
+    plugin_config.prometheus_user_label_mode,
+    plugin_config.prometheus_user_label_topk,
+    plugin_config.prometheus_user_label_buckets,
+    dropped_label_values_counter,
+)
 
 received_messages_counter = Counter(
     "nonebot_received_messages",
     "Total number of received messages",
-    ["bot_id", "adapter_name", "user_id"],
+    received_user_guard.labelnames,
 )
 
 sent_messages_counter = Counter(
     "nonebot_sent_messages",
     "Total number of sent messages",
-    ["bot_id", "adapter_name", "user_id"],
+    sent_user_guard.labelnames,
+)
+
+received_messages_tracker = track(
+    "nonebot_received_messages", received_messages_counter, evicted_series_counter
+)
+sent_messages_tracker = track(
+    "nonebot_sent_messages", sent_messages_counter, evicted_series_counter
+)
+
+
+def bind_message_children(
+    counter: Counter, tracker: StaleSeriesTracker, totals: MessageTotals
+) -> Callable[[str, str, Optional[str]], Tuple[Tuple[str, ...], Any, List[int]]]:
+    """
+    创建按 (adapter, bot, user) 缓存已解析子序列的查找函数
+
+    缓存命中时只需一次字典查找，不再调用 `.labels()`；
+    同时返回该机器人在 totals 中的计数单元，与计数器在同一次调用中更新。
+    缓存键只包含字符串，不会持有已断开的 Bot 及其适配器；
+    子序列被清理后清空缓存，避免继续写入已移除的子序列
+    """
+
+    @lru_cache(maxsize=plugin_config.prometheus_child_cache_size)
+    def child(adapter_name: str, self_id: str, user: Optional[str]):
+        labelvalues = label_values(self_id, adapter_name, user)
+        return (
+            labelvalues,
+            counter.labels(*labelvalues),
+            totals.bot_cell(self_id, adapter_name),
+        )
+
+    tracker.on_evict(lambda _: child.cache_clear())
+    return child
+
+
+received_message_child = bind_message_children(
+    received_messages_counter, received_messages_tracker, received_totals
+)
+sent_message_child = bind_message_children(
+    sent_messages_counter, sent_messages_tracker, sent_totals
 )
 
 
+@lru_cache(maxsize=1024)
+def is_send_msg_api(adapter_name: str, api: str) -> bool:
+    """
+    判断 API 是否用于发送消息，结果按 (adapter, api) 缓存
+
+    优先使用 `PROMETHEUS_SEND_MSG_APIS` 中该适配器配置的 API 名称精确匹配，
+    否则按 `_` 拆分 API 名称，包含 `send_msg_apis` 中任一片段即视为发送消息
+    """
+    apis = plugin_config.prometheus_send_msg_apis.get(adapter_name)
+    if apis is not None:
+        return api in apis
+    return not set(api.split("_")).isdisjoint(send_msg_apis)
+
+
 @Bot.on_calling_api
 async def handle_api_call(bot: Bot, api: str, data: Dict[str, Any]):
-    if not set(api.split("_")).intersection(send_msg_apis):
+    adapter_name = bot.adapter.get_name()
+    if not is_send_msg_api(adapter_name, api):
         return
     try:
         event = current_event.get()
@@ -72,8 +206,12 @@ async def handle_api_call(bot: Bot, api: str, data: Dict[str, Any]):
         # 某些 event 类型（如 Discord 的 ApplicationCommandInteractionEvent）无法获取 user_id
         user_id = "-1"
         logger.debug(f"Get user_id failed: {e}")
-    logger.trace(f"Bot {bot.adapter.get_name()} {bot.self_id} sent msg")
-    sent_messages_counter.labels(bot.self_id, bot.adapter.get_name(), user_id).inc()
+    labelvalues, child, bot_cell = sent_message_child(
+        adapter_name, bot.self_id, sent_user_guard.user_label(user_id)
+    )
+    child.inc()
+    sent_totals.inc(bot_cell)
+    sent_messages_tracker.touch(labelvalues)
 
 
 matcher_calling_counter = Counter(
@@ -106,30 +244,83 @@ matcher_duration_histogram = Histogram(
     ),
 )
 
+matcher_calling_tracker = track(
+    "nonebot_matcher_calling", matcher_calling_counter, evicted_series_counter
+)
+matcher_duration_tracker = track(
+    "nonebot_matcher_duration_seconds",
+    matcher_duration_histogram,
+    evicted_series_counter,
+)
+
+
+MatcherChildren = Tuple[Tuple[str, ...], Any, Any, MatcherAggregate]
+MatcherKey = Tuple[Optional[str], Optional[str], Any]
+
+# 按是否有异常分开的 (plugin_id, module_name, lineno) -> (标签值, 调用次数子序列, 执行耗时子序列, 增量统计)。
+# 不以 matcher 类作为 key：reject/pause 每次都会创建新的临时 matcher 类，
+# 它们与原 matcher 共享同一个来源位置，按来源位置缓存不会随会话轮数增长。子序列被清理时清空缓存
+_matcher_children: Tuple[Dict[MatcherKey, MatcherChildren], ...] = ({}, {})
+
+
+def _clear_matcher_children(_):
+    for cache in _matcher_children:
+        cache.clear()
+
+
+matcher_calling_tracker.on_evict(_clear_matcher_children)
+matcher_duration_tracker.on_evict(_clear_matcher_children)
+matcher_calling_tracker.on_evict(
+    lambda labelvalues: matcher_aggregates.discard(
+        labelvalues[0], labelvalues[1], labelvalues[2] == "True"
+    )
+)
+
+
+def _bind_matcher_children(key: MatcherKey, has_exception: bool) -> MatcherChildren:
+    plugin_id, module_name, lineno = key
+    # 因为一般不会给 matcher 命名，这里使用 module_name + line_number 作为 matcher_name
+    matcher_name = f"{module_name}#L{lineno}"
+    labelvalues = (str(plugin_id), matcher_name, str(has_exception))
+    return (
+        labelvalues,
+        matcher_calling_counter.labels(*labelvalues),
+        matcher_duration_histogram.labels(*labelvalues),
+        matcher_aggregates.get(labelvalues[0], matcher_name),
+    )
+
 
 @run_preprocessor
 async def handle_preprocessor(matcher: Matcher):
-    matcher.state.update({"_prometheus_start_time": time.time()})
+    # perf_counter_ns 单调且不受系统时间调整影响
+    matcher.state["_prometheus_start_time"] = time.perf_counter_ns()
 
 
 @run_postprocessor
 async def handle_postprocessor(matcher: Matcher, exception: Optional[Exception]):
+    end = time.perf_counter_ns()
     if (
         matcher.plugin_id == "nonebot_plugin_prometheus"
         and matcher.priority != MAGIC_PRIORITY
     ):
         # 跳过本模块的 matcher
         return
-    # 因为一般不会给 matcher 命名，这里使用 module_name + line_number 作为 matcher_name
-    lineno = getattr(getattr(matcher, "_source", None), "lineno", "unknown")
-    matcher_name = f"{matcher.module_name}#L{lineno}"
     has_exception = exception is not None
-    duration = time.time() - matcher.state["_prometheus_start_time"]
-    logger.debug(
-        f"Matcher {matcher_name} duration: {duration}s, has exception {has_exception}"
+    cache = _matcher_children[has_exception]
+    key = (
+        matcher.plugin_id,
+        matcher.module_name,
+        getattr(getattr(matcher, "_source", None), "lineno", "unknown"),
     )
+    try:
+        children = cache[key]
+    except KeyError:
+        children = cache[key] = _bind_matcher_children(key, has_exception)
 
-    matcher_calling_counter.labels(matcher.plugin_id, matcher_name, has_exception).inc()
-    matcher_duration_histogram.labels(
-        matcher.plugin_id, matcher_name, has_exception
-    ).observe(duration)
+    duration = (end - matcher.state["_prometheus_start_time"]) / 1e9
+    labelvalues, calling_child, duration_child, aggregate = children
+    calling_child.inc()
+    duration_child.observe(duration)
+    matcher_aggregates.observe(aggregate, has_exception, duration)
+    matcher_calling_tracker.touch(labelvalues)
+    matcher_duration_tracker.touch(labelvalues)
@@ -0,0 +1,246 @@
+import glob
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from nonebot import get_driver, logger
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.metrics_core import Metric
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+from nonebot_plugin_prometheus.config import plugin_config
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# prometheus_client 在导入时根据该环境变量决定是否使用 mmap 文件保存指标值，
+# 因此只能通过环境变量开启，不能通过插件配置开启
+MULTIPROC_DIR: Optional[str] = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or None
+
+# 已退出进程的这些文件会被合并到 `<类型>_archive.db` 中；
+# `mostrecent` 模式的仪表盘按时间戳保留最新的值合并，
+# `all` 模式的仪表盘按 pid 区分序列，进程退出后直接删除，live 模式的仪表盘由 mark_process_dead 删除
+ARCHIVE_PREFIXES = (
+    "counter",
+    "histogram",
+    "summary",
+    "gauge_sum",
+    "gauge_min",
+    "gauge_max",
+)
+MOST_RECENT_PREFIX = "gauge_mostrecent"
+ARCHIVE_ID = "archive"
+
+
+def _file_pid(path: str) -> str:
+    """mmap 文件名中的进程标识，如 `counter_123.db`、`gauge_livesum_123.db` 中的 123"""
+    return os.path.basename(path)[: -len(".db")].rsplit("_", 1)[-1]
+
+
+def _file_prefix(path: str) -> str:
+    return os.path.basename(path)[: -len(".db")].rsplit("_", 1)[0]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ArchivingMultiProcessCollector(MultiProcessCollector):
+    """
+    多进程模式下的指标收集器
+
+    抓取时合并目录中所有进程的 mmap 文件。worker 重启后旧进程的文件不会再变化，
+    如果一直保留，文件数量会随重启次数增长、抓取越来越慢，因此定期清理已退出的进程：
+    删除其 live 模式和 all 模式的仪表盘文件，并把计数器、直方图、其余模式的仪表盘
+    合并进归档文件，使文件数量只与存活的 worker 数量相关。
+
+    归档与抓取通过目录中的文件锁互斥，避免抓取到合并了一半的数据导致计数器回退。
+    """
+
+    def __init__(
+        self, registry: Optional[CollectorRegistry], path: str, interval: float
+    ):
+        super().__init__(registry, path)
+        self.interval = interval
+        self._lock_path = os.path.join(path, ".archive.lock")
+        self._last_cleanup = 0.0
+        self._cleanup_lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def dead_pids(self) -> Set[str]:
+        """目录中已经退出的进程，只能识别同一 PID 命名空间中以数字 PID 命名的文件"""
+        current = str(os.getpid())
+        pids = set()
+        for path in glob.glob(os.path.join(self._path, "*.db")):
+            pid = _file_pid(path)
+            if pid != current and pid.isdigit() and not _pid_alive(int(pid)):
+                pids.add(pid)
+        return pids
+
+    def archive(self, pids: Iterable[str]):
+        """清理指定进程的文件，合并可以合并的数据到归档文件中"""
+        pids = set(pids)
+        if not pids:
+            return
+        with self._file_lock(exclusive=True):
+            for pid in pids:
+                mark_process_dead(pid, self._path)
+            if fcntl is None:
+                # 没有文件锁时无法保证抓取看到一致的数据，只清理 live 仪表盘文件
+                return
+            by_prefix: Dict[str, List[str]] = {}
+            for path in glob.glob(os.path.join(self._path, "*.db")):
+                if _file_pid(path) in pids:
+                    by_prefix.setdefault(_file_prefix(path), []).append(path)
+            for prefix, files in by_prefix.items():
+                if prefix in ARCHIVE_PREFIXES:
+                    self._merge_into_archive(prefix, files)
+                elif prefix == MOST_RECENT_PREFIX:
+                    self._merge_most_recent(files)
+                # 其余文件（all 模式的仪表盘）的序列带有 pid 标签，进程退出后不再更新，直接删除
+                for path in files:
+                    os.remove(path)
+        logger.info(f"已清理退出进程的指标文件: {', '.join(sorted(pids))}")
+
+    def _merge_into_archive(self, prefix: str, files: List[str]):
+        archive_path = os.path.join(self._path, f"{prefix}_{ARCHIVE_ID}.db")
+        tmp_path = archive_path + ".tmp"
+        sources = files + ([archive_path] if os.path.exists(archive_path) else [])
+        # accumulate=False 保留直方图的非累计分桶，与文件中的存储格式一致
+        metrics: Iterable[Metric] = self.merge(sources, accumulate=False)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        archive = MmapedDict(tmp_path)
+        try:
+            for metric in metrics:
+                for sample in metric.samples:
+                    labels = {k: v for k, v in sample.labels.items() if k != "pid"}
+                    key = mmap_key(
+                        metric.name,
+                        sample.name,
+                        list(labels),
+                        list(labels.values()),
+                        metric.documentation,
+                    )
+                    archive.write_value(key, sample.value, 0.0)
+        finally:
+            archive.close()
+        os.replace(tmp_path, archive_path)
+
+    def _merge_most_recent(self, files: List[str]):
+        """按时间戳保留每个序列最新的值，合并进 mostrecent 模式仪表盘的归档文件"""
+        archive_path = os.path.join(self._path, f"{MOST_RECENT_PREFIX}_{ARCHIVE_ID}.db")
+        tmp_path = archive_path + ".tmp"
+        sources = files + ([archive_path] if os.path.exists(archive_path) else [])
+        latest: Dict[str, Tuple[float, float]] = {}
+        for path in sources:
+            for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(path):
+                current = latest.get(key)
+                if current is None or timestamp > current[1]:
+                    latest[key] = (value, timestamp)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        archive = MmapedDict(tmp_path)
+        try:
+            for key, (value, timestamp) in latest.items():
+                archive.write_value(key, value, timestamp)
+        finally:
+            archive.close()
+        os.replace(tmp_path, archive_path)
+
+    def cleanup(self):
+        """距离上次清理超过间隔时清理已退出的进程"""
+        if self.interval <= 0 or time.monotonic() - self._last_cleanup < self.interval:
+            return
+        if not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_cleanup = time.monotonic()
+            self.archive(self.dead_pids())
+        except OSError as e:
+            logger.error(f"清理退出进程的指标文件失败: {e}")
+        finally:
+            self._cleanup_lock.release()
+
+    def collect(self):
+        self.cleanup()
+        with self._file_lock(exclusive=False):
+            return super().collect()
+
+
+_registry: Optional[CollectorRegistry] = None
+_collector: Optional[ArchivingMultiProcessCollector] = None
+
+
+def get_exposition_registry() -> CollectorRegistry:
+    """
+    获取用于 /metrics 输出的注册表
+
+    多进程模式下返回汇总所有 worker 的注册表，注册表只创建一次并在后续抓取中复用；
+    否则返回默认注册表
+    """
+    global _registry, _collector
+    if MULTIPROC_DIR is None:
+        return REGISTRY
+    if _registry is None:
+        registry = CollectorRegistry()
+        try:
+            _collector = ArchivingMultiProcessCollector(
+                registry,
+                MULTIPROC_DIR,
+                plugin_config.prometheus_multiproc_cleanup_interval,
+            )
+        except ValueError as e:
+            logger.error(f"开启多进程模式失败，只输出当前进程的指标: {e}")
+            _registry = REGISTRY
+            return _registry
+        _registry = registry
+    return _registry
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+def log_multiprocess_mode():
+    if MULTIPROC_DIR is not None:
+        logger.info(f"Prometheus 多进程模式已开启，指标目录: {MULTIPROC_DIR}")
+
+
+@driver.on_shutdown
+def cleanup_current_process():
+    """当前进程退出时立即清理自己的文件，而不是等待其他 worker 发现"""
+    if (
+        MULTIPROC_DIR is None
+        or plugin_config.prometheus_multiproc_cleanup_interval <= 0
+    ):
+        return
+    get_exposition_registry()
+    if _collector is None:
+        return
+    try:
+        _collector.archive([str(os.getpid())])
+    except OSError as e:
+        logger.error(f"清理当前进程的指标文件失败: {e}")
@@ -0,0 +1,161 @@
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from nonebot_plugin_prometheus.config import plugin_config
+
+
+class Paginator:
+    """
+    把格式化器产生的行流按字符数切分为页面
+
+    行是按需从迭代器中取出的：只有翻到某一页时才会格式化该页的内容，
+    已经生成的页面会被保留，便于回到前面的页面。超过页面大小的单行会被强制拆分。
+    """
+
+    def __init__(self, lines: Iterable[str], page_size: int):
+        self.page_size = max(1, page_size)
+        self.pages: List[str] = []
+        self._lines: Iterator[str] = iter(lines)
+        self._pending: Optional[str] = None
+        self._exhausted = False
+
+    def _next_line(self) -> Optional[str]:
+        if self._pending is not None:
+            line, self._pending = self._pending, None
+            return line
+        if self._exhausted:
+            return None
+        line = next(self._lines, None)
+        if line is None:
+            self._exhausted = True
+        return line
+
+    def _render_next(self) -> bool:
+        """生成下一页，没有更多内容时返回 False"""
+        parts: List[str] = []
+        size = 0
+        while True:
+            line = self._next_line()
+            if line is None:
+                break
+            if size + len(line) > self.page_size:
+                if parts:
+                    self._pending = line
+                    break
+                # 单行超过页面大小，拆分后剩余部分留到下一页
+                parts.append(line[: self.page_size])
+                self._pending = line[self.page_size :]
+                break
+            parts.append(line)
+            size += len(line)
+        if not parts:
+            return False
+        self.pages.append("".join(parts).rstrip("\n"))
+        return True
+
+    def page(self, number: int) -> Optional[str]:
+        """返回第 number 页（从 1 开始），页码超出范围时返回 None"""
+        if number < 1:
+            return None
+        while len(self.pages) < number:
+            if not self._render_next():
+                return None
+        return self.pages[number - 1]
+
+    @property
+    def has_more(self) -> bool:
+        """当前已生成的最后一页之后是否还有内容"""
+        if self._pending is not None:
+            return True
+        if self._exhausted:
+            return False
+        line = self._next_line()
+        if line is None:
+            return False
+        self._pending = line
+        return True
+
+
+class PageSession:
+    """一个会话中正在浏览的分页结果"""
+
+    __slots__ = ("paginator", "current", "expires_at")
+
+    def __init__(self, paginator: Paginator, ttl: float):
+        self.paginator = paginator
+        self.current = 0
+        self.expires_at = time.monotonic() + ttl
+
+
+def _footer(number: int, has_more: bool) -> str:
+    footer = f"\n\n📄 第 {number} 页"
+    if has_more:
+        footer += "，发送 'metrics next' 查看下一页"
+    else:
+        footer += " (最后一页)"
+    return footer
+
+
+# 为页脚预留的字符数，按五位数页码的最长页脚计算
+FOOTER_RESERVE = len(_footer(99999, True))
+
+
+class PageSessions:
+    """
+    按会话保存分页状态，超过 TTL 未翻页的会话被丢弃
+
+    页面内容按 page_size 减去页脚长度切分，加上页脚后的消息不超过 page_size
+    """
+
+    def __init__(self, page_size: int, ttl: float):
+        self.page_size = max(1, page_size - FOOTER_RESERVE)
+        self.ttl = ttl
+        self._sessions: Dict[str, PageSession] = {}
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [k for k, v in self._sessions.items() if v.expires_at < now]
+        for key in expired:
+            del self._sessions[key]
+
+    def start(self, session_id: str, lines: Iterable[str]) -> Optional[str]:
+        """开始新的分页结果并返回第一页，替换该会话之前的分页状态"""
+        self._prune()
+        session = PageSession(Paginator(lines, self.page_size), self.ttl)
+        self._sessions[session_id] = session
+        return self._goto(session_id, session, 1)
+
+    def goto(self, session_id: str, number: int) -> Optional[str]:
+        """跳转到指定页，会话不存在或页码超出范围时返回 None"""
+        self._prune()
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        return self._goto(session_id, session, number)
+
+    def next(self, session_id: str) -> Optional[str]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        return self.goto(session_id, session.current + 1)
+
+    def _goto(
+        self, session_id: str, session: PageSession, number: int
+    ) -> Optional[str]:
+        text = session.paginator.page(number)
+        if text is None:
+            return None
+        session.current = number
+        session.expires_at = time.monotonic() + self.ttl
+        paginator = session.paginator
+        has_more = number < len(paginator.pages) or paginator.has_more
+        if not has_more and number == 1:
+            # 只有一页时不需要保留会话
+            del self._sessions[session_id]
+            return text
+        return text + _footer(number, has_more)
+
+
+page_sessions = PageSessions(
+    plugin_config.prometheus_chat_page_size, plugin_config.prometheus_chat_page_ttl
+)
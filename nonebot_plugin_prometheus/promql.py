@@ -0,0 +1,454 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple, Union
+
+from prometheus_client.metrics_core import Metric
+from prometheus_client.samples import Sample
+
+from nonebot_plugin_prometheus.catalog import TYPE_SUFFIXES, catalog
+from nonebot_plugin_prometheus.history import (
+    histogram_quantile,
+    history,
+    parse_duration,
+)
+from nonebot_plugin_prometheus.registry import iter_samples
+
+Labels = Dict[str, str]
+Vector = List[Tuple[Labels, float]]
+
+AGGREGATIONS = ("sum", "avg", "max", "min", "count", "topk")
+RANGE_FUNCTIONS = ("rate", "increase", "delta")
+
+
+class PromQLError(ValueError):
+    """查询语句解析或执行失败"""
+
+
+# ---------------------------------------------------------------- 语法树
+
+
+class LabelMatcher:
+    """标签匹配条件，支持 `=`、`!=`、`=~`、`!~`"""
+
+    __slots__ = ("name", "op", "value", "_pattern")
+
+    def __init__(self, name: str, op: str, value: str):
+        self.name = name
+        self.op = op
+        self.value = value
+        self._pattern = compile_regex(value) if op in ("=~", "!~") else None
+
+    def matches(self, value: str) -> bool:
+        if self.op == "=":
+            return value == self.value
+        if self.op == "!=":
+            return value != self.value
+        matched = self._pattern.fullmatch(value) is not None
+        return matched if self.op == "=~" else not matched
+
+
+class Selector:
+    """指标选择器，如 `name{label="value"}[5m]`"""
+
+    __slots__ = ("name", "matchers", "range")
+
+    def __init__(
+        self, name: Optional[str], matchers: List[LabelMatcher], range: Optional[float]
+    ):
+        self.name = name
+        self.matchers = matchers
+        self.range = range
+
+
+class Aggregation:
+    """聚合运算，如 `sum by (bot_id) (...)`、`topk(5, ...)`"""
+
+    __slots__ = ("op", "expr", "by", "param")
+
+    def __init__(
+        self, op: str, expr: "Node", by: Optional[List[str]], param: Optional[float]
+    ):
+        self.op = op
+        self.expr = expr
+        self.by = by
+        self.param = param
+
+
+class Call:
+    """函数调用，如 `rate(x[5m])`、`histogram_quantile(0.95, ...)`"""
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func: str, args: List["Node"]):
+        self.func = func
+        self.args = args
+
+
+class NumberLiteral:
+    __slots__ = ("value",)
+
+    def __init__(self, value: float):
+        self.value = value
+
+
+Node = Union[Selector, Aggregation, Call, NumberLiteral]
+
+
+@lru_cache(maxsize=256)
+def compile_regex(pattern: str) -> Pattern:
+    """编译正则表达式并缓存，与 PromQL 一致按完整匹配处理"""
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise PromQLError(f"无效的正则表达式 {pattern!r}: {e}") from e
+
+
+# ---------------------------------------------------------------- 词法和语法分析
+
+_TOKEN_RE = re.compile(
+    r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<duration>\[[^\]]*\])
+      | (?P<number>[0-9]+(?:\.[0-9]*)?(?:[eE][+-]?[0-9]+)?|\.[0-9]+)
+      | (?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+      | (?P<op>=~|!~|!=|=|[{}(),])
+    )
+    """,
+    re.VERBOSE,
+)
+_ESCAPES = {"n": "\n", "t": "\t", "\\": "\\", '"': '"', "'": "'"}
+
+
+def _unquote(text: str) -> str:
+    return re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)), text[1:-1])
+
+
+def _tokenize(query: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    query = query.rstrip()
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        if match is None or match.end() == pos:
+            raise PromQLError(f"无法解析位置 {pos} 处的内容: {query[pos : pos + 10]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, query: str):
+        self.tokens = _tokenize(query)
+        self.pos = 0
+
+    def peek(self) -> Tuple[str, str]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return ("eof", "")
+
+    def next(self) -> Tuple[str, str]:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, value: str):
+        kind, text = self.next()
+        if text != value or kind == "string":
+            raise PromQLError(f"缺少 {value!r}，得到 {text or '结尾'!r}")
+
+    def parse(self) -> Node:
+        node = self.expr()
+        if self.peek()[0] != "eof":
+            raise PromQLError(f"多余的内容: {self.peek()[1]!r}")
+        return node
+
+    def expr(self) -> Node:
+        kind, text = self.peek()
+        if kind == "number":
+            self.next()
+            return NumberLiteral(float(text))
+        # 与 PromQL 一致，聚合运算符和 by 关键字不区分大小写
+        if kind == "ident" and text.lower() in AGGREGATIONS:
+            return self.aggregation()
+        if kind == "ident" and self._is_call():
+            return self.call()
+        if kind == "ident" or text == "{":
+            return self.selector()
+        raise PromQLError(f"无法解析: {text!r}" if text else "查询语句不完整")
+
+    def _is_call(self) -> bool:
+        following = (
+            self.tokens[self.pos + 1] if self.pos + 1 < len(self.tokens) else None
+        )
+        return following is not None and following[1] == "("
+
+    def grouping(self) -> List[str]:
+        self.expect("(")
+        labels = []
+        while self.peek()[1] != ")":
+            kind, text = self.next()
+            if kind != "ident":
+                raise PromQLError(f"无效的标签名: {text!r}")
+            labels.append(text)
+            if self.peek()[1] == ",":
+                self.next()
+        self.expect(")")
+        return labels
+
+    def aggregation(self) -> Aggregation:
+        op = self.next()[1].lower()
+        by = None
+        if self.peek()[1].lower() == "by":
+            self.next()
+            by = self.grouping()
+        self.expect("(")
+        param = None
+        if op == "topk":
+            kind, text = self.next()
+            if kind != "number":
+                raise PromQLError("topk 的第一个参数需要是数字")
+            param = float(text)
+            self.expect(",")
+        expr = self.expr()
+        self.expect(")")
+        if self.peek()[1].lower() == "by":
+            self.next()
+            by = self.grouping()
+        return Aggregation(op, expr, by, param)
+
+    def call(self) -> Call:
+        func = self.next()[1]
+        self.expect("(")
+        args = []
+        while self.peek()[1] != ")":
+            args.append(self.expr())
+            if self.peek()[1] == ",":
+                self.next()
+        self.expect(")")
+        return Call(func, args)
+
+    def selector(self) -> Selector:
+        name = None
+        if self.peek()[0] == "ident":
+            name = self.next()[1]
+        matchers = []
+        if self.peek()[1] == "{":
+            self.next()
+            while self.peek()[1] != "}":
+                kind, label = self.next()
+                if kind != "ident":
+                    raise PromQLError(f"无效的标签名: {label!r}")
+                kind, op = self.next()
+                if op not in ("=", "!=", "=~", "!~"):
+                    raise PromQLError(f"无效的匹配运算符: {op!r}")
+                kind, value = self.next()
+                if kind == "string":
+                    value = _unquote(value)
+                elif kind not in ("ident", "number"):
+                    # 兼容旧的查询格式，允许不带引号的简单值
+                    raise PromQLError(f"标签 {label} 的值需要使用引号")
+                matchers.append(LabelMatcher(label, op, value))
+                if self.peek()[1] == ",":
+                    self.next()
+            self.expect("}")
+        if name is None and not matchers:
+            raise PromQLError("选择器至少需要指标名称或一个标签条件")
+        selector_range = None
+        if self.peek()[0] == "duration":
+            text = self.next()[1]
+            selector_range = parse_duration(text[1:-1])
+            if not selector_range:
+                raise PromQLError(f"无效的时间范围: {text}")
+        return Selector(name, matchers, selector_range)
+
+
+@lru_cache(maxsize=128)
+def parse(query: str) -> Node:
+    """解析查询语句，结果按语句缓存"""
+    return _Parser(query).parse()
+
+
+# ---------------------------------------------------------------- 执行
+
+
+def _sample_name(metric_name: str) -> str:
+    """把计数器等指标族名称转换为主要样本名称，如 `x` -> `x_total`"""
+    entry = catalog.get(metric_name)
+    if entry is not None and entry.type == "counter":
+        return metric_name + TYPE_SUFFIXES["counter"][0]
+    return metric_name
+
+
+def _select(selector: Selector) -> Vector:
+    """执行即时选择器，等值条件下推到 `iter_samples`，其余条件在遍历时过滤"""
+    labels = {}
+    others = []
+    for matcher in selector.matchers:
+        # 值为空的等值条件也匹配没有该标签的样本，不能下推
+        if matcher.op == "=" and matcher.value and matcher.name not in labels:
+            labels[matcher.name] = matcher.value
+        else:
+            others.append(matcher)
+
+    # 没有指标名称时，`__name__` 等值条件可以用目录确定需要收集的 collector
+    metric_name = selector.name
+    if metric_name is None and "__name__" in labels:
+        metric_name = labels.pop("__name__")
+    whole_family = metric_name is not None and catalog.get(metric_name) is not None
+
+    def predicate(metric_family: Metric, sample: Sample) -> bool:
+        if sample.name.endswith("_created"):
+            return False
+        if (
+            whole_family
+            and metric_family.type == "counter"
+            and not sample.name.endswith("_total")
+        ):
+            return False
+        for matcher in others:
+            value = (
+                sample.name
+                if matcher.name == "__name__"
+                else sample.labels.get(matcher.name, "")
+            )
+            if not matcher.matches(value):
+                return False
+        return True
+
+    return [
+        ({"__name__": sample.name, **sample.labels}, sample.value)
+        for _, sample in iter_samples(
+            metric_name, labels=labels or None, predicate=predicate
+        )
+    ]
+
+
+def _select_range(func: str, selector: Selector) -> Vector:
+    """在进程内历史记录上计算 rate/increase/delta"""
+    if history is None:
+        raise PromQLError(f"{func} 需要开启指标历史 (PROMETHEUS_HISTORY_RESOLUTION)")
+    if selector.name is None:
+        raise PromQLError(f"{func} 的选择器需要指定指标名称")
+    values = getattr(history, func)(_sample_name(selector.name), selector.range)
+    result = []
+    for labelset, value in values.items():
+        labels = dict(labelset)
+        if all(
+            matcher.matches(labels.get(matcher.name, ""))
+            for matcher in selector.matchers
+        ):
+            result.append((labels, value))
+    return result
+
+
+def _group_key(
+    labels: Labels, by: Optional[Sequence[str]]
+) -> Tuple[Tuple[str, str], ...]:
+    if by is None:
+        return ()
+    return tuple((label, labels.get(label, "")) for label in by)
+
+
+def _aggregate(node: Aggregation) -> Vector:
+    vector = evaluate(node.expr)
+    groups: Dict[Tuple[Tuple[str, str], ...], List[Tuple[Labels, float]]] = {}
+    for labels, value in vector:
+        groups.setdefault(_group_key(labels, node.by), []).append((labels, value))
+
+    if node.op == "topk":
+        k = int(node.param)
+        result = []
+        for items in groups.values():
+            result.extend(sorted(items, key=lambda x: x[1], reverse=True)[:k])
+        return result
+
+    result = []
+    for key, items in groups.items():
+        values = [value for _, value in items]
+        if node.op == "sum":
+            value = sum(values)
+        elif node.op == "avg":
+            value = sum(values) / len(values)
+        elif node.op == "max":
+            value = max(values)
+        elif node.op == "min":
+            value = min(values)
+        else:
+            value = float(len(values))
+        result.append((dict(key), value))
+    return result
+
+
+def _histogram_quantile(q: float, vector: Vector) -> Vector:
+    buckets: Dict[Tuple[Tuple[str, str], ...], List[Tuple[float, float]]] = {}
+    for labels, value in vector:
+        le = labels.get("le")
+        if le is None:
+            continue
+        key = tuple(
+            sorted((k, v) for k, v in labels.items() if k not in ("le", "__name__"))
+        )
+        buckets.setdefault(key, []).append((float(le), value))
+    return [(dict(key), histogram_quantile(q, items)) for key, items in buckets.items()]
+
+
+def _call(node: Call) -> Vector:
+    if node.func in RANGE_FUNCTIONS:
+        if len(node.args) != 1 or not isinstance(node.args[0], Selector):
+            raise PromQLError(
+                f"{node.func} 需要一个区间选择器参数，如 {node.func}(x[5m])"
+            )
+        selector = node.args[0]
+        if selector.range is None:
+            raise PromQLError(f"{node.func} 的参数需要指定时间范围，如 [5m]")
+        return _select_range(node.func, selector)
+    if node.func == "histogram_quantile":
+        if len(node.args) != 2 or not isinstance(node.args[0], NumberLiteral):
+            raise PromQLError("histogram_quantile 的参数为 (分位数, 表达式)")
+        return _histogram_quantile(node.args[0].value, evaluate(node.args[1]))
+    raise PromQLError(f"不支持的函数: {node.func}")
+
+
+def evaluate(node: Node) -> Vector:
+    """执行语法树，返回即时向量 [(标签, 值), ...]"""
+    if isinstance(node, Selector):
+        if node.range is not None:
+            raise PromQLError("区间选择器只能作为 rate/increase/delta 的参数")
+        return _select(node)
+    if isinstance(node, Aggregation):
+        return _aggregate(node)
+    if isinstance(node, Call):
+        return _call(node)
+    raise PromQLError("查询结果需要是向量")
+
+
+def query(text: str) -> List[Tuple[Tuple[Tuple[str, str], ...], float]]:
+    """
+    执行 PromQL 子集查询
+
+    支持：
+        - 选择器及 `=`、`!=`、`=~`、`!~` 标签匹配
+        - `sum`、`avg`、`max`、`min`、`count` 聚合及 `by (...)` 分组，`topk(k, ...)`
+        - `histogram_quantile(q, ...)`
+        - 基于进程内指标历史的 `rate`、`increase`、`delta`
+
+    Returns:
+        List[Tuple[Tuple[Tuple[str, str], ...], float]]:
+            与 `get_metric_values` 相同的格式，选择器结果的样本名称保存在 `__name__` 标签中
+    """
+    return [
+        (tuple(sorted(labels.items())), value)
+        for labels, value in evaluate(parse(text))
+        if not math.isnan(value)
+    ]
+
+
+def parse_selector(text: str) -> Selector:
+    """解析单个即时选择器"""
+    node = parse(text)
+    if not isinstance(node, Selector) or node.range is not None:
+        raise PromQLError(f"不是有效的指标选择器: {text}")
+    return node
@@ -0,0 +1,258 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import random
+import time
+import urllib.request
+from typing import Dict, List, NamedTuple, Optional
+from urllib.error import HTTPError
+from urllib.parse import quote
+
+from nonebot import get_driver, logger
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.metrics_core import Metric
+
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.metrics import metrics_push_counter
+from nonebot_plugin_prometheus.multiprocess import get_exposition_registry
+
+
+class PushBatch(NamedTuple):
+    """一次推送请求"""
+
+    method: str
+    body: bytes
+    # 指标族名称 -> 文本摘要，推送成功后记为已推送
+    digests: Dict[str, bytes]
+
+
+class _Family:
+    """只包含单个指标族的 collector，用于逐个编码指标族"""
+
+    __slots__ = ("metric",)
+
+    def __init__(self, metric: Metric):
+        self.metric = metric
+
+    def collect(self):
+        return [self.metric]
+
+
+def _escape_label(name: str, value: str) -> str:
+    # 值中包含 / 或为空时使用 Pushgateway 的 base64 编码形式
+    if not value or "/" in value:
+        encoded = base64.urlsafe_b64encode(value.encode()).decode()
+        return f"{name}@base64/{encoded or '='}"
+    return f"{name}/{quote(value, safe='')}"
+
+
+def build_push_url(base_url: str, job: str, grouping_key: Dict[str, str]) -> str:
+    """构造 Pushgateway 的分组地址 `<base>/metrics/job/<job>/<label>/<value>...`"""
+    parts = [_escape_label("job", job)]
+    parts.extend(_escape_label(k, v) for k, v in grouping_key.items())
+    return f"{base_url.rstrip('/')}/metrics/{'/'.join(parts)}"
+
+
+class PushError(Exception):
+    """不应重试的推送错误，例如 4xx 响应"""
+
+
+class PushExporter:
+    """
+    定时把指标推送到 Pushgateway
+
+    每个指标族单独编码并记录摘要，增量推送时只用 POST 发送与上次推送相比有变化的指标族，
+    Pushgateway 只替换同名指标族，未变化的保持不变；每隔全量推送间隔用 PUT 替换整个分组，
+    以清除已经消失的指标族。请求体按大小切分为多批，可选 gzip 压缩，
+    失败时按指数退避重试。编码和网络请求都在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        interval: float,
+        full_interval: float,
+        batch_bytes: int,
+        timeout: float,
+        retries: int,
+        backoff: float,
+        compress: bool,
+        headers: Dict[str, str],
+    ):
+        self.url = url
+        self.interval = interval
+        self.full_interval = full_interval
+        self.batch_bytes = max(1, batch_bytes)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.compress = compress
+        self.headers = headers
+        self._pushed: Dict[str, bytes] = {}
+        self._last_full: Optional[float] = None
+
+    def encode_families(self) -> Dict[str, bytes]:
+        """按指标族编码当前指标"""
+        return {
+            metric.name: generate_latest(_Family(metric))  # type: ignore[arg-type]
+            for metric in get_exposition_registry().collect()
+        }
+
+    def prepare(self, full: bool) -> List[PushBatch]:
+        """
+        生成本次需要发送的请求
+
+        全量推送时第一批使用 PUT 替换整个分组，其余批次使用 POST 追加；
+        增量推送时只包含内容有变化的指标族，全部使用 POST
+        """
+        batches: List[PushBatch] = []
+        parts: List[bytes] = []
+        digests: Dict[str, bytes] = {}
+        size = 0
+
+        def flush():
+            nonlocal parts, digests, size
+            method = "PUT" if full and not batches else "POST"
+            batches.append(PushBatch(method, b"".join(parts), digests))
+            parts, digests, size = [], {}, 0
+
+        for name, text in self.encode_families().items():
+            digest = hashlib.blake2b(text, digest_size=16).digest()
+            if not full and self._pushed.get(name) == digest:
+                continue
+            if parts and size + len(text) > self.batch_bytes:
+                flush()
+            parts.append(text)
+            digests[name] = digest
+            size += len(text)
+        if parts:
+            flush()
+        return batches
+
+    def send(self, method: str, body: bytes):
+        """发送一次请求，失败时抛出异常"""
+        headers = {"Content-Type": CONTENT_TYPE_LATEST, **self.headers}
+        if self.compress:
+            body = gzip.compress(
+                body, compresslevel=plugin_config.prometheus_gzip_level
+            )
+            headers["Content-Encoding"] = "gzip"
+        request = urllib.request.Request(
+            self.url, data=body, method=method, headers=headers
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except HTTPError as e:
+            # 服务端错误和限流可以重试，其余 4xx 说明请求本身有问题
+            if e.code < 500 and e.code != 429:
+                raise PushError(f"HTTP {e.code} {e.reason}") from e
+            raise
+
+    async def _send_with_retry(self, batch: PushBatch) -> bool:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                await loop.run_in_executor(None, self.send, batch.method, batch.body)
+                return True
+            except PushError as e:
+                logger.error(f"推送指标被拒绝: {e}")
+                return False
+            except OSError as e:
+                if attempt == self.retries:
+                    logger.error(f"推送指标失败，已重试 {self.retries} 次: {e}")
+                    return False
+                # 指数退避，加入随机抖动避免多个实例同时重试
+                delay = min(self.backoff * 2**attempt, self.interval)
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"推送指标失败，{delay:.1f} 秒后重试: {e}")
+                await asyncio.sleep(delay)
+        return False
+
+    async def push(self, full: Optional[bool] = None):
+        """
+        推送一次指标
+
+        Args:
+            full: 是否全量推送，为空时根据全量推送间隔决定
+        """
+        now = time.monotonic()
+        if full is None:
+            full = (
+                self.full_interval <= 0
+                or self._last_full is None
+                or now - self._last_full >= self.full_interval
+            )
+        loop = asyncio.get_running_loop()
+        batches = await loop.run_in_executor(None, self.prepare, full)
+        for batch in batches:
+            if not await self._send_with_retry(batch):
+                metrics_push_counter.labels("failure").inc()
+                return
+            if batch.method == "PUT":
+                # PUT 替换了整个分组，之前推送的指标族已不存在
+                self._pushed = {}
+                self._last_full = now
+            self._pushed.update(batch.digests)
+            metrics_push_counter.labels("success").inc()
+
+
+def _create_exporter() -> Optional[PushExporter]:
+    if not plugin_config.prometheus_push_url:
+        return None
+    return PushExporter(
+        build_push_url(
+            plugin_config.prometheus_push_url,
+            plugin_config.prometheus_push_job,
+            plugin_config.prometheus_push_grouping_key,
+        ),
+        interval=plugin_config.prometheus_push_interval,
+        full_interval=plugin_config.prometheus_push_full_interval,
+        batch_bytes=plugin_config.prometheus_push_batch_bytes,
+        timeout=plugin_config.prometheus_push_timeout,
+        retries=plugin_config.prometheus_push_retries,
+        backoff=plugin_config.prometheus_push_backoff,
+        compress=plugin_config.prometheus_push_gzip,
+        headers=plugin_config.prometheus_push_headers,
+    )
+
+
+exporter = _create_exporter()
+_push_task: Optional["asyncio.Task[None]"] = None
+
+
+async def _push_loop(exporter: PushExporter):
+    while True:
+        try:
+            await exporter.push()
+        except Exception as e:
+            logger.error(f"推送指标失败: {e}")
+        await asyncio.sleep(exporter.interval)
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def start_push():
+    global _push_task
+    if exporter is None:
+        return
+    logger.info(f"Prometheus 推送已开启，推送地址: {exporter.url}")
+    _push_task = asyncio.create_task(_push_loop(exporter))
+
+
+@driver.on_shutdown
+async def stop_push():
+    global _push_task
+    if _push_task is None:
+        return
+    _push_task.cancel()
+    _push_task = None
+    if exporter is not None:
+        # 退出前推送最后一次，避免丢失上次推送之后的数据
+        try:
+            await exporter.push(full=False)
+        except Exception as e:
+            logger.error(f"推送指标失败: {e}")
@@ -1,6 +1,8 @@
+import heapq
+import math
 import time
 from datetime import datetime, timedelta
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
 from nonebot import logger
 
@@ -22,48 +24,69 @@ def format_large_number(num: float) -> str:
         return f"{num:.0f}"
 
 
+from nonebot_plugin_prometheus.aggregates import (
+    matcher_aggregates,
+    received_totals,
+    sent_totals,
+)
+from nonebot_plugin_prometheus.catalog import TYPE_SUFFIXES, catalog
+from nonebot_plugin_prometheus.history import history, histogram_quantile
 from nonebot_plugin_prometheus.metrics import (
     bot_nums_gauge,
     bot_shutdown_counter,
-    matcher_calling_counter,
-    matcher_duration_histogram,
     metrics_request_counter,
     nonebot_start_at_gauge,
-    received_messages_counter,
-    sent_messages_counter,
 )
+from nonebot_plugin_prometheus.snapshot import CompactSnapshot
+from nonebot_plugin_prometheus.store import store
+
+# 各查询函数需要收集的 collector
+BOT_STATUS_COLLECTORS = (bot_nums_gauge, bot_shutdown_counter)
+SYSTEM_METRICS_COLLECTORS = (nonebot_start_at_gauge, metrics_request_counter)
+OVERVIEW_COLLECTORS = BOT_STATUS_COLLECTORS + SYSTEM_METRICS_COLLECTORS
+
+
+def get_overview_snapshot() -> CompactSnapshot:
+    """
+    一次性收集概览所需的全部指标
 
+    各查询函数共用同一个快照，每个 collector 只收集一次，
+    且所有数据来自同一时刻，收集过程中不会让出事件循环
+    """
+    return CompactSnapshot.collect(OVERVIEW_COLLECTORS)
 
-def get_bot_status() -> Dict[str, Any]:
+
+def get_bot_status(snapshot: Optional[CompactSnapshot] = None) -> Dict[str, Any]:
     """获取机器人状态信息"""
     try:
-        # 获取所有机器人样本
-        bot_samples = list(bot_nums_gauge.collect())[0].samples
-        online_bots = [sample for sample in bot_samples if sample.value > 0]
+        if snapshot is None:
+            snapshot = CompactSnapshot.collect(BOT_STATUS_COLLECTORS)
 
         # 获取掉线次数
-        shutdown_samples = list(bot_shutdown_counter.collect())[0].samples
         shutdown_counts = {
-            sample.labels["bot_id"]: int(sample.value)
-            for sample in shutdown_samples
-            if "_total" in sample.name
+            bot_id: int(value)
+            for (bot_id,), value in snapshot.sum_by(
+                "nonebot_bot_shutdown_total", ["bot_id"]
+            ).items()
         }
 
-        status_info = {"total_bots": len(online_bots), "bots": []}
-
-        for bot_sample in online_bots:
-            bot_id = bot_sample.labels["bot_id"]
-            adapter_name = bot_sample.labels["adapter_name"]
-            shutdown_count = shutdown_counts.get(bot_id, 0)
+        status_info = {"total_bots": 0, "bots": []}
 
+        # 获取所有在线的机器人
+        for labelset_id, value in snapshot.rows("nonebot_bot_nums"):
+            if value <= 0:
+                continue
+            labels = snapshot.labels_of(labelset_id)
+            bot_id = labels["bot_id"]
             status_info["bots"].append(
                 {
                     "bot_id": bot_id,
-                    "adapter": adapter_name,
+                    "adapter": labels["adapter_name"],
                     "status": "online",
-                    "shutdown_count": shutdown_count,
+                    "shutdown_count": shutdown_counts.get(bot_id, 0),
                 }
             )
+        status_info["total_bots"] = len(status_info["bots"])
 
         return status_info
     except Exception as e:
@@ -71,152 +94,215 @@ def get_bot_status() -> Dict[str, Any]:
         return {"total_bots": 0, "bots": [], "error": str(e)}
 
 
-def get_message_stats() -> Dict[str, Any]:
-    """获取消息统计信息"""
-    try:
-        # 接收消息统计 - 只获取 _total 指标
-        received_metric_data = list(received_messages_counter.collect())
-        received_samples = []
-        for metric_family in received_metric_data:
-            for sample in metric_family.samples:
-                # 只包含 _total 指标，排除 _created 指标
-                if sample.name.endswith("_total"):
-                    received_samples.append(sample)
-
-        # 发送消息统计 - 只获取 _total 指标
-        sent_metric_data = list(sent_messages_counter.collect())
-        sent_samples = []
-        for metric_family in sent_metric_data:
-            for sample in metric_family.samples:
-                # 只包含 _total 指标，排除 _created 指标
-                if sample.name.endswith("_total"):
-                    sent_samples.append(sample)
-
-        received_total = sum(sample.value for sample in received_samples)
-        sent_total = sum(sample.value for sample in sent_samples)
-
-        # 按机器人和用户分组统计
-        received_by_bot = {}
-        sent_by_bot = {}
-
-        for sample in received_samples:
-            bot_id = sample.labels.get("bot_id", "unknown")
-            adapter_name = sample.labels.get("adapter_name", "unknown")
-            bot_key = f"{bot_id}({adapter_name})"
-
-            if bot_key not in received_by_bot:
-                received_by_bot[bot_key] = {
-                    "bot_id": bot_id,
-                    "adapter_name": adapter_name,
-                    "count": 0,
-                }
-            received_by_bot[bot_key]["count"] += sample.value
+def _group_by_bot(totals: Dict[tuple, float]) -> Dict[str, Dict[str, Any]]:
+    """把按 (bot_id, adapter_name) 分组的结果转换为以 `bot_id(adapter_name)` 为键的字典"""
+    return {
+        f"{bot_id}({adapter_name})": {
+            "bot_id": bot_id,
+            "adapter_name": adapter_name,
+            "count": count,
+        }
+        for (bot_id, adapter_name), count in totals.items()
+    }
 
-        for sample in sent_samples:
-            bot_id = sample.labels.get("bot_id", "unknown")
-            adapter_name = sample.labels.get("adapter_name", "unknown")
-            bot_key = f"{bot_id}({adapter_name})"
 
-            if bot_key not in sent_by_bot:
-                sent_by_bot[bot_key] = {
-                    "bot_id": bot_id,
-                    "adapter_name": adapter_name,
-                    "count": 0,
-                }
-            sent_by_bot[bot_key]["count"] += sample.value
+def get_message_stats() -> Dict[str, Any]:
+    """
+    获取消息统计信息
+
+    总数由计数器热路径同步维护，查询开销只与机器人数量有关
+    """
+    try:
+        received = received_totals.by_bot()
+        sent = sent_totals.by_bot()
+        received_total = received_totals.total
+        sent_total = sent_totals.total
 
         logger.debug(
-            f"Message stats - Received: {received_total}, Sent: {sent_total}, Samples: {len(received_samples)}/{len(sent_samples)}"
+            f"Message stats - Received: {received_total}, Sent: {sent_total}, Bots: {len(received)}/{len(sent)}"
         )
 
         return {
             "total_received": received_total,
             "total_sent": sent_total,
-            "received_by_bot": received_by_bot,
-            "sent_by_bot": sent_by_bot,
+            "received_by_bot": _group_by_bot(received),
+            "sent_by_bot": _group_by_bot(sent),
         }
     except Exception as e:
         logger.error(f"获取消息统计失败: {e}")
         return {"total_received": 0, "total_sent": 0, "error": str(e)}
 
 
-def get_matcher_stats(limit: int = 10) -> Dict[str, Any]:
-    """获取匹配器统计信息"""
+def _sum_by_bot(values: Dict[tuple, float]) -> Dict[tuple, float]:
+    result: Dict[tuple, float] = {}
+    for labelset, value in values.items():
+        labels = dict(labelset)
+        key = (labels.get("bot_id", "unknown"), labels.get("adapter_name", "unknown"))
+        result[key] = result.get(key, 0.0) + value
+    return result
+
+
+def get_message_rates(window: float) -> Dict[str, Any]:
+    """获取时间窗口内的消息增量和每分钟速率，数据来自进程内历史记录"""
     try:
-        # 获取匹配器调用次数 - 只获取 _total 指标
-        calling_metric_data = list(matcher_calling_counter.collect())
-        calling_samples = []
-        for metric_family in calling_metric_data:
-            for sample in metric_family.samples:
-                # 只包含 _total 指标
-                if sample.name.endswith("_total"):
-                    calling_samples.append(sample)
-
-        # 获取匹配器执行时间 - 正确处理直方图样本
-        duration_metric_data = list(matcher_duration_histogram.collect())
-
-        # 统计信息
-        matcher_stats = {}
-
-        for sample in calling_samples:
-            plugin_id = sample.labels.get("plugin_id", "unknown")
-            matcher_name = sample.labels.get("matcher_name", "unknown")
-            has_exception = sample.labels.get("exception", "False") == "True"
-            call_count = sample.value
-
-            key = f"{plugin_id}:{matcher_name}"
-            if key not in matcher_stats:
-                matcher_stats[key] = {
-                    "plugin_id": plugin_id,
-                    "matcher_name": matcher_name,
-                    "call_count": 0,
-                    "error_count": 0,
-                    "total_duration": 0,
-                    "avg_duration": 0,
-                }
+        if history is None:
+            return {"error": "指标历史未开启 (PROMETHEUS_HISTORY_RESOLUTION=0)"}
 
-            matcher_stats[key]["call_count"] += call_count
-            if has_exception:
-                matcher_stats[key]["error_count"] += call_count
-
-        # 计算执行时间 - 使用直方图的 _sum 样本
-        for metric_family in duration_metric_data:
-            for sample in metric_family.samples:
-                if sample.name.endswith("_sum"):
-                    plugin_id = sample.labels.get("plugin_id", "unknown")
-                    matcher_name = sample.labels.get("matcher_name", "unknown")
-                    key = f"{plugin_id}:{matcher_name}"
-
-                    if key in matcher_stats:
-                        # 验证执行时间合理性
-                        if sample.value <= 3600 * 24:  # 24小时
-                            matcher_stats[key]["total_duration"] += sample.value
-
-        # 计算平均执行时间
-        for matcher in matcher_stats.values():
-            if matcher["call_count"] > 0:
-                matcher["avg_duration"] = (
-                    matcher["total_duration"] / matcher["call_count"]
-                )
-            else:
-                matcher["avg_duration"] = 0
-
-        # 按调用次数排序
-        sorted_matchers = sorted(
-            matcher_stats.values(), key=lambda x: x["call_count"], reverse=True
+        received = _sum_by_bot(
+            history.increase("nonebot_received_messages_total", window)
         )
+        sent = _sum_by_bot(history.increase("nonebot_sent_messages_total", window))
+        received_total = sum(received.values())
+        sent_total = sum(sent.values())
+        minutes = window / 60
+
+        return {
+            "window": window,
+            "total_received": received_total,
+            "total_sent": sent_total,
+            "received_per_minute": received_total / minutes,
+            "sent_per_minute": sent_total / minutes,
+            "received_by_bot": _group_by_bot(received),
+            "sent_by_bot": _group_by_bot(sent),
+        }
+    except Exception as e:
+        logger.error(f"获取消息速率失败: {e}")
+        return {"error": str(e)}
 
-        # 计算总调用次数
-        total_calls = sum(m["call_count"] for m in sorted_matchers)
-        total_errors = sum(m["error_count"] for m in sorted_matchers)
+
+def get_matcher_rates(window: float, limit: int = 10) -> Dict[str, Any]:
+    """获取时间窗口内的匹配器调用次数、错误次数和耗时分位数，数据来自进程内历史记录"""
+    try:
+        if history is None:
+            return {"error": "指标历史未开启 (PROMETHEUS_HISTORY_RESOLUTION=0)"}
+
+        matchers: Dict[tuple, Dict[str, Any]] = {}
+        for labelset, value in history.increase(
+            "nonebot_matcher_calling_total", window
+        ).items():
+            labels = dict(labelset)
+            key = (labels.get("plugin_id", ""), labels.get("matcher_name", ""))
+            stats = matchers.setdefault(
+                key,
+                {
+                    "plugin_id": key[0],
+                    "matcher_name": key[1],
+                    "call_count": 0.0,
+                    "error_count": 0.0,
+                },
+            )
+            stats["call_count"] += value
+            if labels.get("exception") == "True":
+                stats["error_count"] += value
+
+        buckets: Dict[float, float] = {}
+        for labelset, value in history.increase(
+            "nonebot_matcher_duration_seconds_bucket", window
+        ).items():
+            le = float(dict(labelset).get("le", "+Inf"))
+            buckets[le] = buckets.get(le, 0.0) + value
+        bucket_list = list(buckets.items())
+
+        active = [stats for stats in matchers.values() if stats["call_count"] > 0]
+        top_matchers = heapq.nlargest(limit, active, key=lambda x: x["call_count"])
+
+        return {
+            "window": window,
+            "total_calls": sum(stats["call_count"] for stats in active),
+            "total_errors": sum(stats["error_count"] for stats in active),
+            "top_matchers": top_matchers,
+            "p50": histogram_quantile(0.5, bucket_list),
+            "p95": histogram_quantile(0.95, bucket_list),
+            "p99": histogram_quantile(0.99, bucket_list),
+        }
+    except Exception as e:
+        logger.error(f"获取匹配器速率失败: {e}")
+        return {"error": str(e)}
+
+
+def _resolve_sample_name(metric_name: str) -> Tuple[str, bool]:
+    """把指标族名称解析为存储中的样本名称，返回 (样本名称, 是否为计数器类样本)"""
+    entry = catalog.get(metric_name)
+    if entry is not None and entry.type in TYPE_SUFFIXES:
+        metric_name += TYPE_SUFFIXES[entry.type][0]
+    entry = entry or catalog.get_by_sample_name(metric_name)
+    is_counter = entry is not None and entry.type != "gauge"
+    return metric_name, is_counter
+
+
+def get_metric_range(
+    metric_name: str, window: float, steps: int = 12
+) -> Dict[str, Any]:
+    """
+    从降采样存储中查询指标在时间窗口内的变化，结果按 steps 个区间汇总
+
+    计数器类样本返回每个区间内所有序列的增量之和，仪表盘返回每个区间末尾所有序列的值之和。
+    该函数会读取存储文件，在异步代码中应放到线程池中执行
+    """
+    try:
+        if store is None:
+            return {"error": "指标存储未开启 (PROMETHEUS_STORE_PATH)"}
+
+        sample_name, is_counter = _resolve_sample_name(metric_name)
+        end = time.time()
+        start = end - window
+        resolution, series = store.query(sample_name, start, end)
+        step = max(window / steps, resolution)
+        bins = [0.0] * math.ceil(window / step)
+        filled = [False] * len(bins)
+
+        for points in series.values():
+            last: Dict[int, float] = {}
+            prev = None
+            for timestamp, value in points:
+                index = min(int((timestamp - start) // step), len(bins) - 1)
+                if is_counter:
+                    if prev is not None:
+                        bins[index] += value - prev if value >= prev else value
+                        filled[index] = True
+                    prev = value
+                else:
+                    last[index] = value
+            for index, value in last.items():
+                bins[index] += value
+                filled[index] = True
+
+        rows = [
+            (start + (i + 1) * step, value if filled[i] else None)
+            for i, value in enumerate(bins)
+        ]
+        return {
+            "name": sample_name,
+            "window": window,
+            "step": step,
+            "resolution": resolution,
+            "kind": "increase" if is_counter else "value",
+            "series_count": len(series),
+            "rows": rows,
+        }
+    except Exception as e:
+        logger.error(f"查询指标历史失败: {e}")
+        return {"error": str(e)}
+
+
+def get_matcher_stats(limit: int = 10) -> Dict[str, Any]:
+    """
+    获取匹配器统计信息
+
+    统计由 postprocessor 增量维护，不需要收集计数器和直方图
+    """
+    try:
+        top_matchers = matcher_aggregates.top(limit)
+        total_calls = matcher_aggregates.total_calls
+        total_errors = matcher_aggregates.total_errors
 
         logger.debug(
-            f"Matcher stats - Total calls: {total_calls}, Total errors: {total_errors}, Matchers: {len(sorted_matchers)}"
+            f"Matcher stats - Total calls: {total_calls}, Total errors: {total_errors}, Matchers: {len(matcher_aggregates)}"
         )
 
         return {
-            "total_matchers": len(sorted_matchers),
-            "top_matchers": sorted_matchers[:limit],
+            "total_matchers": len(matcher_aggregates),
+            "top_matchers": top_matchers,
             "total_calls": total_calls,
             "total_errors": total_errors,
         }
@@ -225,20 +311,23 @@ def get_matcher_stats(limit: int = 10) -> Dict[str, Any]:
         return {"total_matchers": 0, "top_matchers": [], "error": str(e)}
 
 
-def get_system_metrics() -> Dict[str, Any]:
+def get_system_metrics(snapshot: Optional[CompactSnapshot] = None) -> Dict[str, Any]:
     """获取系统指标"""
     try:
+        if snapshot is None:
+            snapshot = CompactSnapshot.collect(SYSTEM_METRICS_COLLECTORS)
+
         # 获取启动时间
-        start_time_samples = list(nonebot_start_at_gauge.collect())[0].samples
-        if start_time_samples:
-            start_time = start_time_samples[0].value
+        start_time_rows = list(snapshot.rows("nonebot_start_at"))
+        if start_time_rows:
+            start_time = start_time_rows[0][1]
             uptime = time.time() - start_time
             uptime_str = str(timedelta(seconds=int(uptime)))
         else:
             uptime_str = "未知"
 
         # 获取指标请求次数
-        metrics_requests = list(metrics_request_counter.collect())[0].samples[0].value
+        metrics_requests = snapshot.sum("nonebot_metrics_requests_total")
 
         return {
             "uptime": uptime_str,
@@ -246,7 +335,7 @@ def get_system_metrics() -> Dict[str, Any]:
             "start_time": datetime.fromtimestamp(start_time).strftime(
                 "%Y-%m-%d %H:%M:%S"
             )
-            if start_time_samples
+            if start_time_rows
             else "未知",
         }
     except Exception as e:
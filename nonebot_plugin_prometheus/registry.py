@@ -1,7 +1,147 @@
-from typing import Any, Dict, List, Tuple, Optional
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 from prometheus_client import REGISTRY
+from prometheus_client.metrics_core import Metric
+from prometheus_client.samples import Sample
 from nonebot import logger
 
+from nonebot_plugin_prometheus.catalog import CatalogEntry, catalog
+from nonebot_plugin_prometheus.snapshot import CompactSnapshot
+
+
+def _sample_to_dict(sample: Sample) -> Dict[str, Any]:
+    return {
+        "name": sample.name,
+        "labels": tuple(sorted(sample.labels.items())),
+        "value": sample.value,
+        "timestamp": sample.timestamp,
+    }
+
+
+class SampleView(Sequence):
+    """按需把指标族的样本转换为 `get_metrics` 格式的字典，不复制样本列表"""
+
+    __slots__ = ("_samples",)
+
+    def __init__(self, samples: List[Sample]):
+        self._samples = samples
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [_sample_to_dict(sample) for sample in self._samples[index]]
+        return _sample_to_dict(self._samples[index])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return map(_sample_to_dict, self._samples)
+
+
+def _family_to_dict(metric_family: Metric, lazy: bool = False) -> Dict[str, Any]:
+    """把指标族转换为结构化数据，lazy 为 True 时样本在访问时才转换"""
+    return {
+        "name": metric_family.name,
+        "type": metric_family.type,
+        "help": metric_family.documentation,
+        "samples": (
+            SampleView(metric_family.samples)
+            if lazy
+            else [_sample_to_dict(sample) for sample in metric_family.samples]
+        ),
+    }
+
+
+def collect_entries(entries: Iterable[CatalogEntry]) -> Iterator[Metric]:
+    """只收集目录条目对应的 collector，并返回其中匹配的指标族"""
+    wanted: Dict[Any, set] = {}
+    for entry in entries:
+        wanted.setdefault(entry.collector, set()).add(entry.name)
+    for collector, names in wanted.items():
+        for metric_family in collector.collect():
+            if metric_family.name in names:
+                yield metric_family
+
+
+def iter_families(
+    metric_name: Optional[str] = None, metric_type: Optional[str] = None
+) -> Iterator[Metric]:
+    """
+    流式遍历指标族，名称和类型条件会先通过目录确定需要收集的 collector
+
+    Args:
+        metric_name: 可选的指标名称，匹配规则同 `get_metrics_by_name`
+        metric_type: 可选的指标类型
+
+    Yields:
+        Metric: 匹配的指标族
+    """
+    if metric_name is None and metric_type is None:
+        yield from REGISTRY.collect()
+        return
+    if metric_name is not None:
+        entries = catalog.match_name(metric_name)
+        if metric_type is not None:
+            entries = [entry for entry in entries if entry.type == metric_type]
+    else:
+        entries = catalog.by_type(metric_type)
+    yield from collect_entries(entries)
+
+
+def iter_samples(
+    metric_name: Optional[str] = None,
+    metric_type: Optional[str] = None,
+    labels: Optional[Dict[str, str]] = None,
+    predicate: Optional[Callable[[Metric, Sample], bool]] = None,
+) -> Iterator[Tuple[Metric, Sample]]:
+    """
+    流式遍历样本，过滤条件在遍历过程中直接应用，不会构造完整的中间结果
+
+    Args:
+        metric_name: 可选的指标名称；为带后缀的样本名称（如 `x_total`）时只返回该样本
+        metric_type: 可选的指标类型
+        labels: 可选的标签相等过滤条件，`__name__` 匹配样本名称
+        predicate: 可选的自定义过滤函数，参数为 (指标族, 样本)
+
+    Yields:
+        Tuple[Metric, Sample]: (所属指标族, 样本)
+    """
+    sample_filters: Dict[str, Optional[frozenset]] = {}
+    if metric_name is not None:
+        targets = [
+            (entry, names)
+            for entry, names in catalog.resolve(metric_name)
+            if metric_type is None or entry.type == metric_type
+        ]
+        sample_filters = {entry.name: names for entry, names in targets}
+        families = collect_entries(entry for entry, _ in targets)
+    else:
+        families = iter_families(metric_type=metric_type)
+
+    label_items = list(labels.items()) if labels else ()
+    for metric_family in families:
+        sample_names = sample_filters.get(metric_family.name)
+        for sample in metric_family.samples:
+            if sample_names is not None and sample.name not in sample_names:
+                continue
+            if label_items and not all(
+                (sample.name if key == "__name__" else sample.labels.get(key)) == value
+                for key, value in label_items
+            ):
+                continue
+            if predicate is not None and not predicate(metric_family, sample):
+                continue
+            yield metric_family, sample
+
 
 def get_metrics() -> Dict[str, Any]:
     """
@@ -32,24 +172,7 @@ def get_metrics() -> Dict[str, Any]:
 
         # 遍历注册表中的所有指标族
         for metric_family in REGISTRY.collect():
-            metric_info = {
-                "name": metric_family.name,
-                "type": metric_family.type,
-                "help": metric_family.documentation,
-                "samples": [],
-            }
-
-            # 处理每个样本
-            for sample in metric_family.samples:
-                sample_info = {
-                    "name": sample.name,
-                    "labels": tuple(sorted(sample.labels.items())),
-                    "value": sample.value,
-                    "timestamp": sample.timestamp,
-                }
-                metric_info["samples"].append(sample_info)
-
-            result["metrics"].append(metric_info)
+            result["metrics"].append(_family_to_dict(metric_family))
 
         logger.debug(f"Collected {len(result['metrics'])} metric families")
         return result
@@ -59,29 +182,40 @@ def get_metrics() -> Dict[str, Any]:
         return {"metrics": [], "error": str(e)}
 
 
-def get_metrics_by_name(metric_name: str) -> Dict[str, Any]:
+def get_compact_metrics(
+    metric_name: Optional[str] = None, metric_type: Optional[str] = None
+) -> CompactSnapshot:
+    """
+    获取列式存储的指标快照，适合对大量序列做聚合
+
+    Args:
+        metric_name: 可选的指标名称，匹配规则同 `get_metrics_by_name`
+        metric_type: 可选的指标类型
+
+    Returns:
+        CompactSnapshot: 指标快照，可通过 `to_dict()` 转换为 `get_metrics` 的格式
+    """
+    return CompactSnapshot.from_families(iter_families(metric_name, metric_type))
+
+
+def get_metrics_by_name(metric_name: str, lazy: bool = False) -> Dict[str, Any]:
     """
     根据指标名称获取特定的指标数据
 
     Args:
         metric_name: 指标名称（不包含后缀如 _total, _sum 等）
+        lazy: 为 True 时每个指标族的 samples 是只读序列，样本在访问时才转换为字典，
+            适合只查看部分样本的分页查询；指标族仍会被完整收集
 
     Returns:
         Dict[str, Any]: 指定指标的结构化数据
     """
     try:
-        all_metrics = get_metrics()
-        matching_metrics = []
-
-        for metric in all_metrics["metrics"]:
-            # 检查基础名称是否匹配
-            base_name = metric["name"]
-            if (
-                base_name == metric_name
-                or base_name.startswith(metric_name + "_")
-                or metric_name.startswith(base_name + "_")
-            ):
-                matching_metrics.append(metric)
+        # 先通过目录确定匹配的指标族，只收集对应的 collector
+        matching_metrics = [
+            _family_to_dict(metric_family, lazy)
+            for metric_family in collect_entries(catalog.match_name(metric_name))
+        ]
 
         return {
             "metric_name": metric_name,
@@ -105,12 +239,10 @@ def get_metrics_by_type(metric_type: str) -> Dict[str, Any]:
         Dict[str, Any]: 指定类型的所有指标数据
     """
     try:
-        all_metrics = get_metrics()
-        matching_metrics = []
-
-        for metric in all_metrics["metrics"]:
-            if metric["type"] == metric_type:
-                matching_metrics.append(metric)
+        matching_metrics = [
+            _family_to_dict(metric_family)
+            for metric_family in iter_families(metric_type=metric_type)
+        ]
 
         return {
             "type": metric_type,
@@ -138,33 +270,24 @@ def get_metric_values(
             [(((label1, value1), (label2, value2)), value), ...]
     """
     try:
-        result = []
-        metric_data = get_metrics_by_name(metric_name)
-
-        for metric in metric_data["metrics"]:
-            for sample in metric["samples"]:
-                # 对于 Counter 类型，只包含 _total 指标，排除 _created 指标
-                if metric["type"] == "counter" and not sample["name"].endswith(
-                    "_total"
-                ):
-                    continue
-
-                # 创建标签字典，添加指标名称作为 __name__
-                sample_labels_dict = dict(sample["labels"])
-                sample_labels_dict["__name__"] = sample["name"]
-
-                # 过滤标签
-                if labels:
-                    match = True
-                    for key, value in labels.items():
-                        if sample_labels_dict.get(key) != value:
-                            match = False
-                            break
-                    if not match:
-                        continue
-
-                # 添加到结果 - 使用原始标签（不包含 __name__）
-                result.append((sample["labels"], sample["value"]))
+        targets = catalog.resolve(metric_name)
+        # 查询的是指标族名称时，Counter 只包含 _total 样本，排除 _created 样本
+        whole_families = {entry.name for entry, names in targets if names is None}
+
+        def predicate(metric_family: Metric, sample: Sample) -> bool:
+            return not (
+                metric_family.type == "counter"
+                and metric_family.name in whole_families
+                and not sample.name.endswith("_total")
+            )
+
+        # 使用原始标签（不包含 __name__）
+        result = [
+            (tuple(sorted(sample.labels.items())), sample.value)
+            for _, sample in iter_samples(
+                metric_name, labels=labels, predicate=predicate
+            )
+        ]
 
         return result
 
@@ -181,18 +304,15 @@ def list_all_metrics() -> List[Dict[str, str]]:
         List[Dict[str, str]]: 指标列表，包含名称、类型和描述
     """
     try:
-        all_metrics = get_metrics()
-        metrics_list = []
-
-        for metric in all_metrics["metrics"]:
-            metrics_list.append(
-                {
-                    "name": metric["name"],
-                    "type": metric["type"],
-                    "help": metric["help"],
-                    "sample_count": len(metric["samples"]),
-                }
-            )
+        metrics_list = [
+            {
+                "name": metric_family.name,
+                "type": metric_family.type,
+                "help": metric_family.documentation,
+                "sample_count": len(metric_family.samples),
+            }
+            for metric_family in iter_families()
+        ]
 
         return sorted(metrics_list, key=lambda x: x["name"])
 
@@ -212,17 +332,17 @@ def search_metrics(keyword: str) -> List[Dict[str, str]]:
         List[Dict[str, str]]: 匹配的指标列表
     """
     try:
-        all_metrics = list_all_metrics()
-        keyword_lower = keyword.lower()
-
-        matched_metrics = []
-        for metric in all_metrics:
-            if (
-                keyword_lower in metric["name"].lower()
-                or keyword_lower in metric["help"].lower()
-                or keyword_lower in metric["type"].lower()
-            ):
-                matched_metrics.append(metric)
+        # 通过目录的关键字索引筛选，只收集匹配的指标以统计样本数量
+        matched_metrics = [
+            {
+                "name": metric_family.name,
+                "type": metric_family.type,
+                "help": metric_family.documentation,
+                "sample_count": len(metric_family.samples),
+            }
+            for metric_family in collect_entries(catalog.search(keyword))
+        ]
+        matched_metrics.sort(key=lambda x: x["name"])
 
         return matched_metrics
 
@@ -235,33 +355,27 @@ def parse_metric_filter(metric_query: str) -> tuple[str, Dict[str, str]]:
     """
     解析指标查询字符串，提取指标名称和标签过滤条件
 
+    使用 PromQL 选择器语法解析，标签值可以包含逗号、等号和转义的引号；
+    只返回等值（`=`）条件，完整的匹配条件请使用 `promql.parse_selector`
+
     Args:
         metric_query: 查询字符串，如 "http_requests_total{method="GET"}"
 
     Returns:
         tuple[str, Dict[str, str]]: (指标名称, 标签过滤条件)
     """
+    from nonebot_plugin_prometheus.promql import PromQLError, parse_selector
+
     try:
-        # 解析标签过滤
-        if "{" in metric_query and "}" in metric_query:
-            name_part, filter_part = metric_query.split("{", 1)
-            filter_part = filter_part.rstrip("}")
-
-            # 解析标签对
-            labels = {}
-            for pair in filter_part.split(","):
-                pair = pair.strip()
-                if "=" in pair:
-                    key, value = pair.split("=", 1)
-                    # 去除引号
-                    value = value.strip("\"'")
-                    labels[key.strip()] = value
-
-            return name_part.strip(), labels
-        else:
-            return metric_query.strip(), {}
+        selector = parse_selector(metric_query.strip())
+        labels = {
+            matcher.name: matcher.value
+            for matcher in selector.matchers
+            if matcher.op == "="
+        }
+        return selector.name or "", labels
 
-    except Exception as e:
+    except PromQLError as e:
         logger.error(f"解析指标查询失败: {e}")
         return metric_query.strip(), {}
 
@@ -271,22 +385,22 @@ def debug_metrics():
     调试函数：打印所有指标的概览信息
     """
     try:
-        all_metrics = get_metrics()
-        print(f"总共收集到 {len(all_metrics['metrics'])} 个指标族")
-
-        for metric in all_metrics["metrics"]:
-            print(f"指标: {metric['name']} ({metric['type']})")
-            print(f"  帮助信息: {metric['help']}")
-            print(f"  样本数量: {len(metric['samples'])}")
-
-            for sample in metric["samples"][:3]:  # 只显示前3个样本
-                print(
-                    f"    {sample['name']}: {sample['value']} {dict(sample['labels'])}"
-                )
-
-            if len(metric["samples"]) > 3:
-                print(f"    ... 还有 {len(metric['samples']) - 3} 个样本")
+        family_count = 0
+        for metric_family in iter_families():
+            family_count += 1
+            samples = metric_family.samples
+            print(f"指标: {metric_family.name} ({metric_family.type})")
+            print(f"  帮助信息: {metric_family.documentation}")
+            print(f"  样本数量: {len(samples)}")
+
+            for sample in samples[:3]:  # 只显示前3个样本
+                print(f"    {sample.name}: {sample.value} {sample.labels}")
+
+            if len(samples) > 3:
+                print(f"    ... 还有 {len(samples) - 3} 个样本")
             print()
 
+        print(f"总共收集到 {family_count} 个指标族")
+
     except Exception as e:
         print(f"调试失败: {e}")
@@ -0,0 +1,205 @@
+import sys
+from array import array
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from prometheus_client.metrics_core import Metric
+from prometheus_client.registry import Collector
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class FamilyInfo:
+    """快照中指标族的元信息，start/stop 为该指标族样本所在的行区间"""
+
+    __slots__ = ("name", "type", "help", "start", "stop")
+
+    def __init__(self, name: str, type: str, help: str, start: int, stop: int):
+        self.name = name
+        self.type = type
+        self.help = help
+        self.start = start
+        self.stop = stop
+
+
+class CompactSnapshot:
+    """
+    列式存储的指标快照
+
+    样本按行存放在几列定长数组中：样本名称 ID、标签集 ID 和值。样本名称和标签
+    字符串经过驻留，相同的标签集只保存一份，因此每个样本只占几个数组元素，
+    而不是一个字典。需要兼容旧接口时可以用 `to_dict` 转换为 `get_metrics` 的格式
+    （快照不保留样本时间戳）。
+    """
+
+    __slots__ = (
+        "families",
+        "sample_names",
+        "labelsets",
+        "name_ids",
+        "labelset_ids",
+        "values",
+        "_name_index",
+        "_labelset_index",
+        "_labelset_dicts",
+    )
+
+    def __init__(self):
+        self.families: List[FamilyInfo] = []
+        # 驻留后的样本名称和标签集
+        self.sample_names: List[str] = []
+        self.labelsets: List[LabelSet] = []
+        # 按行存储的列
+        self.name_ids = array("I")
+        self.labelset_ids = array("I")
+        self.values = array("d")
+        self._name_index: Dict[str, int] = {}
+        self._labelset_index: Dict[LabelSet, int] = {}
+        self._labelset_dicts: Dict[int, Dict[str, str]] = {}
+
+    @classmethod
+    def from_families(cls, families: Iterable[Metric]) -> "CompactSnapshot":
+        snapshot = cls()
+        for metric_family in families:
+            snapshot._append_family(metric_family)
+        return snapshot
+
+    @classmethod
+    def collect(cls, collectors: Iterable[Collector]) -> "CompactSnapshot":
+        """收集指定的 collector 生成快照，同一个 collector 只收集一次"""
+        seen = set()
+        snapshot = cls()
+        for collector in collectors:
+            if id(collector) in seen:
+                continue
+            seen.add(id(collector))
+            for metric_family in collector.collect():
+                snapshot._append_family(metric_family)
+        return snapshot
+
+    def _intern_name(self, name: str) -> int:
+        name_id = self._name_index.get(name)
+        if name_id is None:
+            name_id = self._name_index[name] = len(self.sample_names)
+            self.sample_names.append(sys.intern(name))
+        return name_id
+
+    def _intern_labelset(self, labels: Dict[str, str]) -> int:
+        labelset = tuple(sorted(labels.items()))
+        labelset_id = self._labelset_index.get(labelset)
+        if labelset_id is None:
+            labelset_id = self._labelset_index[labelset] = len(self.labelsets)
+            self.labelsets.append(
+                tuple((sys.intern(k), sys.intern(v)) for k, v in labelset)
+            )
+        return labelset_id
+
+    def _append_family(self, metric_family: Metric):
+        start = len(self.values)
+        for sample in metric_family.samples:
+            self.name_ids.append(self._intern_name(sample.name))
+            self.labelset_ids.append(self._intern_labelset(sample.labels))
+            self.values.append(sample.value)
+        self.families.append(
+            FamilyInfo(
+                metric_family.name,
+                metric_family.type,
+                metric_family.documentation,
+                start,
+                len(self.values),
+            )
+        )
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def family(self, name: str) -> Optional[FamilyInfo]:
+        for info in self.families:
+            if info.name == name:
+                return info
+        return None
+
+    def labels_of(self, labelset_id: int) -> Dict[str, str]:
+        """返回标签集对应的字典，结果按标签集缓存"""
+        labels = self._labelset_dicts.get(labelset_id)
+        if labels is None:
+            labels = self._labelset_dicts[labelset_id] = dict(
+                self.labelsets[labelset_id]
+            )
+        return labels
+
+    def rows(self, sample_name: str) -> Iterator[Tuple[int, float]]:
+        """遍历指定样本名称的所有行，返回 (标签集 ID, 值)"""
+        name_id = self._name_index.get(sample_name)
+        if name_id is None:
+            return
+        name_ids, labelset_ids, values = self.name_ids, self.labelset_ids, self.values
+        for i in range(len(values)):
+            if name_ids[i] == name_id:
+                yield labelset_ids[i], values[i]
+
+    def sum(self, sample_name: str) -> float:
+        return sum(value for _, value in self.rows(sample_name))
+
+    def sum_by(
+        self,
+        sample_name: str,
+        by: Sequence[str],
+        predicate: Optional[Callable[[Dict[str, str], float], bool]] = None,
+        default: str = "unknown",
+    ) -> Dict[Tuple[str, ...], float]:
+        """
+        按标签分组求和，类似 PromQL 的 `sum by (...)`
+
+        Args:
+            sample_name: 样本名称，如 `nonebot_received_messages_total`
+            by: 分组使用的标签名
+            predicate: 可选的过滤函数，参数为 (标签字典, 值)
+            default: 样本缺少分组标签时使用的值
+        """
+        keys: Dict[int, Tuple[str, ...]] = {}
+        result: Dict[Tuple[str, ...], float] = {}
+        for labelset_id, value in self.rows(sample_name):
+            if predicate is not None and not predicate(
+                self.labels_of(labelset_id), value
+            ):
+                continue
+            key = keys.get(labelset_id)
+            if key is None:
+                labels = self.labels_of(labelset_id)
+                key = keys[labelset_id] = tuple(
+                    labels.get(label, default) for label in by
+                )
+            result[key] = result.get(key, 0.0) + value
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为 `registry.get_metrics` 的结构化数据格式"""
+        metrics = []
+        for info in self.families:
+            metrics.append(
+                {
+                    "name": info.name,
+                    "type": info.type,
+                    "help": info.help,
+                    "samples": [
+                        {
+                            "name": self.sample_names[self.name_ids[i]],
+                            "labels": self.labelsets[self.labelset_ids[i]],
+                            "value": self.values[i],
+                            "timestamp": None,
+                        }
+                        for i in range(info.start, info.stop)
+                    ],
+                }
+            )
+        return {"metrics": metrics}
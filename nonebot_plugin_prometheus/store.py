@@ -0,0 +1,318 @@
+import asyncio
+import json
+import math
+import os
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from nonebot import get_driver, logger
+
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.history import SeriesKey, history
+from nonebot_plugin_prometheus.snapshot import LabelSet
+
+# 文件由两种记录组成：
+#   序列定义 S: [b"S", 序列 ID (uint32), 长度 (uint16)] + JSON [样本名称, 标签集]
+#   数据块   B: [b"B", 时间戳 (double), 点数 (uint32)] + 点数 × [序列 ID (uint32), 值 (double)]
+_SERIES_HEADER = struct.Struct("<cIH")
+_BUCKET_HEADER = struct.Struct("<cdI")
+_POINT = struct.Struct("<Id")
+
+Bucket = Tuple[float, List[Tuple[SeriesKey, float]]]
+
+
+class StoreTier:
+    """
+    单个降采样层级
+
+    每个分辨率区间只保留各序列最后一次采样的值，区间结束时追加写入文件。
+    文件超过保留时长或大小上限时重写，只保留保留时长内、且不超过大小上限的最新数据。
+
+    `observe` 只修改内存中的数据，可以在事件循环中调用；文件写入和重写由 `write`
+    完成，应在写入线程中调用。两者使用不同的锁，写入和查询读取文件时不会阻塞 `observe`
+    """
+
+    def __init__(self, path: Path, resolution: float, retention: float, max_bytes: int):
+        self.path = path
+        self.resolution = resolution
+        self.retention = retention
+        self.max_bytes = max_bytes
+        # 保护文件及 _ids，持有期间可能进行文件读写
+        self._file_lock = threading.Lock()
+        # 保护内存中的当前区间和待写入的数据块，只做短时间持有
+        self._lock = threading.Lock()
+        self._unwritten: List[Bucket] = []
+        self._ids: Dict[SeriesKey, int] = {}
+        self._first_ts = math.inf
+        self._pending_slot: Optional[int] = None
+        self._pending_ts = 0.0
+        self._pending: Dict[SeriesKey, float] = {}
+        self._load()
+
+    def _read_bytes(self) -> bytes:
+        try:
+            return self.path.read_bytes()
+        except FileNotFoundError:
+            return b""
+
+    def _read(self) -> Iterator[Bucket]:
+        return self._decode(self._read_bytes())
+
+    def _decode(self, data: bytes) -> Iterator[Bucket]:
+        """按写入顺序解码文件中的数据块，忽略末尾不完整的记录"""
+        series: Dict[int, SeriesKey] = {}
+        offset, size = 0, len(data)
+        while offset < size:
+            kind = data[offset : offset + 1]
+            if kind == b"S":
+                if offset + _SERIES_HEADER.size > size:
+                    return
+                _, series_id, length = _SERIES_HEADER.unpack_from(data, offset)
+                offset += _SERIES_HEADER.size
+                if offset + length > size:
+                    return
+                sample_name, labelset = json.loads(data[offset : offset + length])
+                series[series_id] = (
+                    sample_name,
+                    tuple((k, v) for k, v in labelset),
+                )
+                offset += length
+            elif kind == b"B":
+                if offset + _BUCKET_HEADER.size > size:
+                    return
+                _, timestamp, count = _BUCKET_HEADER.unpack_from(data, offset)
+                offset += _BUCKET_HEADER.size
+                if offset + count * _POINT.size > size:
+                    return
+                points = []
+                for _ in range(count):
+                    series_id, value = _POINT.unpack_from(data, offset)
+                    offset += _POINT.size
+                    key = series.get(series_id)
+                    if key is not None:
+                        points.append((key, value))
+                yield timestamp, points
+            else:
+                logger.warning(
+                    f"指标存储文件 {self.path} 在 {offset} 处损坏，忽略后续数据"
+                )
+                return
+
+    def _load(self):
+        buckets = list(self._read())
+        if buckets:
+            self._first_ts = buckets[0][0]
+            self._rewrite(buckets, buckets[-1][0])
+
+    def _encode(self, buckets: List[Bucket], ids: Dict[SeriesKey, int]) -> bytearray:
+        buffer = bytearray()
+        for timestamp, points in buckets:
+            for key, _ in points:
+                if key not in ids:
+                    ids[key] = series_id = len(ids)
+                    payload = json.dumps(key, ensure_ascii=False).encode()
+                    buffer += _SERIES_HEADER.pack(b"S", series_id, len(payload))
+                    buffer += payload
+            buffer += _BUCKET_HEADER.pack(b"B", timestamp, len(points))
+            for key, value in points:
+                buffer += _POINT.pack(ids[key], value)
+        return buffer
+
+    def _rewrite(self, buckets: List[Bucket], now: float):
+        """只保留保留时长内的数据块，仍超过大小上限时继续丢弃最旧的数据块"""
+        start = now - self.retention
+        buckets = [bucket for bucket in buckets if bucket[0] >= start]
+        ids: Dict[SeriesKey, int] = {}
+        data = self._encode(buckets, ids)
+        while buckets and len(data) > self.max_bytes * 3 // 4:
+            buckets = buckets[len(buckets) // 4 + 1 :]
+            ids = {}
+            data = self._encode(buckets, ids)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, self.path)
+        self._ids = ids
+        self._first_ts = buckets[0][0] if buckets else math.inf
+
+    def write(self):
+        """把已结束的区间写入文件，需要时重写文件；写入失败时保留数据块，下次写入时重试"""
+        with self._file_lock:
+            with self._lock:
+                buckets = list(self._unwritten)
+            if not buckets:
+                return
+            # 新序列的 ID 在写入成功后才生效，否则之后的数据块会引用文件中不存在的序列定义
+            ids = dict(self._ids)
+            data = self._encode(buckets, ids)
+            try:
+                with self.path.open("ab", buffering=0) as f:
+                    start = f.tell()
+                    try:
+                        if f.write(data) != len(data):
+                            raise OSError("写入不完整")
+                    except OSError:
+                        # 截掉不完整的记录，避免之后追加的数据接在其后无法解码
+                        f.truncate(start)
+                        raise
+                    size = f.tell()
+            except OSError as e:
+                logger.error(f"写入指标存储 {self.path} 失败: {e}")
+                return
+            self._ids = ids
+            with self._lock:
+                # 在持有文件锁时移除，查询不会同时在文件和待写入列表中看到同一个数据块
+                del self._unwritten[: len(buckets)]
+            self._first_ts = min(self._first_ts, buckets[0][0])
+            if (
+                size > self.max_bytes
+                # 超出保留时长的数据积累到四分之一时才重写，避免每次写入都重写文件
+                or buckets[-1][0] - self._first_ts > self.retention * 1.25
+            ):
+                try:
+                    self._rewrite(list(self._read()), buckets[-1][0])
+                except OSError as e:
+                    logger.error(f"重写指标存储 {self.path} 失败: {e}")
+
+    def flush(self):
+        """结束当前区间并写入文件"""
+        with self._lock:
+            self._pending_slot = None
+            self._rotate()
+        self.write()
+
+    def _rotate(self):
+        if self._pending:
+            self._unwritten.append((self._pending_ts, list(self._pending.items())))
+            self._pending = {}
+
+    def observe(self, now: float, values: Dict[SeriesKey, float]) -> bool:
+        """
+        记录一次采样值
+
+        Returns:
+            bool: 是否有区间结束，需要调用 `write` 写入文件
+        """
+        with self._lock:
+            slot = int(now // self.resolution)
+            rotated = False
+            if self._pending_slot is not None and slot != self._pending_slot:
+                self._rotate()
+                rotated = True
+            self._pending_slot = slot
+            self._pending_ts = now
+            self._pending.update(values)
+        return rotated
+
+    def query(
+        self, sample_name: str, start: float, end: float
+    ) -> Dict[LabelSet, List[Tuple[float, float]]]:
+        """读取时间范围内某个样本的所有序列，包括尚未写入文件的区间"""
+        with self._file_lock:
+            data = self._read_bytes()
+            with self._lock:
+                extra = list(self._unwritten)
+                if self._pending:
+                    extra.append((self._pending_ts, list(self._pending.items())))
+        # 解码在释放锁之后进行
+        result: Dict[LabelSet, List[Tuple[float, float]]] = {}
+        for timestamp, points in chain(self._decode(data), extra):
+            if not start <= timestamp <= end:
+                continue
+            for (name, labelset), value in points:
+                if name == sample_name:
+                    result.setdefault(labelset, []).append((timestamp, value))
+        return result
+
+
+class MetricStore:
+    """
+    嵌入式降采样指标存储
+
+    跟随进程内指标历史的每次记录，把数据降采样写入多个分辨率层级的文件中，
+    例如 10s 保留 1 天、1m 保留 7 天、1h 保留 90 天，查询时选择能覆盖时间范围的最细层级。
+    文件写入和重写在单独的写入线程中进行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self, directory: Path, tiers: List[Tuple[float, float]], max_bytes: int
+    ):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.tiers = [
+            StoreTier(
+                directory / f"tier_{int(resolution)}s.bin",
+                resolution,
+                retention,
+                max_bytes,
+            )
+            for resolution, retention in sorted(tiers)
+        ]
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="prometheus-store"
+        )
+
+    def observe(self, now: float, values: Dict[SeriesKey, float]):
+        for tier in self.tiers:
+            if tier.observe(now, values):
+                self._writer.submit(tier.write)
+
+    def flush(self):
+        for tier in self.tiers:
+            tier.flush()
+
+    def close(self) -> "Future[None]":
+        """在写入线程中写入所有层级的当前区间并关闭写入线程，返回写入完成的 Future"""
+        future = self._writer.submit(self.flush)
+        self._writer.shutdown(wait=False)
+        return future
+
+    def select(self, window: float) -> StoreTier:
+        """选择保留时长能覆盖时间窗口的最细层级，都不能覆盖时使用最粗的层级"""
+        for tier in self.tiers:
+            if tier.retention >= window:
+                return tier
+        return self.tiers[-1]
+
+    def query(
+        self, sample_name: str, start: float, end: float
+    ) -> Tuple[float, Dict[LabelSet, List[Tuple[float, float]]]]:
+        """
+        查询时间范围内某个样本的所有序列
+
+        Returns:
+            Tuple[float, Dict[LabelSet, List[Tuple[float, float]]]]:
+                (使用的层级分辨率, {标签集: [(时间戳, 值), ...]})
+        """
+        tier = self.select(end - start)
+        return tier.resolution, tier.query(sample_name, start, end)
+
+
+def _create_store() -> Optional[MetricStore]:
+    if not plugin_config.prometheus_store_path:
+        return None
+    if history is None:
+        logger.warning("指标存储依赖指标历史，请设置 PROMETHEUS_HISTORY_RESOLUTION")
+        return None
+    try:
+        store = MetricStore(
+            Path(plugin_config.prometheus_store_path),
+            [(tier[0], tier[1]) for tier in plugin_config.prometheus_store_tiers],
+            plugin_config.prometheus_store_max_bytes,
+        )
+    except OSError as e:
+        logger.error(f"打开指标存储失败: {e}")
+        return None
+    history.on_record(store.observe)
+    return store
+
+
+store = _create_store()
+
+
+@get_driver().on_shutdown
+async def flush_store():
+    if store is not None:
+        await asyncio.wrap_future(store.close())
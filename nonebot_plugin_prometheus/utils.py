@@ -1 +1,105 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Generic, Hashable, Tuple, TypeVar
+
 MAGIC_PRIORITY = 114514
+
+T = TypeVar("T")
+
+
+class SingleFlightCache(Generic[T]):
+    """
+    带 TTL 的单飞缓存
+
+    同一个 key 在缓存有效期内直接返回缓存结果；缓存失效时只有第一个调用方执行
+    计算，其余并发调用方共享同一个进行中的结果。内部使用线程锁和
+    `concurrent.futures.Future`，因此可以同时被事件循环和其他线程使用。
+    """
+
+    def __init__(self, ttl: float = 0.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values: Dict[Hashable, Tuple[float, T]] = {}
+        self._pending: Dict[Hashable, "Future[T]"] = {}
+
+    def acquire(self, key: Hashable) -> Tuple["Future[T]", bool]:
+        """
+        获取 key 对应的结果 Future
+
+        Returns:
+            Tuple[Future, bool]: (结果 Future, 调用方是否需要负责计算)
+        """
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                future: "Future[T]" = Future()
+                future.set_result(cached[1])
+                return future, False
+
+            future = self._pending.get(key)
+            if future is not None:
+                return future, False
+
+            future = Future()
+            self._pending[key] = future
+            return future, True
+
+    def fulfill(self, key: Hashable, future: "Future[T]", func: Callable[[], T]):
+        """执行计算并把结果写入缓存和 Future，只能由 `acquire` 返回的负责方调用"""
+        try:
+            value = func()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key, None)
+            future.set_exception(e)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._pending.pop(key, None)
+            if self.ttl > 0:
+                # 顺便清理过期条目，避免 key 无限增长
+                expired = [
+                    k for k, (t, _) in self._values.items() if now - t >= self.ttl
+                ]
+                for k in expired:
+                    del self._values[k]
+                self._values[key] = (now, value)
+        future.set_result(value)
+
+    def get(self, key: Hashable, func: Callable[[], T]) -> T:
+        """同步获取结果，缓存失效时在当前线程计算"""
+        future, owner = self.acquire(key)
+        if owner:
+            self.fulfill(key, future, func)
+        return future.result()
+
+    async def aget(
+        self, key: Hashable, func: Callable[[], T], in_thread: bool = False
+    ) -> T:
+        """
+        异步获取结果，缓存失效时计算
+
+        在事件循环中计算时，计算排在当前已就绪的回调之后，
+        同一轮到达的相同请求能先加入同一个 Future 共享结果
+
+        Args:
+            in_thread: 是否在事件循环的默认线程池中计算，计算期间到达的相同请求也共享结果
+        """
+        future, owner = self.acquire(key)
+        if owner:
+            loop = asyncio.get_running_loop()
+            if in_thread:
+                loop.run_in_executor(None, self.fulfill, key, future, func)
+            else:
+                loop.call_soon(self.fulfill, key, future, func)
+        if future.done():
+            # 缓存命中时直接返回，不需要经过事件循环
+            return future.result()
+        return await asyncio.wrap_future(future)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
@@ -0,0 +1,80 @@
+"""
+每次 matcher 运行的计时开销
+
+对比原先使用 time.time()、每次构造 matcher_name 并输出 debug 日志的实现，
+与当前使用 perf_counter_ns 并缓存子序列的 `handle_preprocessor`/`handle_postprocessor`
+
+用法：uv run python scripts/bench_matcher_timing.py [运行次数]
+"""
+
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+import nonebot
+
+nonebot.init()
+
+from nonebot import logger
+
+from nonebot_plugin_prometheus.metrics import (
+    handle_postprocessor,
+    handle_preprocessor,
+    matcher_calling_counter,
+    matcher_duration_histogram,
+)
+
+
+class FakeMatcher:
+    plugin_id = "bench"
+    module_name = "bench.plugins.echo"
+    priority = 1
+    _source = SimpleNamespace(lineno=42)
+
+    def __init__(self):
+        self.state = {}
+
+
+async def legacy_preprocessor(matcher):
+    matcher.state.update({"_prometheus_start_time": time.time()})
+
+
+async def legacy_postprocessor(matcher, exception: Optional[Exception]):
+    lineno = getattr(getattr(matcher, "_source", None), "lineno", "unknown")
+    matcher_name = f"{matcher.module_name}#L{lineno}"
+    has_exception = exception is not None
+    duration = time.time() - matcher.state["_prometheus_start_time"]
+    logger.debug(
+        f"Matcher {matcher_name} duration: {duration}s, has exception {has_exception}"
+    )
+    matcher_calling_counter.labels(matcher.plugin_id, matcher_name, has_exception).inc()
+    matcher_duration_histogram.labels(
+        matcher.plugin_id, matcher_name, has_exception
+    ).observe(duration)
+
+
+async def run(pre, post, runs: int) -> float:
+    matcher = FakeMatcher()
+    start = time.perf_counter()
+    for _ in range(runs):
+        await pre(matcher)
+        await post(matcher, None)
+    return time.perf_counter() - start
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f"{runs} 次 matcher 运行")
+    for name, pre, post in (
+        ("原实现", legacy_preprocessor, legacy_postprocessor),
+        ("当前实现", handle_preprocessor, handle_postprocessor),
+    ):
+        seconds = min(asyncio.run(run(pre, post, runs)) for _ in range(3))
+        print(f"{name}: {seconds / runs * 1e6:.2f} us/次")
+
+
+if __name__ == "__main__":
+    main()
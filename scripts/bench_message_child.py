@@ -0,0 +1,96 @@
+"""
+消息计数钩子的单条消息开销
+
+直接调用插件实际注册的 `MessageReceiveCounter.receive_wrapper` 和 `handle_api_call`，
+并与改动前的钩子实现（每条消息输出 trace 日志并调用 `.labels()`）对比
+
+用法：uv run python scripts/bench_message_child.py [用户数量] [消息数量]
+"""
+
+import asyncio
+import sys
+import time
+
+import nonebot
+
+nonebot.init()
+
+from nonebot import logger
+from nonebot.matcher import current_event
+
+from nonebot_plugin_prometheus.extension import MessageReceiveCounter
+from nonebot_plugin_prometheus.metrics import (
+    handle_api_call,
+    received_messages_counter,
+    sent_messages_counter,
+)
+
+
+class FakeAdapter:
+    @classmethod
+    def get_name(cls) -> str:
+        return "Fake"
+
+
+class FakeBot:
+    self_id = "10000"
+    adapter = FakeAdapter()
+
+
+class FakeEvent:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+
+    def get_user_id(self) -> str:
+        return self.user_id
+
+
+async def original_receive(bot, event, command, receive):
+    logger.trace(f"Bot {bot.adapter.get_name()} {bot.self_id} received msg")
+    received_messages_counter.labels(
+        bot.self_id, bot.adapter.get_name(), event.get_user_id()
+    ).inc()
+    return receive
+
+
+async def original_api_call(bot, api, data):
+    user_id = current_event.get().get_user_id()
+    logger.trace(f"Bot {bot.adapter.get_name()} {bot.self_id} sent msg")
+    sent_messages_counter.labels(bot.self_id, bot.adapter.get_name(), user_id).inc()
+
+
+async def run_receive(hook, bot, events) -> float:
+    start = time.perf_counter()
+    for event in events:
+        await hook(bot, event, None, None)
+    return time.perf_counter() - start
+
+
+async def run_api_call(hook, bot, events) -> float:
+    start = time.perf_counter()
+    for event in events:
+        current_event.set(event)
+        await hook(bot, "send_msg", {})
+    return time.perf_counter() - start
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    bot = FakeBot()
+    events = [FakeEvent(str(i % users)) for i in range(messages)]
+    print(f"{users} 个用户，{messages} 条消息")
+    cases = (
+        ("接收 原实现", run_receive, original_receive),
+        ("接收 receive_wrapper", run_receive, MessageReceiveCounter().receive_wrapper),
+        ("发送 原实现", run_api_call, original_api_call),
+        ("发送 handle_api_call", run_api_call, handle_api_call),
+    )
+    for name, runner, hook in cases:
+        seconds = min(asyncio.run(runner(hook, bot, events)) for _ in range(5))
+        print(f"{name}: {seconds / messages * 1e6:.2f} us/条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+/metrics 渲染对事件循环延迟的影响
+
+在事件循环中运行一个 1ms 的计时器，统计多次抓取期间计时器的最大延迟，
+分别测量在事件循环中渲染与开启 PROMETHEUS_RENDER_IN_THREAD 后在线程池中渲染的情况
+
+用法：uv run python scripts/bench_render_loop_lag.py [序列数量] [抓取次数]
+"""
+
+import asyncio
+import sys
+import time
+
+import nonebot
+
+nonebot.init()
+
+from prometheus_client import Counter
+
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.exposition import (
+    get_snapshot,
+    shutdown_render_executor,
+    snapshot_cache,
+)
+
+TICK = 0.001
+
+
+async def ticker(stop: asyncio.Event, lags: list):
+    expected = time.perf_counter() + TICK
+    while not stop.is_set():
+        await asyncio.sleep(TICK)
+        now = time.perf_counter()
+        lags.append(max(0.0, now - expected))
+        expected = now + TICK
+
+
+async def measure(in_thread: bool, scrapes: int) -> list:
+    plugin_config.prometheus_render_in_thread = in_thread
+    snapshot_cache.clear()
+    stop = asyncio.Event()
+    lags: list = []
+    task = asyncio.create_task(ticker(stop, lags))
+    await asyncio.sleep(0.05)
+    for _ in range(scrapes):
+        await get_snapshot()
+    stop.set()
+    await task
+    return lags
+
+
+def main():
+    series = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    counter = Counter("bench_messages", "Benchmark series", ["user_id"])
+    for i in range(series):
+        counter.labels(str(i)).inc()
+
+    print(f"{series} 条序列，{scrapes} 次抓取")
+    for in_thread in (False, True):
+        lags = asyncio.run(measure(in_thread, scrapes))
+        mode = "线程池渲染" if in_thread else "事件循环中渲染"
+        print(
+            f"{mode}: 最大延迟 {max(lags) * 1000:.1f} ms，"
+            f"平均延迟 {sum(lags) / len(lags) * 1000:.2f} ms"
+        )
+    shutdown_render_executor()
+
+
+if __name__ == "__main__":
+    main()
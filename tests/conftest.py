@@ -0,0 +1,4 @@
+import nonebot
+
+# 插件模块在导入时读取配置并注册驱动器钩子，需要先初始化 NoneBot
+nonebot.init()
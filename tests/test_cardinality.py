@@ -0,0 +1,72 @@
+from prometheus_client import CollectorRegistry, Counter
+
+from nonebot_plugin_prometheus.cardinality import (
+    OTHER_USER,
+    SpaceSaving,
+    UserLabelGuard,
+)
+
+
+def make_guard(mode: str, topk: int = 2, buckets: int = 4):
+    counter = Counter("dropped", "dropped", ["metric"], registry=CollectorRegistry())
+    guard = UserLabelGuard("messages", mode, topk, buckets, counter)
+    return guard, counter.labels("messages")
+
+
+def test_space_saving_counts_within_capacity():
+    sketch = SpaceSaving(3)
+    for item in "aabbbc":
+        sketch.offer(item)
+    assert len(sketch) == 3
+    assert sketch.offer("b") == (4, 0, None)
+    assert sketch.min_count == 1
+
+
+def test_space_saving_replaces_min_and_inherits_error():
+    sketch = SpaceSaving(2)
+    for item in "aab":
+        sketch.offer(item)
+    count, error, evicted = sketch.offer("c")
+    assert evicted == "b"
+    assert (count, error) == (2, 1)
+    assert "b" not in sketch
+    assert "c" in sketch
+    assert sketch.min_count == 2
+
+
+def test_space_saving_keeps_heavy_hitters():
+    sketch = SpaceSaving(4)
+    for i in range(1000):
+        sketch.offer("hot")
+        sketch.offer(f"cold{i}")
+    assert "hot" in sketch
+    assert sketch.offer("hot")[0] >= 1001
+
+
+def test_topk_promotes_frequent_users():
+    guard, dropped = make_guard("topk", topk=2)
+    labels = [guard.user_label(user) for user in ["a", "a", "a", "b", "c"]]
+    assert labels[2] == "a"
+    assert labels[-1] == OTHER_USER
+    assert dropped._value.get() >= 1
+
+
+def test_hash_counts_only_shared_buckets():
+    guard, dropped = make_guard("hash", buckets=1)
+    assert guard.user_label("a") == "hash_0"
+    assert guard.user_label("a") == "hash_0"
+    assert dropped._value.get() == 0
+    assert guard.user_label("b") == "hash_0"
+    assert dropped._value.get() == 1
+
+
+def test_full_and_drop_modes():
+    guard, dropped = make_guard("full")
+    assert guard.user_label("a") == "a"
+    assert guard.labelnames == ["bot_id", "adapter_name", "user_id"]
+    assert dropped._value.get() == 0
+
+    guard, dropped = make_guard("drop")
+    assert guard.user_label("a") is None
+    assert guard.labelnames == ["bot_id", "adapter_name"]
+    assert dropped._value.get() == 1
@@ -0,0 +1,63 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+from nonebot_plugin_prometheus.catalog import MetricCatalog
+
+
+def _registry():
+    registry = CollectorRegistry()
+    Counter("bot_messages", "Received messages", registry=registry)
+    Histogram("bot_latency_seconds", "Handler latency", registry=registry)
+    Gauge("queue_size", "Pending jobs", registry=registry)
+    return registry
+
+
+def test_lookup_by_name_prefix_and_type():
+    catalog = MetricCatalog(_registry())
+    assert catalog.get("bot_messages").type == "counter"
+    assert catalog.get_by_sample_name("bot_latency_seconds_bucket").name == (
+        "bot_latency_seconds"
+    )
+    assert [entry.name for entry in catalog.by_prefix("bot_")] == [
+        "bot_latency_seconds",
+        "bot_messages",
+    ]
+    assert [entry.name for entry in catalog.by_type("gauge")] == ["queue_size"]
+
+
+def test_resolve_and_match_name():
+    catalog = MetricCatalog(_registry())
+    [(entry, samples)] = catalog.resolve("bot_messages")
+    assert entry.name == "bot_messages" and samples is None
+    [(entry, samples)] = catalog.resolve("bot_messages_total")
+    assert entry.name == "bot_messages" and samples == {"bot_messages_total"}
+    assert [entry.name for entry, _ in catalog.resolve("bot")] == [
+        "bot_messages",
+        "bot_latency_seconds",
+    ]
+    assert catalog.resolve("missing") == []
+
+
+def test_search_is_case_insensitive():
+    catalog = MetricCatalog(_registry())
+    assert [entry.name for entry in catalog.search("LATENCY")] == [
+        "bot_latency_seconds"
+    ]
+    assert [entry.name for entry in catalog.search("jobs")] == ["queue_size"]
+    assert catalog.search("nothing here") == []
+
+
+def test_rebuilds_when_registry_changes():
+    registry = _registry()
+    catalog = MetricCatalog(registry)
+    generation = catalog.generation
+    assert catalog.generation == generation
+
+    extra = Counter("late_metric", "Registered later", registry=registry)
+    assert catalog.get("late_metric") is not None
+    assert catalog.generation == generation + 1
+
+    registry.unregister(extra)
+    assert catalog.get("late_metric") is None
+    assert catalog.generation == generation + 2
+    # 目录不修改注册表的方法
+    assert "register" not in vars(registry)
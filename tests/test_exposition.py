@@ -0,0 +1,37 @@
+import asyncio
+
+from prometheus_client import REGISTRY, Counter, generate_latest
+
+from nonebot_plugin_prometheus.exposition import (
+    SampleNameFilter,
+    expand_names,
+    get_snapshot,
+)
+
+exposition_test_counter = Counter("test_exposition_hits", "Hits for exposition tests")
+exposition_test_counter.inc()
+
+
+def test_expand_names_adds_sample_suffixes():
+    names = expand_names(["x"])
+    assert {"x", "x_total", "x_bucket", "x_count"} <= names
+
+
+def test_get_snapshot_filters_by_name():
+    snapshot = asyncio.run(get_snapshot(names=["test_exposition_hits"]))
+    lines = [
+        line
+        for line in snapshot.content.decode().splitlines()
+        if not line.startswith("#")
+    ]
+    assert lines[0].startswith("test_exposition_hits_total 1.0")
+    assert all(line.startswith("test_exposition_hits_") for line in lines)
+
+
+def test_sample_name_filter_filters_after_collect():
+    content = generate_latest(
+        SampleNameFilter(REGISTRY, frozenset(["test_exposition_hits_total"]))
+    ).decode()
+    assert "test_exposition_hits_total 1.0" in content
+    assert "test_exposition_hits_created" not in content
+    assert "nonebot_" not in content
@@ -0,0 +1,68 @@
+from itertools import islice
+
+from prometheus_client import Counter, Histogram
+
+from nonebot_plugin_prometheus import registry
+from nonebot_plugin_prometheus.formatter import (
+    format_complex_metric_samples,
+    format_simple_metric_samples,
+    iter_custom_metric,
+)
+from nonebot_plugin_prometheus.registry import get_metrics_by_name
+
+formatter_test_counter = Counter("test_formatter_hits", "Hits", ["user_id"])
+for i in range(1000):
+    formatter_test_counter.labels(str(i)).inc(i)
+formatter_test_histogram = Histogram(
+    "test_formatter_seconds", "Latency", ["user_id"], buckets=(0.1, 1.0)
+)
+formatter_test_histogram.labels("1").observe(0.5)
+
+
+def test_simple_samples_grouped_by_labels():
+    samples = [
+        {"name": "x_total", "labels": (("a", "1"),), "value": 2.0},
+        {"name": "x_created", "labels": (("a", "1"),), "value": 1.0},
+        {"name": "x_total", "labels": (), "value": 3.0},
+    ]
+    assert format_simple_metric_samples(samples) == (
+        '   📌 a="1"\n'
+        "      x_total: 2\n"
+        "      x_created: 1\n"
+        "   📌 (无标签)\n"
+        "      x_total: 3\n"
+    )
+
+
+def test_complex_samples_grouped_by_kind():
+    data = get_metrics_by_name("test_formatter_seconds", lazy=True)
+    [metric] = data["metrics"]
+    text = format_complex_metric_samples(metric["samples"], metric["type"])
+    assert text.index("总和") < text.index("计数") < text.index("分桶")
+    assert '      user_id="1": 0.500000\n' in text
+    assert '      le="+Inf", user_id="1": 1\n' in text
+
+
+def test_lazy_samples_match_eager_output():
+    eager = get_metrics_by_name("test_formatter_hits")
+    lazy = get_metrics_by_name("test_formatter_hits", lazy=True)
+    assert len(lazy["metrics"][0]["samples"]) == len(eager["metrics"][0]["samples"])
+    assert list(lazy["metrics"][0]["samples"]) == eager["metrics"][0]["samples"]
+    assert "".join(iter_custom_metric("x", lazy)) == "".join(
+        iter_custom_metric("x", eager)
+    )
+
+
+def test_first_page_converts_only_leading_samples(monkeypatch):
+    data = get_metrics_by_name("test_formatter_hits", lazy=True)
+    converted = []
+    to_dict = registry._sample_to_dict
+
+    def counting_to_dict(sample):
+        converted.append(sample)
+        return to_dict(sample)
+
+    monkeypatch.setattr(registry, "_sample_to_dict", counting_to_dict)
+    lines = list(islice(iter_custom_metric("test_formatter_hits", data), 20))
+    assert len(lines) == 20
+    assert len(converted) < 20
@@ -0,0 +1,107 @@
+import math
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from nonebot_plugin_prometheus.history import (
+    History,
+    histogram_quantile,
+    parse_duration,
+)
+from nonebot_plugin_prometheus.snapshot import CompactSnapshot
+
+INF = math.inf
+
+
+def test_parse_duration():
+    assert parse_duration("30") == 30
+    assert parse_duration("5m") == 300
+    assert parse_duration("1.5h") == 5400
+    assert parse_duration("7D") == 7 * 86400
+    assert parse_duration("5x") is None
+    assert parse_duration("") is None
+
+
+def test_histogram_quantile_interpolates_within_bucket():
+    buckets = [(0.1, 10.0), (0.5, 30.0), (INF, 40.0)]
+    assert histogram_quantile(0.25, buckets) == pytest.approx(0.1)
+    assert histogram_quantile(0.5, buckets) == pytest.approx(0.3)
+
+
+def test_histogram_quantile_sorts_buckets():
+    buckets = [(INF, 40.0), (0.5, 30.0), (0.1, 10.0)]
+    assert histogram_quantile(0.5, buckets) == pytest.approx(0.3)
+
+
+def test_histogram_quantile_inf_bucket_returns_largest_finite_bound():
+    assert histogram_quantile(0.99, [(0.1, 1.0), (INF, 10.0)]) == 0.1
+
+
+def test_histogram_quantile_without_data():
+    assert math.isnan(histogram_quantile(0.5, []))
+    assert math.isnan(histogram_quantile(0.5, [(0.1, 1.0)]))
+    assert math.isnan(histogram_quantile(0.5, [(0.1, 0.0), (INF, 0.0)]))
+
+
+def test_history_rate_increase_and_delta():
+    history = History(10, 60, {})
+    key = ("x_total", (("bot_id", "1"),))
+    for i, value in enumerate([0.0, 10.0, 20.0, 5.0]):
+        history.append({key: value}, now=1000 + i * 10)
+
+    assert history.increase("x_total", 60, now=1030) == {key[1]: 25.0}
+    assert history.rate("x_total", 60, now=1030) == {key[1]: pytest.approx(25 / 30)}
+    assert history.delta("x_total", 60, now=1030) == {key[1]: 5.0}
+    # 时间窗口内只有一个采样点时没有结果
+    assert history.increase("x_total", 5, now=1030) == {}
+
+
+def test_history_ring_buffer_drops_old_points_and_stale_series():
+    history = History(10, 20, {})
+    old = ("x_total", (("bot_id", "old"),))
+    new = ("x_total", (("bot_id", "new"),))
+    history.append({old: 1.0}, now=0)
+    for i in range(1, 5):
+        history.append({new: float(i)}, now=i * 10)
+
+    assert len(history) == history.capacity == 3
+    points = dict(history.points("x_total", 100, now=40))
+    assert list(points) == [new[1]]
+    assert [value for _, value in points[new[1]]] == [2.0, 3.0, 4.0]
+
+
+def test_history_notifies_listeners():
+    history = History(10, 60, {})
+    received = []
+    history.on_record(lambda now, values: received.append((now, values)))
+    history.append({("x", ()): 1.0}, now=5)
+    assert received == [(5, {("x", ()): 1.0})]
+    assert history.generation == 1
+
+
+def test_history_folded_counter_ignores_removed_series():
+    registry = CollectorRegistry()
+    counter = Counter("x", "x", ["bot_id", "user_id"], registry=registry)
+    gauge = Gauge("y", "y", ["bot_id", "user_id"], registry=registry)
+    history = History(10, 60, {"x": ["bot_id"], "y": ["bot_id"]})
+    counter.labels("1", "a").inc(100)
+    counter.labels("1", "b").inc(5)
+    gauge.labels("1", "a").set(3)
+    gauge.labels("1", "b").set(4)
+    history.record(CompactSnapshot.collect([registry]), now=0)
+
+    # 清理 user a 的子序列，合并后的和从 105 变为 6，实际增量只有 1
+    counter.remove("1", "a")
+    gauge.remove("1", "a")
+    counter.labels("1", "b").inc()
+    history.record(CompactSnapshot.collect([registry]), now=10)
+    labelset = (("bot_id", "1"),)
+    assert history.increase("x_total", 60, now=10) == {labelset: 1.0}
+    assert history.delta("y", 60, now=10) == {labelset: -3.0}
+
+    # 单个原始序列变小时仍视为重置，新出现的序列从 0 开始计数
+    counter.remove("1", "b")
+    counter.labels("1", "b").inc(2)
+    counter.labels("1", "c").inc(3)
+    history.record(CompactSnapshot.collect([registry]), now=20)
+    assert history.increase("x_total", 60, now=20) == {labelset: 6.0}
@@ -0,0 +1,71 @@
+import gzip
+import http.client
+
+import pytest
+from prometheus_client import Counter
+
+from nonebot_plugin_prometheus import listener
+from nonebot_plugin_prometheus.config import plugin_config
+from nonebot_plugin_prometheus.exposition import snapshot_cache
+
+listener_test_counter = Counter("test_listener_hits", "Hits for listener tests")
+listener_test_counter.inc()
+
+
+@pytest.fixture
+def connection():
+    listener.start_listener("127.0.0.1", 0)
+    assert listener._server is not None
+    port = listener._server.server_address[1]
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    yield conn
+    conn.close()
+    listener.stop_listener()
+
+
+def _get(conn, path, headers=None):
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    return response, response.read()
+
+
+def test_serves_metrics_with_keepalive(connection):
+    path = plugin_config.prometheus_metrics_path
+    response, body = _get(connection, path)
+    assert response.status == 200
+    assert response.getheader("Content-Type").startswith("text/plain")
+    assert b"test_listener_hits_total 1.0" in body
+
+    # 同一连接上的第二个请求
+    response, body = _get(connection, f"{path}?name[]=test_listener_hits")
+    assert response.status == 200
+    samples = [line for line in body.decode().splitlines() if line[:1] != "#"]
+    assert samples and all(line.startswith("test_listener_hits_") for line in samples)
+
+
+def test_unknown_path_returns_404(connection):
+    response, body = _get(connection, "/other")
+    assert response.status == 404
+    assert body == b"Not Found"
+
+
+def test_gzip_response(connection, monkeypatch):
+    monkeypatch.setattr(plugin_config, "prometheus_gzip_enable", True)
+    monkeypatch.setattr(plugin_config, "prometheus_gzip_min_size", 0)
+    snapshot_cache.clear()
+    response, body = _get(
+        connection,
+        f"{plugin_config.prometheus_metrics_path}?name[]=test_listener_hits",
+        {"Accept-Encoding": "gzip"},
+    )
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert b"test_listener_hits_total 1.0" in gzip.decompress(body)
+
+
+def test_stop_listener_closes_socket():
+    listener.start_listener("127.0.0.1", 0)
+    port = listener._server.server_address[1]
+    listener.stop_listener()
+    assert listener._server is None
+    with pytest.raises(OSError):
+        http.client.HTTPConnection("127.0.0.1", port, timeout=1).connect()
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+
+from nonebot_plugin_prometheus.multiprocess import ArchivingMultiProcessCollector
+
+
+def _exited_pid() -> str:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return str(process.pid)
+
+
+def _write(directory, prefix, pid, samples):
+    """samples: [(metric_name, sample_name, labels, value, timestamp)]"""
+    values = MmapedDict(os.path.join(directory, f"{prefix}_{pid}.db"))
+    try:
+        for metric_name, sample_name, labels, value, timestamp in samples:
+            key = mmap_key(
+                metric_name, sample_name, list(labels), list(labels.values()), "doc"
+            )
+            values.write_value(key, value, timestamp)
+    finally:
+        values.close()
+
+
+def _write_worker(directory, pid, value, timestamp):
+    _write(
+        directory,
+        "counter",
+        pid,
+        [("jobs", "jobs_total", {"bot_id": "1"}, value, 0.0)],
+    )
+    _write(
+        directory,
+        "histogram",
+        pid,
+        [
+            ("latency", "latency_bucket", {"le": "0.1"}, value, 0.0),
+            ("latency", "latency_bucket", {"le": "+Inf"}, value, 0.0),
+            ("latency", "latency_sum", {}, value / 4, 0.0),
+        ],
+    )
+    _write(
+        directory,
+        "gauge_mostrecent",
+        pid,
+        [("temperature", "temperature", {}, value, timestamp)],
+    )
+    _write(directory, "gauge_all", pid, [("memory", "memory", {}, value, 0.0)])
+    _write(directory, "gauge_livesum", pid, [("online", "online", {}, 1.0, 0.0)])
+
+
+def _values(collector):
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for metric in collector.collect()
+        for sample in metric.samples
+    }
+
+
+def test_archive_keeps_totals_and_live_files(tmp_path):
+    directory = str(tmp_path)
+    live = str(os.getppid())
+    first, second = _exited_pid(), _exited_pid()
+    _write_worker(directory, live, 1.0, 100.0)
+    _write_worker(directory, first, 2.0, 300.0)
+    _write_worker(directory, second, 4.0, 200.0)
+    collector = ArchivingMultiProcessCollector(None, directory, interval=0)
+    before = _values(collector)
+
+    assert collector.dead_pids() == {first, second}
+    collector.archive(collector.dead_pids())
+    after = _values(collector)
+
+    assert after[("jobs_total", (("bot_id", "1"),))] == 7.0
+    # 文件中保存的是非累计分桶，收集时累加
+    assert after[("latency_bucket", (("le", "+Inf"),))] == 14.0
+    assert after[("latency_count", ())] == 14.0
+    assert after[("temperature", ())] == 2.0
+    for key in ("jobs_total", "latency_bucket", "latency_sum", "temperature"):
+        assert {k: v for k, v in after.items() if k[0] == key} == {
+            k: v for k, v in before.items() if k[0] == key
+        }
+    # 退出进程的 all/live 仪表盘序列被删除，存活进程的保持不变
+    assert after[("memory", (("pid", live),))] == 1.0
+    assert ("memory", (("pid", first),)) not in after
+    assert after[("online", ())] == 1.0
+
+    files = set(os.listdir(directory))
+    assert not any(name.endswith((f"_{first}.db", f"_{second}.db")) for name in files)
+    for prefix in ("counter", "histogram", "gauge_mostrecent", "gauge_all"):
+        assert f"{prefix}_{live}.db" in files
+    assert {"counter_archive.db", "histogram_archive.db"} <= files
+    assert "gauge_mostrecent_archive.db" in files
+
+
+def test_archive_merges_into_existing_archive(tmp_path):
+    directory = str(tmp_path)
+    collector = ArchivingMultiProcessCollector(None, directory, interval=0)
+    first = _exited_pid()
+    _write_worker(directory, first, 2.0, 100.0)
+    collector.archive([first])
+    second = _exited_pid()
+    _write_worker(directory, second, 3.0, 50.0)
+    collector.archive([second])
+
+    values = _values(collector)
+    assert values[("jobs_total", (("bot_id", "1"),))] == 5.0
+    assert values[("latency_bucket", (("le", "0.1"),))] == 5.0
+    # 时间戳更早的值不会覆盖归档中较新的值
+    assert values[("temperature", ())] == 2.0
+    assert sorted(os.listdir(directory)) == [
+        ".archive.lock",
+        "counter_archive.db",
+        "gauge_mostrecent_archive.db",
+        "histogram_archive.db",
+    ]
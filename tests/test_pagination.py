@@ -0,0 +1,64 @@
+from nonebot_plugin_prometheus.pagination import PageSessions, Paginator
+
+
+def lines(count: int, width: int = 9):
+    return (f"{i:0{width - 1}d}\n" for i in range(count))
+
+
+def test_paginator_splits_on_line_boundaries():
+    paginator = Paginator(lines(10), page_size=30)
+    assert paginator.page(1) == "00000000\n00000001\n00000002"
+    assert paginator.page(4) == "00000009"
+    assert paginator.page(5) is None
+    assert paginator.page(0) is None
+    assert not paginator.has_more
+
+
+def test_paginator_is_lazy():
+    consumed = []
+
+    def produce():
+        for i in range(100):
+            consumed.append(i)
+            yield f"{i}\n"
+
+    paginator = Paginator(produce(), page_size=10)
+    paginator.page(1)
+    assert len(consumed) < 10
+    assert paginator.has_more
+
+
+def test_paginator_splits_long_lines():
+    paginator = Paginator(["x" * 25], page_size=10)
+    assert [paginator.page(i) for i in (1, 2, 3, 4)] == [
+        "x" * 10,
+        "x" * 10,
+        "x" * 5,
+        None,
+    ]
+
+
+def test_page_sessions_fit_footer_within_page_size():
+    sessions = PageSessions(page_size=200, ttl=60)
+    page = sessions.start("s", lines(100))
+    assert page is not None and "metrics next" in page
+    number = 1
+    while page is not None:
+        assert len(page) <= 200
+        number += 1
+        page = sessions.next("s")
+    assert number > 2
+    assert sessions.goto("s", 1).startswith("00000000")
+    assert sessions.goto("s", 1000) is None
+
+
+def test_page_sessions_single_page_has_no_footer():
+    sessions = PageSessions(page_size=200, ttl=60)
+    assert sessions.start("s", ["hello\n"]) == "hello"
+    assert sessions.next("s") is None
+
+
+def test_page_sessions_expire():
+    sessions = PageSessions(page_size=100, ttl=-1)
+    sessions.start("s", lines(100))
+    assert sessions.goto("s", 2) is None
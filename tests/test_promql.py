@@ -0,0 +1,125 @@
+import pytest
+from prometheus_client import Counter, Histogram
+
+from nonebot_plugin_prometheus import promql
+from nonebot_plugin_prometheus.promql import (
+    Aggregation,
+    Call,
+    NumberLiteral,
+    PromQLError,
+    Selector,
+    parse,
+)
+
+requests_counter = Counter(
+    "test_promql_requests", "Requests for PromQL tests", ["bot_id", "status"]
+)
+requests_counter.labels("1", "OK").inc(3)
+requests_counter.labels("1", "Error").inc(1)
+requests_counter.labels("2", "OK").inc(5)
+
+latency_histogram = Histogram(
+    "test_promql_latency_seconds",
+    "Latency for PromQL tests",
+    ["bot_id"],
+    buckets=(0.1, 1.0),
+)
+for value in (0.05, 0.05, 0.5, 0.5):
+    latency_histogram.labels("1").observe(value)
+
+
+def values(query: str):
+    return {
+        tuple((k, v) for k, v in labels if k != "__name__"): value
+        for labels, value in promql.query(query)
+    }
+
+
+def test_parse_selector():
+    node = parse('test_promql_requests{bot_id="1", status!~"E.*"}[5m]')
+    assert isinstance(node, Selector)
+    assert node.name == "test_promql_requests"
+    assert [(m.name, m.op, m.value) for m in node.matchers] == [
+        ("bot_id", "=", "1"),
+        ("status", "!~", "E.*"),
+    ]
+    assert node.range == 300
+
+
+def test_parse_aggregation_and_call():
+    node = parse("SUM BY (bot_id) (rate(x[1m]))")
+    assert isinstance(node, Aggregation)
+    assert (node.op, node.by) == ("sum", ["bot_id"])
+    assert isinstance(node.expr, Call)
+    assert node.expr.func == "rate"
+
+    node = parse("topk(2, x) by (status)")
+    assert isinstance(node, Aggregation)
+    assert (node.op, node.param, node.by) == ("topk", 2.0, ["status"])
+
+    node = parse("histogram_quantile(0.9, x)")
+    assert isinstance(node.args[0], NumberLiteral)
+
+
+def test_parse_unescapes_strings():
+    node = parse(r'x{a="q\"uote", b=' + "'single'}")
+    assert [m.value for m in node.matchers] == ['q"uote', "single"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "",
+        "x{",
+        'x{a~"1"}',
+        "x{a=1 b=2",
+        "sum(x",
+        "x y",
+        "{}",
+        "x[bogus]",
+        'x{a=~"("}',
+        "topk(x, y)",
+    ],
+)
+def test_parse_errors(query: str):
+    with pytest.raises(PromQLError):
+        parse(query)
+
+
+def test_evaluate_selector_is_case_sensitive():
+    assert values('test_promql_requests{status="OK"}') == {
+        (("bot_id", "1"), ("status", "OK")): 3.0,
+        (("bot_id", "2"), ("status", "OK")): 5.0,
+    }
+    assert values('test_promql_requests{status="ok"}') == {}
+
+
+def test_evaluate_regex_and_negative_matchers():
+    assert values('test_promql_requests{status=~"E.*"}') == {
+        (("bot_id", "1"), ("status", "Error")): 1.0
+    }
+    assert values('test_promql_requests{bot_id!="1"}') == {
+        (("bot_id", "2"), ("status", "OK")): 5.0
+    }
+
+
+def test_evaluate_aggregations():
+    assert values("sum by (bot_id) (test_promql_requests)") == {
+        (("bot_id", "1"),): 4.0,
+        (("bot_id", "2"),): 5.0,
+    }
+    assert values("count(test_promql_requests)") == {(): 3.0}
+    assert values("max(test_promql_requests)") == {(): 5.0}
+    assert list(values("topk(1, test_promql_requests)").values()) == [5.0]
+
+
+def test_evaluate_histogram_quantile():
+    result = values("histogram_quantile(0.5, test_promql_latency_seconds_bucket)")
+    assert result == {(("bot_id", "1"),): pytest.approx(0.1)}
+
+
+def test_evaluate_rejects_bare_range_selector():
+    with pytest.raises(PromQLError):
+        promql.query("test_promql_requests[5m]")
+    with pytest.raises(PromQLError):
+        promql.query("unknown_function(test_promql_requests)")
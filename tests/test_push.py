@@ -0,0 +1,135 @@
+import asyncio
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+import pytest
+from prometheus_client import Counter
+
+from nonebot_plugin_prometheus.push import PushExporter, build_push_url
+
+push_test_counter = Counter("test_push_events", "Events for push tests", ["kind"])
+push_test_counter.labels("a").inc()
+
+
+class Receiver(BaseHTTPRequestHandler):
+    """记录收到的请求，按 statuses 依次返回状态码，用完后返回 200"""
+
+    requests: List[Tuple[str, str, dict, bytes]] = []
+    statuses: List[int] = []
+
+    def _handle(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.requests.append((self.command, self.path, dict(self.headers), body))
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_PUT = do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def receiver():
+    Receiver.requests = []
+    Receiver.statuses = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def make_exporter(base_url: str, **kwargs) -> PushExporter:
+    options = dict(
+        interval=1.0,
+        full_interval=300.0,
+        batch_bytes=512 * 1024,
+        timeout=5.0,
+        retries=2,
+        backoff=0.01,
+        compress=True,
+        headers={"Authorization": "Basic dGVzdA=="},
+    )
+    options.update(kwargs)
+    return PushExporter(
+        build_push_url(base_url, "nonebot", {"instance": "bot-1"}), **options
+    )
+
+
+def test_build_push_url_escapes_labels():
+    assert (
+        build_push_url("http://gw:9091/", "my job", {"path": "/a/b", "empty": ""})
+        == "http://gw:9091/metrics/job/my%20job/path@base64/L2EvYg==/empty@base64/="
+    )
+
+
+def test_prepare_full_splits_batches(receiver):
+    exporter = make_exporter(receiver, batch_bytes=2048)
+    batches = exporter.prepare(full=True)
+    assert len(batches) > 1
+    assert batches[0].method == "PUT"
+    assert all(batch.method == "POST" for batch in batches[1:])
+    families = [name for batch in batches for name in batch.digests]
+    assert len(families) == len(set(families))
+    assert "test_push_events" in families
+    for batch in batches:
+        # 只有单个指标族超过上限时才会超出
+        assert len(batch.body) <= 2048 or len(batch.digests) == 1
+
+
+def test_prepare_incremental_sends_only_changed_families(receiver):
+    exporter = make_exporter(receiver)
+    asyncio.run(exporter.push(full=True))
+    # 推送计数器自身会变化，其余指标族不变
+    push_test_counter.labels("b").inc()
+    batches = exporter.prepare(full=False)
+    changed = {name for batch in batches for name in batch.digests}
+    assert "test_push_events" in changed
+    assert "nonebot_bot_nums" not in changed
+    assert all(batch.method == "POST" for batch in batches)
+
+
+def test_push_sends_to_grouping_url(receiver):
+    exporter = make_exporter(receiver)
+    asyncio.run(exporter.push())
+    method, path, headers, body = Receiver.requests[0]
+    assert method == "PUT"
+    assert path == "/metrics/job/nonebot/instance/bot-1"
+    assert headers["Authorization"] == "Basic dGVzdA=="
+    assert headers["Content-Encoding"] == "gzip"
+    assert b'test_push_events_total{kind="a"} 1.0' in body
+
+    # 全量推送间隔内的下一次推送是增量推送
+    Receiver.requests.clear()
+    push_test_counter.labels("a").inc()
+    asyncio.run(exporter.push())
+    assert {method for method, *_ in Receiver.requests} == {"POST"}
+    assert any(b"test_push_events_total" in body for *_, body in Receiver.requests)
+
+
+def test_push_retries_server_errors(receiver):
+    exporter = make_exporter(receiver, compress=False)
+    Receiver.statuses = [503, 500]
+    asyncio.run(exporter.push(full=True))
+    assert [method for method, *_ in Receiver.requests[:3]] == ["PUT"] * 3
+    assert exporter._last_full is not None
+
+
+def test_push_does_not_retry_client_errors(receiver):
+    exporter = make_exporter(receiver, batch_bytes=1)
+    Receiver.statuses = [400]
+    asyncio.run(exporter.push(full=True))
+    # 第一批被拒绝后停止本次推送，下次仍然全量推送
+    assert len(Receiver.requests) == 1
+    assert exporter._last_full is None
+    assert exporter._pushed == {}
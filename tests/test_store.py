@@ -0,0 +1,115 @@
+from pathlib import Path
+
+from nonebot_plugin_prometheus.store import MetricStore, StoreTier
+
+KEY_A = ("x_total", (("bot_id", "1"),))
+KEY_B = ("x_total", (("bot_id", "用户"),))
+
+
+def test_tier_keeps_last_value_per_interval(tmp_path: Path):
+    tier = StoreTier(tmp_path / "tier.bin", 10, 3600, 1 << 20)
+    assert not tier.observe(1000, {KEY_A: 1.0})
+    assert not tier.observe(1005, {KEY_A: 2.0})
+    assert tier.observe(1010, {KEY_A: 3.0})
+    tier.write()
+
+    # 当前区间尚未写入文件，查询时也能看到
+    assert tier.query("x_total", 0, 2000) == {KEY_A[1]: [(1005, 2.0), (1010, 3.0)]}
+
+
+def test_tier_round_trip_through_file(tmp_path: Path):
+    path = tmp_path / "tier.bin"
+    tier = StoreTier(path, 10, 3600, 1 << 20)
+    for i in range(5):
+        tier.observe(1000 + i * 10, {KEY_A: float(i), KEY_B: float(i * 2)})
+        tier.write()
+    tier.flush()
+
+    reopened = StoreTier(path, 10, 3600, 1 << 20)
+    result = reopened.query("x_total", 0, 2000)
+    assert result[KEY_A[1]] == [(1000 + i * 10, float(i)) for i in range(5)]
+    assert result[KEY_B[1]] == [(1000 + i * 10, float(i * 2)) for i in range(5)]
+    assert reopened.query("x_total", 1015, 1025) == {
+        KEY_A[1]: [(1020, 2.0)],
+        KEY_B[1]: [(1020, 4.0)],
+    }
+    assert reopened.query("y_total", 0, 2000) == {}
+
+
+def test_tier_ignores_truncated_tail(tmp_path: Path):
+    path = tmp_path / "tier.bin"
+    tier = StoreTier(path, 10, 3600, 1 << 20)
+    tier.observe(1000, {KEY_A: 1.0})
+    tier.observe(1010, {KEY_A: 2.0})
+    tier.flush()
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+
+    reopened = StoreTier(path, 10, 3600, 1 << 20)
+    assert reopened.query("x_total", 0, 2000) == {KEY_A[1]: [(1000, 1.0)]}
+
+
+def test_tier_drops_data_beyond_retention(tmp_path: Path):
+    tier = StoreTier(tmp_path / "tier.bin", 10, 100, 1 << 20)
+    for i in range(30):
+        tier.observe(i * 10, {KEY_A: float(i)})
+        tier.write()
+    tier.flush()
+    timestamps = [ts for ts, _ in tier.query("x_total", 0, 1000)[KEY_A[1]]]
+    assert timestamps[-1] == 290
+    assert timestamps[0] >= 290 - 100 * 1.25
+
+
+def test_tier_respects_max_bytes(tmp_path: Path):
+    path = tmp_path / "tier.bin"
+    tier = StoreTier(path, 1, 86400, 1024)
+    for i in range(500):
+        tier.observe(i, {KEY_A: float(i)})
+        tier.write()
+    tier.flush()
+    assert path.stat().st_size <= 1024
+    assert tier.query("x_total", 0, 1000)[KEY_A[1]][-1] == (499, 499.0)
+
+
+def test_store_selects_tier_and_flushes_on_close(tmp_path: Path):
+    store = MetricStore(tmp_path, [(60, 86400), (10, 3600)], 1 << 20)
+    for i in range(20):
+        store.observe(1000 + i * 10, {KEY_A: float(i)})
+    store.close().result()
+
+    assert store.select(600).resolution == 10
+    assert store.select(7200).resolution == 60
+    assert store.select(10**9).resolution == 60
+    resolution, series = store.query("x_total", 1000, 1000 + 600)
+    assert resolution == 10
+    assert series[KEY_A[1]][-1] == (1190, 19.0)
+
+
+def test_tier_keeps_buckets_when_write_fails(tmp_path: Path, monkeypatch):
+    path = tmp_path / "tier.bin"
+    tier = StoreTier(path, 10, 3600, 1 << 20)
+    tier.observe(1000, {KEY_A: 1.0})
+    tier.observe(1010, {KEY_A: 2.0, KEY_B: 20.0})
+    tier.write()
+
+    real_open = Path.open
+
+    def failing_open(self, mode="r", *args, **kwargs):
+        if self == path and "a" in mode:
+            raise OSError("磁盘已满")
+        return real_open(self, mode, *args, **kwargs)
+
+    # 写入失败的数据块包含新序列 KEY_B 的定义，应保留到下次写入
+    monkeypatch.setattr(Path, "open", failing_open)
+    tier.observe(1020, {KEY_A: 3.0})
+    tier.write()
+    assert tier.query("x_total", 0, 2000)[KEY_B[1]] == [(1010, 20.0)]
+    monkeypatch.undo()
+
+    tier.observe(1030, {KEY_B: 40.0})
+    tier.write()
+    tier.flush()
+    reopened = StoreTier(path, 10, 3600, 1 << 20)
+    result = reopened.query("x_total", 0, 2000)
+    assert result[KEY_A[1]] == [(1000, 1.0), (1010, 2.0), (1020, 3.0)]
+    assert result[KEY_B[1]] == [(1010, 20.0), (1030, 40.0)]
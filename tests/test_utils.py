@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+import pytest
+
+from nonebot_plugin_prometheus.utils import SingleFlightCache
+
+
+def test_concurrent_callers_share_one_computation():
+    cache: SingleFlightCache[int] = SingleFlightCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get("k", compute)))
+    owner.start()
+    assert started.wait(5)
+    future, is_owner = cache.acquire("k")
+    assert not is_owner
+    release.set()
+    owner.join(5)
+    assert future.result(5) == 42
+    assert results == [42]
+    assert len(calls) == 1
+
+
+def test_ttl_reuses_value_until_cleared():
+    cache: SingleFlightCache[int] = SingleFlightCache(ttl=60)
+    values = iter(range(10))
+    assert cache.get("k", lambda: next(values)) == 0
+    assert cache.get("k", lambda: next(values)) == 0
+    assert cache.get("other", lambda: next(values)) == 1
+    cache.clear()
+    assert cache.get("k", lambda: next(values)) == 2
+
+
+def test_without_ttl_recomputes_and_propagates_errors():
+    cache: SingleFlightCache[int] = SingleFlightCache()
+    values = iter(range(10))
+    assert cache.get("k", lambda: next(values)) == 0
+    assert cache.get("k", lambda: next(values)) == 1
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get("k", fail)
+    # 失败后不会留下进行中的计算
+    assert cache.get("k", lambda: next(values)) == 2
+
+
+def test_aget_in_thread():
+    cache: SingleFlightCache[int] = SingleFlightCache()
+    assert asyncio.run(cache.aget("k", lambda: 7, in_thread=True)) == 7
+
+
+def test_aget_merges_concurrent_callers_without_ttl():
+    cache: SingleFlightCache[int] = SingleFlightCache(0)
+    calls = []
+
+    def compute() -> int:
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return await asyncio.gather(*(cache.aget("k", compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == [1] * 5
+    assert len(calls) == 1
+    # 没有缓存时间，计算完成后的请求重新计算
+    assert asyncio.run(cache.aget("k", compute)) == 2